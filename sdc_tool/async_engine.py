@@ -0,0 +1,52 @@
+import asyncio
+import contextlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncCollectionEngine:
+    """Runs collection coroutines from many windows and pipelines on one event loop.
+
+    The loop lives in its own thread; ``submit`` can be called from any thread and
+    returns a ``concurrent.futures.Future``, so the pipelines keep their thread-based
+    sink stage. Waiting on a remote search costs no thread; only the short blocking
+    HTTP calls run on the ``io_threads`` executor. ``limit`` caps how many searches are
+    open at once against each vendor quota (QRadar console, Cortex XDR tenant).
+    """
+
+    def __init__(self, io_threads=4):
+        self.io_threads = max(1, int(io_threads))
+        self._executor = ThreadPoolExecutor(max_workers=self.io_threads, thread_name_prefix="sdc-io")
+        self._loop = asyncio.new_event_loop()
+        self._loop.set_default_executor(self._executor)
+        self._semaphores = {}
+        self._thread = threading.Thread(target=self._run_loop, name="sdc-event-loop", daemon=True)
+        self._thread.start()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_forever()
+
+    def submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    @contextlib.asynccontextmanager
+    async def limit(self, key, max_concurrent):
+        # Only touched from the loop thread, so the dict needs no lock
+        semaphore = self._semaphores.get(key)
+        if semaphore is None:
+            semaphore = self._semaphores[key] = asyncio.Semaphore(max(1, int(max_concurrent)))
+            logger.info(f"Limiting {key} to {max(1, int(max_concurrent))} concurrent searches.")
+        async with semaphore:
+            yield
+
+    def close(self):
+        if self._loop.is_closed():
+            return
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._executor.shutdown(wait=True)
@@ -1,12 +1,165 @@
-
 import abc
+import gzip
+import logging
+from datetime import datetime
+
+from sdc_tool.compression import codec_from_config
+from sdc_tool.output_commit import WindowCommit, delete_manifests_before
+from sdc_tool.parquet_writer import RollingParquetWriter, require_pyarrow
+from sdc_tool.partitioning import Partitioner
+from sdc_tool.payload import FilePayload
+from sdc_tool.rolling_writer import RollingGzipWriter
+
+logger = logging.getLogger(__name__)
+
+OUTPUT_FORMATS = {"json_gz": ".json", "parquet": ".parquet"}
+
+
+def _epoch_ms(timestamp):
+    if isinstance(timestamp, datetime):
+        return int(timestamp.timestamp() * 1000)
+    return int(timestamp)
+
 
 class BaseSink(abc.ABC):
-    def __init__(self, config):
+    # Per-file limits of the sink's output; 0 means no limit
+    max_records_per_file = 0
+    max_file_size_mb = 0
+
+    def __init__(self, config, pipeline_name=None):
         self.config = config
+        # Output files are named <prefix>_<pipeline>_<start_ms>_<end_ms>_partNNNN, see WindowCommit
+        self.pipeline_name = pipeline_name
+        self.file_prefix = self.config.get("General.output_file_prefix", "data")
+        # Output roots this sink wrote window manifests to, for prune_manifests
+        self._manifest_roots = set()
+        self.output_format = (self.config.get("General.output_format", "json_gz") or "json_gz").strip().lower()
+        if self.output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unsupported output_format: {self.output_format}. Expected one of {', '.join(OUTPUT_FORMATS)}.")
+        if self.output_format == "parquet":
+            require_pyarrow()
+        # NDJSON output is compressed with compression_codec (gzip by default), Parquet compresses by column
+        self.codec = codec_from_config(config)
+        self.partitioner = Partitioner.from_config(config, codec=self.codec)
+        self.file_extension = OUTPUT_FORMATS[self.output_format]
+        if self.output_format == "json_gz":
+            self.file_extension += self.codec.extension
+
+    @abc.abstractmethod
+    def _output_fs(self):
+        """Filesystem (``LocalFileSystem`` or ``WebHDFSFileSystem``) the window commit publishes on."""
+
+    @abc.abstractmethod
+    def _output_root(self, source_identifier, input_type):
+        """Directory holding the partitions (and the window manifests) of a source and input type."""
 
     @abc.abstractmethod
-    def write_data(self, data, source_identifier, input_type):
-        pass
+    def _write_item(self, data, source_identifier, input_type, window_start, stager):
+        """Writes one item to the temporary paths handed out by ``stager.new_paths(output_dir, extension)``."""
+
+    def _record_writer(self, open_file, max_records, max_bytes):
+        """Rolling writer for ``output_format``; both take records and produce files of bounded size."""
+        if self.output_format == "parquet":
+            return RollingParquetWriter(
+                open_file, max_records=max_records, max_bytes=max_bytes,
+                row_group_size=self.config.getint("General.parquet_row_group_size", 100000),
+                compression=self.config.get("General.parquet_compression", "snappy"),
+            )
+        return RollingGzipWriter(open_file, max_records=max_records, max_bytes=max_bytes, codec=self.codec)
+
+    def _passthrough(self, data):
+        """True if ``data`` is already in the output format and can be stored as is."""
+        if self.output_format != "json_gz":
+            return False
+        if isinstance(data, FilePayload):
+            return data.codec == self.codec.name
+        return isinstance(data, bytes) and self.codec.name == "gzip"
+
+    def _within_limits(self, payload):
+        """True if ``payload`` fits in one output file under ``max_records_per_file`` and ``max_file_size_mb``."""
+        return ((not self.max_records_per_file or payload.record_count <= self.max_records_per_file) and
+                (not self.max_file_size_mb or payload.size_bytes <= self.max_file_size_mb * 1024 * 1024))
+
+    @staticmethod
+    def _records(data):
+        if isinstance(data, FilePayload):
+            return data.iter_records()
+        if isinstance(data, bytes):
+            return (line for line in gzip.decompress(data).splitlines() if line.strip())
+        return data
+
+    @staticmethod
+    def _item_bounds(start_ms, end_ms, items):
+        """Bounds of the sub-window each item was collected for, from its window start to the next item's."""
+        if len(items) == 1:
+            return [(start_ms, end_ms)]
+        starts = [_epoch_ms(item[3]) if len(item) > 3 and item[3] is not None else None for item in items]
+        if None in starts or starts != sorted(set(starts)):
+            raise ValueError("Items of a window need distinct window starts in time order to be named deterministically")
+        return list(zip(starts, starts[1:] + [end_ms]))
+
+    def write_window(self, start_ms, end_ms, items, replaces=()):
+        """Writes the ``(data, source_identifier, input_type[, window_start])`` items collected for the
+        window ``start_ms`` - ``end_ms`` (epoch milliseconds) and publishes their files together.
+
+        Writing the same window again replaces its files, so retries and replays are idempotent.
+        ``replaces`` are the starts of windows merged into this one by a re-plan, whose files
+        this window replaces as well.
+        """
+        items = [item for item in items if item[0]]
+        if not items:
+            logger.info(f"No data to write for window {start_ms} - {end_ms}.")
+            return
+        commit, staged = self._stage_window(start_ms, end_ms, items, replaces)
+        try:
+            self._write_staged(staged)
+            published = commit.commit()
+        except Exception:
+            commit.abort()
+            raise
+        logger.info(f"Published {published} files for window {start_ms} - {end_ms}.")
+
+    def _stage_window(self, start_ms, end_ms, items, replaces=()):
+        """The ``WindowCommit`` of a window and its items, each with the stager that names its files."""
+        commit = WindowCommit(self._output_fs(), start_ms, end_ms, pipeline=self.pipeline_name, prefix=self.file_prefix,
+                              replaces=replaces)
+        staged = []
+        for (data, source_identifier, input_type, *rest), (item_start_ms, item_end_ms) in zip(
+                items, self._item_bounds(start_ms, end_ms, items)):
+            root = self._output_root(source_identifier, input_type)
+            self._manifest_roots.add(root)
+            stager = commit.stager(root, item_start_ms, item_end_ms)
+            staged.append((data, source_identifier, input_type, rest[0] if rest else None, stager))
+        return commit, staged
+
+    def _write_staged(self, staged):
+        for item in staged:
+            self._write_item(*item)
+
+    def write_data(self, data, source_identifier, input_type, window_start=None):
+        """Writes one item as a window of its own, bounded by ``window_start`` (or the payload's times)."""
+        if not data:
+            logger.info("No data to write.")
+            return
+        start_ms, end_ms, window_start = self._data_window(data, window_start)
+        self.write_window(start_ms, end_ms, [(data, source_identifier, input_type, window_start)])
+
+    def _data_window(self, data, window_start=None):
+        """``(start_ms, end_ms, window_start)`` of the window an item written on its own covers."""
+        window_start = self.partitioner.window_start(data, window_start)
+        end_time = getattr(data, "end_time", None)
+        start_ms = _epoch_ms(window_start)
+        return start_ms, _epoch_ms(end_time) if end_time is not None else start_ms, window_start
 
+    def write_many(self, items):
+        """Writes several ``(data, source_identifier, input_type[, window_start])`` items, each as its own window."""
+        for item in items:
+            self.write_data(*item)
 
+    def prune_manifests(self, before_ms):
+        """Deletes the manifests of windows that started before ``before_ms`` from the roots this sink wrote to."""
+        deleted = sum(delete_manifests_before(self._output_fs(), root, self.file_prefix, self.pipeline_name, before_ms)
+                      for root in sorted(self._manifest_roots))
+        if deleted:
+            logger.info(f"Deleted {deleted} window manifests older than {before_ms}.")
+        return deleted
@@ -1,11 +1,38 @@
 import abc
+import asyncio
+
+
+class WindowOverflowError(Exception):
+    """Raised when a time window holds at least ``max_events_per_window`` events.
+
+    The result would be truncated, so the caller should split the window and
+    collect the halves instead.
+    """
+
+    def __init__(self, record_count, max_events):
+        super().__init__(f"Window holds {record_count} events, limit is {max_events}")
+        self.record_count = record_count
+        self.max_events = max_events
+
 
 class BaseSource(abc.ABC):
     def __init__(self, config):
         self.config = config
+        # Ngưỡng số event tối đa cho một block thời gian; 0 để tắt
+        self.max_events_per_window = self.config.getint("General.max_events_per_window", 100000)
+        # Searches sharing a quota key (one per console/tenant) are limited together by the async engine
+        self.search_quota_key = type(self).__name__
+        self.max_concurrent_searches = 1
 
     @abc.abstractmethod
     def collect_data(self, start_time, end_time):
         pass
 
+    async def collect_data_async(self, start_time, end_time):
+        """Asynchronous variant of ``collect_data``.
 
+        Sources that can wait on a remote search without holding a thread override this;
+        the default runs ``collect_data`` in the event loop's executor.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.collect_data, start_time, end_time)
@@ -0,0 +1,338 @@
+import logging
+import os
+import re
+import shutil
+from datetime import datetime, timedelta
+
+from sdc_tool.compression import CODECS
+
+logger = logging.getLogger(__name__)
+
+COMPACTED_PREFIX = "compacted_"
+_CHUNK_SIZE = 1024 * 1024
+# NDJSON files of every codec; gzip members, zstd frames and lz4 frames all concatenate
+EXTENSIONS = tuple(f".json{codec.extension}" for codec in CODECS.values())
+
+
+def _hidden(name):
+    # Same convention as Hive/Spark: "_" and "." entries are not data
+    return name.startswith("_") or name.startswith(".")
+
+
+def _extension(name):
+    return next((extension for extension in EXTENSIONS if name.endswith(extension)), None)
+
+
+class LocalFileSystem:
+    """Filesystem operations the compactor and the sinks' window commits need, on the local disk."""
+
+    def walk(self, root):
+        for dir_path, dir_names, file_names in os.walk(root):
+            dir_names[:] = sorted(d for d in dir_names if not _hidden(d))
+            yield dir_path, {name: os.path.getsize(os.path.join(dir_path, name)) for name in file_names}
+
+    def list_files(self, dir_path):
+        return sorted(name for name in os.listdir(dir_path) if os.path.isfile(os.path.join(dir_path, name)))
+
+    def exists(self, path):
+        return os.path.exists(path)
+
+    def makedirs(self, path):
+        os.makedirs(path, exist_ok=True)
+
+    def rename(self, src_path, dst_path):
+        os.rename(src_path, dst_path)
+
+    def replace(self, src_path, dst_path):
+        os.replace(src_path, dst_path)
+
+    def delete(self, path):
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        elif os.path.exists(path):
+            os.remove(path)
+
+    def remove_empty_dir(self, path):
+        try:
+            os.rmdir(path)
+        except OSError:
+            pass
+
+    def read_text(self, path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def write_text(self, path, text):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def concat(self, dst_path, src_paths):
+        with open(dst_path, "wb") as out:
+            for src_path in src_paths:
+                with open(src_path, "rb") as src:
+                    shutil.copyfileobj(src, out, _CHUNK_SIZE)
+
+
+class WebHDFSFileSystem:
+    """Filesystem operations the compactor and the sinks' window commits need, over a WebHDFS client."""
+
+    def __init__(self, client):
+        self.client = client
+
+    def walk(self, root):
+        for (dir_path, _), dirs, files in self.client.walk(root, status=True, ignore_missing=True,
+                                                            allow_dir_changes=True):
+            dirs[:] = sorted((d for d in dirs if not _hidden(d[0])), key=lambda d: d[0])
+            yield dir_path, {name: status["length"] for name, status in files}
+
+    def list_files(self, dir_path):
+        return sorted(name for name, status in self.client.list(dir_path, status=True) if status["type"] == "FILE")
+
+    def exists(self, path):
+        return self.client.status(path, strict=False) is not None
+
+    def makedirs(self, path):
+        self.client.makedirs(path)
+
+    def rename(self, src_path, dst_path):
+        self.client.rename(src_path, dst_path)
+
+    def replace(self, src_path, dst_path):
+        # WebHDFS rename does not overwrite; the file of an earlier attempt is dropped first
+        self.client.delete(dst_path)
+        self.client.rename(src_path, dst_path)
+
+    def delete(self, path):
+        self.client.delete(path, recursive=True)
+
+    def remove_empty_dir(self, path):
+        # "_temporary" is reused by the next window and skipped by readers; not worth a round trip
+        pass
+
+    def read_text(self, path):
+        if self.client.status(path, strict=False) is None:
+            return None
+        with self.client.read(path, encoding="utf-8") as reader:
+            return reader.read()
+
+    def write_text(self, path, text):
+        self.client.write(path, data=text, encoding="utf-8", overwrite=True)
+
+    def concat(self, dst_path, src_paths):
+        def chunks():
+            for src_path in src_paths:
+                with self.client.read(src_path, chunk_size=_CHUNK_SIZE) as reader:
+                    yield from reader
+        # Streamed: each source is read and uploaded chunk by chunk, never held in memory
+        self.client.write(dst_path, data=chunks(), overwrite=True)
+
+
+def partition_end(relative_path):
+    """End of the time range a partition directory covers, or None if it is not a time partition.
+
+    Understands ``yyyyMMdd`` and Hive style ``dt=yyyyMMdd[/hr=HH]`` components.
+    """
+    day, hour = None, None
+    for part in relative_path.replace("\\", "/").split("/"):
+        match = re.fullmatch(r"(?:dt=)?(\d{8})", part)
+        if match:
+            day = datetime.strptime(match.group(1), "%Y%m%d")
+            continue
+        match = re.fullmatch(r"hr=(\d{2})", part)
+        if match:
+            hour = int(match.group(1))
+    if day is None:
+        return None
+    if hour is None:
+        return day + timedelta(days=1)
+    return day + timedelta(hours=hour + 1)
+
+
+class Compactor:
+    """Merges the small NDJSON files of closed partitions into files near ``target_file_size_mb``.
+
+    gzip members (and zstd or lz4 frames) can be concatenated into one valid stream, so
+    files are merged by copying bytes, without decompressing or recompressing; only files
+    of the same codec are merged together, and the merged file keeps their extension. A partition is compacted only
+    once it is closed (its time range ended ``grace_minutes`` ago). The merged files are
+    written to a hidden staging directory next to the partition and swapped in with
+    directory renames, so readers never see a half-written file or the same events twice.
+    Progress is recorded in the state store, so an interrupted swap is completed on the
+    next run and a partition is not merged again unless new files arrive.
+    """
+
+    def __init__(self, fs, roots, state_store, target_file_size_mb=256, grace_minutes=60, state_key="compaction"):
+        self.fs = fs
+        self.roots = [root for root in roots if root]
+        self.state_store = state_store
+        self.target_bytes = max(1, int(target_file_size_mb)) * 1024 * 1024
+        self.grace = timedelta(minutes=grace_minutes)
+        self.state_key = state_key
+
+    def _state(self):
+        return dict(self.state_store.get(self.state_key) or {})
+
+    def _save(self, partition, entry):
+        state = self._state()
+        if entry is None:
+            state.pop(partition, None)
+        else:
+            state[partition] = entry
+        self.state_store.set(self.state_key, state)
+
+    @staticmethod
+    def _staging_paths(partition):
+        parent, name = os.path.split(partition.rstrip("/"))
+        return os.path.join(parent, f"_compacting_{name}"), os.path.join(parent, f"_old_{name}")
+
+    def find_partitions(self, now=None):
+        now = now or datetime.now()
+        state = self._state()
+        partitions = []
+        for root in self.roots:
+            if not self.fs.exists(root):
+                continue
+            for dir_path, files in self.fs.walk(root):
+                end = partition_end(os.path.relpath(dir_path, root))
+                if end is None or end + self.grace > now:
+                    continue
+                inputs = sorted(name for name, size in files.items()
+                                if _extension(name) and not _hidden(name) and size < self.target_bytes)
+                # Already merged by an earlier run and nothing new arrived since
+                if set(inputs) <= set(state.get(dir_path, {}).get("outputs", [])):
+                    continue
+                # A file is only merged with files of the same codec
+                extensions = [_extension(name) for name in inputs]
+                inputs = [name for name, extension in zip(inputs, extensions) if extensions.count(extension) > 1]
+                if inputs:
+                    partitions.append((dir_path, [(name, files[name]) for name in inputs]))
+        return partitions
+
+    def _plan(self, inputs):
+        bins = []
+        for extension in EXTENSIONS:
+            current, current_size = [], 0
+            for name, size in inputs:
+                if _extension(name) != extension:
+                    continue
+                if current and current_size + size > self.target_bytes:
+                    bins.append(current)
+                    current, current_size = [], 0
+                current.append(name)
+                current_size += size
+            if current:
+                bins.append(current)
+        return bins
+
+    def compact_partition(self, partition, inputs):
+        staging, old = self._staging_paths(partition)
+        if self.fs.exists(staging):
+            self.fs.delete(staging)
+        self.fs.makedirs(staging)
+
+        stamp = datetime.now().strftime("%Y%m%d%H%M%S")
+        outputs = []
+        for i, names in enumerate(self._plan(inputs)):
+            output = f"{COMPACTED_PREFIX}{stamp}_{i:04d}{_extension(names[0])}"
+            self.fs.concat(os.path.join(staging, output), [os.path.join(partition, name) for name in names])
+            outputs.append(output)
+
+        merged = [name for name, _ in inputs]
+        self._save(partition, {"status": "swapping", "inputs": merged, "outputs": outputs})
+        # Large files and anything else not merged go along, so one rename publishes the complete partition
+        for name in self.fs.list_files(partition):
+            if name not in merged:
+                self.fs.rename(os.path.join(partition, name), os.path.join(staging, name))
+        self.fs.rename(partition, old)
+        self._complete_swap(partition)
+        logger.info(f"Compacted {len(inputs)} files in {partition} into {len(outputs)} files.")
+        return len(outputs)
+
+    def _move_files(self, src_dir, dst_dir):
+        self.fs.makedirs(dst_dir)
+        for name in self.fs.list_files(src_dir):
+            self.fs.rename(os.path.join(src_dir, name), os.path.join(dst_dir, name))
+        self.fs.delete(src_dir)
+
+    def _complete_swap(self, partition):
+        """Puts the staged files (merged and not merged) in place, then finishes the swap.
+
+        A late write can recreate the partition after it was moved aside. The staged
+        files are then moved into it one by one (a directory rename would fail locally
+        and nest the staging directory on WebHDFS). The old directory, which still holds
+        the merged inputs, is only dropped once every merged file is in the partition.
+        """
+        staging, old = self._staging_paths(partition)
+        outputs = self._state().get(partition, {}).get("outputs", [])
+        if self.fs.exists(staging):
+            moved = False
+            if not self.fs.exists(partition):
+                try:
+                    self.fs.rename(staging, partition)
+                    moved = True
+                except Exception as e:
+                    logger.warning(f"{partition} was recreated during compaction ({e}). Moving merged files one by one.")
+            if not moved:
+                self._move_files(staging, partition)
+            nested = os.path.join(partition, os.path.basename(staging))
+            if self.fs.exists(nested):
+                # WebHDFS renames into a directory that appeared after the check instead of failing
+                self._move_files(nested, partition)
+        missing = [name for name in outputs if not self.fs.exists(os.path.join(partition, name))]
+        if missing:
+            raise RuntimeError(f"Merged files {missing} are not in {partition}; keeping {old}.")
+        self._finish_swap(partition)
+
+    def _finish_swap(self, partition):
+        """Moves files that arrived during the swap into the partition and drops the old directory."""
+        staging, old = self._staging_paths(partition)
+        entry = self._state().get(partition, {})
+        merged = set(entry.get("inputs", []))
+        if self.fs.exists(old):
+            for name in self.fs.list_files(old):
+                if name not in merged:
+                    # Written after the files that were not merged had been staged
+                    self.fs.rename(os.path.join(old, name), os.path.join(partition, name))
+            self.fs.delete(old)
+        self._save(partition, {"status": "done", "outputs": entry.get("outputs", []),
+                               "compacted_at": datetime.now().isoformat()})
+
+    def _recover(self):
+        for partition, entry in self._state().items():
+            if entry.get("status") != "swapping":
+                continue
+            staging, old = self._staging_paths(partition)
+            if not self.fs.exists(old):
+                # The swap never started; files already staged that were not merged go back and
+                # the partition will be compacted again
+                if self.fs.exists(staging):
+                    outputs = set(entry.get("outputs", []))
+                    for name in self.fs.list_files(staging):
+                        if name not in outputs:
+                            self.fs.rename(os.path.join(staging, name), os.path.join(partition, name))
+                    self.fs.delete(staging)
+                self._save(partition, None)
+                continue
+            logger.warning(f"Completing interrupted compaction of {partition}.")
+            try:
+                self._complete_swap(partition)
+            except Exception as e:
+                logger.error(f"Error completing compaction of {partition}: {e}")
+
+    def run(self, now=None):
+        """Compacts every closed partition that has more than one small file. Returns how many were compacted."""
+        self._recover()
+        compacted = 0
+        for partition, inputs in self.find_partitions(now):
+            try:
+                self.compact_partition(partition, inputs)
+                compacted += 1
+            except Exception as e:
+                logger.error(f"Error compacting {partition}: {e}")
+        return compacted
@@ -0,0 +1,225 @@
+import abc
+import collections
+import gzip
+import io
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import zstandard
+except ImportError:  # optional: pip install security_data_collector[zstd]
+    zstandard = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:  # optional: pip install security_data_collector[lz4]
+    lz4_frame = None
+
+logger = logging.getLogger(__name__)
+
+BLOCK_SIZE = 1024 * 1024
+
+
+class ParallelBlockWriter(io.BufferedIOBase):
+    """Writable binary stream that compresses fixed-size blocks on a thread pool.
+
+    Every block is compressed into a self-contained gzip member (or zstd/lz4 frame) and
+    the results are written to ``fileobj`` in order, so the output is a standard
+    multi-member stream any reader can decompress. zlib, zstd and lz4 release the GIL,
+    so blocks are compressed on several cores at once. At most ``2 * threads`` blocks
+    are in flight, which bounds memory use.
+    """
+
+    def __init__(self, fileobj, compress_block, threads, block_size=BLOCK_SIZE, closefd=False):
+        super().__init__()
+        self.fileobj = fileobj
+        self.compress_block = compress_block
+        self.threads = max(1, int(threads))
+        self.block_size = block_size
+        self.closefd = closefd
+        self._buffer = bytearray()
+        self._pending = collections.deque()
+        self._executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="sdc-compress")
+
+    def writable(self):
+        return True
+
+    def _write_oldest(self):
+        self.fileobj.write(self._pending.popleft().result())
+
+    def _submit(self, block):
+        self._pending.append(self._executor.submit(self.compress_block, block))
+        while len(self._pending) > 2 * self.threads:
+            self._write_oldest()
+
+    def write(self, data):
+        if self.closed:
+            raise ValueError("write to closed file")
+        self._buffer += data
+        while len(self._buffer) >= self.block_size:
+            self._submit(bytes(self._buffer[:self.block_size]))
+            del self._buffer[:self.block_size]
+        return len(data)
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            if self._buffer:
+                self._submit(bytes(self._buffer))
+                self._buffer.clear()
+            while self._pending:
+                self._write_oldest()
+        finally:
+            for future in self._pending:
+                future.cancel()
+            self._executor.shutdown(wait=True)
+            if self.closefd:
+                self.fileobj.close()
+            super().close()
+
+
+class Codec(abc.ABC):
+    """A compression codec for NDJSON files; ``threads`` > 1 compresses blocks in parallel."""
+
+    name = None
+    extension = None
+    default_level = None
+
+    def __init__(self, level=None, threads=1):
+        self.level = self.default_level if level is None else int(level)
+        self.threads = max(1, int(threads))
+
+    def __repr__(self):
+        return f"{type(self).__name__}(level={self.level}, threads={self.threads})"
+
+    @abc.abstractmethod
+    def compress_block(self, data):
+        """Compresses ``data`` into one self-contained member/frame."""
+
+    @abc.abstractmethod
+    def _stream_writer(self, fileobj):
+        """Single-threaded compressing stream over ``fileobj`` that leaves it open when closed."""
+
+    @abc.abstractmethod
+    def open_reader(self, path):
+        """Binary stream of the decompressed contents of ``path``, across all members/frames."""
+
+    def open_writer(self, fileobj):
+        """Compressing binary stream over ``fileobj``; closing it leaves ``fileobj`` open."""
+        if self.threads > 1:
+            return ParallelBlockWriter(fileobj, self.compress_block, self.threads)
+        return self._stream_writer(fileobj)
+
+    def open(self, path, mode="rb"):
+        """Like ``gzip.open``: ``rb``, ``wb`` or the text modes ``rt``/``wt`` (UTF-8)."""
+        if "r" in mode:
+            stream = self.open_reader(path)
+        else:
+            raw = open(path, "wb")
+            try:
+                stream = ParallelBlockWriter(raw, self.compress_block, self.threads, closefd=True) \
+                    if self.threads > 1 else _Owning(self._stream_writer(raw), raw)
+            except Exception:
+                raw.close()
+                raise
+        return io.TextIOWrapper(stream, encoding="utf-8") if "t" in mode else stream
+
+
+class _Owning(io.BufferedIOBase):
+    """Closes the underlying file after the compressing stream that writes to it."""
+
+    def __init__(self, stream, raw):
+        super().__init__()
+        self.stream = stream
+        self.raw_file = raw
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        return self.stream.write(data)
+
+    def flush(self):
+        if not self.stream.closed:
+            self.stream.flush()
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            self.stream.close()
+        finally:
+            self.raw_file.close()
+            super().close()
+
+
+class GzipCodec(Codec):
+    name = "gzip"
+    extension = ".gz"
+    default_level = 6
+
+    def compress_block(self, data):
+        return gzip.compress(data, compresslevel=self.level, mtime=0)
+
+    def _stream_writer(self, fileobj):
+        return gzip.GzipFile(fileobj=fileobj, mode="wb", compresslevel=self.level)
+
+    def open_reader(self, path):
+        return gzip.open(path, "rb")
+
+
+class ZstdCodec(Codec):
+    name = "zstd"
+    extension = ".zst"
+    default_level = 3
+
+    def compress_block(self, data):
+        # ZstdCompressor objects are not thread safe, so each block gets its own
+        return zstandard.ZstdCompressor(level=self.level).compress(data)
+
+    def _stream_writer(self, fileobj):
+        return zstandard.ZstdCompressor(level=self.level).stream_writer(fileobj, closefd=False)
+
+    def open_reader(self, path):
+        raw = open(path, "rb")
+        reader = zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True, closefd=True)
+        return io.BufferedReader(reader)
+
+
+class Lz4Codec(Codec):
+    name = "lz4"
+    extension = ".lz4"
+    default_level = 0
+
+    def compress_block(self, data):
+        return lz4_frame.compress(data, compression_level=self.level)
+
+    def _stream_writer(self, fileobj):
+        return lz4_frame.LZ4FrameFile(fileobj, mode="wb", compression_level=self.level)
+
+    def open_reader(self, path):
+        return lz4_frame.open(path, "rb")
+
+
+CODECS = {codec.name: codec for codec in (GzipCodec, ZstdCodec, Lz4Codec)}
+_REQUIRES = {"zstd": "zstandard", "lz4": "lz4"}
+
+
+def get_codec(name="gzip", level=None, threads=1):
+    name = (name or "gzip").strip().lower()
+    if name not in CODECS:
+        raise ValueError(f"Unsupported compression_codec: {name}. Expected one of {', '.join(CODECS)}.")
+    if (name == "zstd" and zstandard is None) or (name == "lz4" and lz4_frame is None):
+        raise ImportError(f"compression_codec = {name} requires {_REQUIRES[name]}. "
+                          f"Install it with: pip install security_data_collector[{name}]")
+    return CODECS[name](level=level, threads=threads)
+
+
+def codec_from_config(config):
+    level = (config.get("General.compression_level", "") or "").strip()
+    return get_codec(
+        config.get("General.compression_codec", "gzip"),
+        level=int(level) if level else None,
+        threads=config.getint("General.compression_threads", 1),
+    )
@@ -37,8 +37,19 @@ class ConfigParser:
             raise ValueError("Pipeline section or pipeline definition not found in config.ini")
         pipeline_str = self.config["Pipeline"]["pipeline"]
         source_id, sink_id = [p.strip() for p in pipeline_str.split(">")]
+        # "qradar > hdfs, local_file" fans one source out to several sinks
+        sink_id = ", ".join(s.strip() for s in sink_id.split(",") if s.strip())
         return source_id, sink_id
 
+    def get_sink_identifiers(self):
+        _, sink_id = self.get_pipeline_config()
+        sink_ids = [s.strip() for s in sink_id.split(",") if s.strip()]
+        if not sink_ids:
+            raise ValueError("No sink defined in the pipeline definition")
+        if len(set(sink_ids)) != len(sink_ids):
+            raise ValueError(f"Duplicate sink in pipeline definition: {sink_id}")
+        return sink_ids
+
     def get_section(self, section_name):
         if section_name in self.config:
             return self.config[section_name]
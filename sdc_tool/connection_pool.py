@@ -0,0 +1,45 @@
+import logging
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+
+def create_session(pool_size=10):
+    """A keep-alive session that keeps up to ``pool_size`` connections per host."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, int(pool_size)))
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+class ConnectionPool:
+    """Hands out one keep-alive ``requests.Session`` per remote host.
+
+    Pipelines that talk to the same QRadar console or WebHDFS namenode share the
+    session, and with it the TCP/TLS connections, instead of each opening their own.
+    """
+
+    def __init__(self, pool_size=10):
+        self.pool_size = max(1, int(pool_size))
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def get_session(self, url):
+        parts = urlsplit(url if "://" in url else f"https://{url}")
+        key = f"{parts.scheme}://{parts.netloc}"
+        with self._lock:
+            if key not in self._sessions:
+                self._sessions[key] = create_session(self.pool_size)
+                logger.info(f"Opened shared HTTP session for {key} (pool size {self.pool_size})")
+            return self._sessions[key]
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
@@ -1,18 +1,38 @@
+import asyncio
 import logging
 from datetime import datetime, timedelta
 import gzip
 import json
 import time
 import os
+import re
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 from cortex_xdr_client.client import CortexXDRClient as RealCortexXDRClient
 from cortex_xdr_client.api.authentication import Authentication
 from cortex_xdr_client.api.models.exceptions import UnsuccessfulQueryStatusException
 
-from sdc_tool.base_source import BaseSource
+from sdc_tool.base_source import BaseSource, WindowOverflowError
+from sdc_tool.payload import FilePayload, count_records
+from sdc_tool.polling import AdaptivePoller, PollTimeoutError
+from sdc_tool.xql_quota import QuotaScheduler
 
 logger = logging.getLogger(__name__)
 
+class XQLQueryError(Exception):
+    """Raised when an XQL query ends in a state other than SUCCESS (FAIL, quota exhausted, ...)."""
+
+    def __init__(self, query_id, status, detail=None, reply=None):
+        message = f"XQL query {query_id} ended with status {status}"
+        super().__init__(f"{message}: {detail}" if detail else message)
+        self.query_id = query_id
+        self.status = status
+        # A failed query is still charged; its reply carries query_cost and remaining_quota
+        self.reply = reply
+
+
 class CortexXDRClient(RealCortexXDRClient):
     """Wrapper for the real Cortex XDR client to handle gzipped streams directly."""
     def __init__(self, fqdn, api_key_id, api_key):
@@ -23,7 +43,6 @@ class CortexXDRClient(RealCortexXDRClient):
         self.api_key = api_key
         logger.info(f"Initialized RealCortexXDRClient for FQDN: {self.fqdn}")
 
-
 class CortexXDRSource(BaseSource):
     def __init__(self, config):
         super().__init__(config)
@@ -31,38 +50,258 @@ class CortexXDRSource(BaseSource):
         self.key_id = self.config.get("CortexXDR.cortex_xdr.api.key_id")
         self.key = self.config.get("CortexXDR.cortex_xdr.api.key")
         self.api_client = CortexXDRClient(self.fqdn, self.key_id, self.key)
+        # XQL allows only a few concurrent queries per tenant
+        self.search_quota_key = f"cortex_xdr:{self.fqdn}"
+        self.max_concurrent_searches = self.config.getint("CortexXDR.cortex_xdr.api.max_concurrent_queries", 4)
+        self.query_template = self.config.get("CortexXDR.cortex_xdr.api.xql_query_template_alerts")
+        self.row_cap = self._row_cap()
+        self.min_split_ms = self.config.getint("CortexXDR.cortex_xdr.api.min_split_seconds", 1) * 1000
+        # Shared by every pipeline querying this tenant so backfills cannot use up the live reserve
+        self.quota = QuotaScheduler.for_tenant(
+            self.fqdn,
+            live_reserve_units=self.config.getfloat("CortexXDR.cortex_xdr.quota.live_reserve_units", 0.0),
+            daily_quota_units=self.config.getfloat("CortexXDR.cortex_xdr.quota.daily_units", 0.0),
+            max_concurrency=self.max_concurrent_searches,
+        )
+        self.live_lag_ms = self.config.getint("CortexXDR.cortex_xdr.quota.live_lag_minutes", 30) * 60 * 1000
+        self._timings_lock = threading.Lock()
 
-    def collect_data(self, start_time: datetime, end_time: datetime):
-        query_template = self.config.get("CortexXDR.cortex_xdr.api.xql_query_template_alerts")
-        query = query_template.format(start_time=int(start_time.timestamp()*1000),  # Convert to milliseconds
-                                      end_time=int(end_time.timestamp()*1000))  # Convert to milliseconds
-        logger.info(f"Collecting data from Cortex XDR from {start_time} to {end_time}: {query}")
+    def _row_cap(self):
+        # XQL returns at most max_results_per_query rows; a "| limit N" in the template lowers that further
+        row_cap = self.config.getint("CortexXDR.cortex_xdr.api.max_results_per_query", 1000000)
+        limits = re.findall(r"\|\s*limit\s+(\d+)", self.query_template or "", re.IGNORECASE)
+        if limits:
+            row_cap = min(row_cap, int(limits[-1]))
+        return row_cap
+
+    def _build_query(self, start_ms: int, end_ms: int):
+        query = self.query_template.format(start_time=start_ms, end_time=end_ms)
+        logger.info(f"Querying Cortex XDR from {start_ms} to {end_ms}: {query}")
+        return query
 
+    def _temp_gz_file(self, start_time: datetime, end_time: datetime):
         # Get tmp directory for gzipped output
         tmp_dir = self.config.get("CortexXDR.cortex_xdr.tmp_dir", "./tmp/xdr")
         prefix_filename = self.config.get("CortexXDR.cortex_xdr.prefix_filename", "xdr_data")
-        # Real API calls
-        query_id = self.api_client.xql_api.start_xql_query(query=query)
+        return f"{tmp_dir}/{prefix_filename}_{start_time}_{end_time}.json.gz"
+
+    def _query_status(self, query_id):
+        """Returns the query reply once it succeeded, or None while it is still pending.
+
+        Reads the full JSON reply (``status``, ``number_of_results``, ``query_cost``,
+        ``remaining_quota``); ``get_query_results`` keeps only the results. ``limit=0``
+        keeps results out of the polls.
+        """
+        response = self.api_client.xql_api.get_query_results_request(query_id=query_id, pending_flag=True, limit=0)
+        reply = response.get("reply") if isinstance(response, dict) else None
+        if not isinstance(reply, dict) or "status" not in reply:
+            raise XQLQueryError(query_id, None, f"unexpected reply {response!r}")
+
+        status = reply.get("status")
+        if status == "SUCCESS":
+            logger.info(f"XQL query {query_id} status: SUCCESS, results: {reply.get('number_of_results', 'unknown')}")
+            return reply
+        logger.info(f"XQL query {query_id} status: {status}")
+        if status == "PENDING":
+            return None
+        # FAIL, PARTIAL_SUCCESS (quota exhausted mid-query) or anything unknown: retrying would not help
+        raise XQLQueryError(query_id, status, reply.get("error") or reply.get("error_message"), reply=reply)
+
+    def _poll_schedule(self):
+        max_wait_time = self.config.getint("CortexXDR.cortex_xdr.api.max_wait_time", 300)
+        # XQL reports no progress, so the stall timeout is the overall wait limit
+        return AdaptivePoller(
+            initial_interval_seconds=self.config.getfloat("CortexXDR.cortex_xdr.api.poll_initial_seconds", 0.5),
+            max_interval_seconds=self.config.getfloat("CortexXDR.cortex_xdr.api.poll_max_seconds", 10.0),
+            stall_timeout_seconds=max_wait_time,
+            max_wait_seconds=max_wait_time,
+        ).schedule()
+
+    def _submit(self, start_ms, end_ms, timings):
+        started = time.monotonic()
+        query_id = self.api_client.xql_api.start_xql_query(query=self._build_query(start_ms, end_ms))
+        with self._timings_lock:
+            # Sub-queries of one window are submitted from several threads
+            timings["submit"] = round(timings.get("submit", 0) + time.monotonic() - started, 3)
         logger.info(f"Started XQL query with ID: {query_id}")
+        return query_id
 
-        max_wait_time = self.config.get("CortexXDR.cortex_xdr.api.max_wait_time", 300)
-        waited_time = 0
-        
-        temp_gz_file = f"{tmp_dir}/{prefix_filename}_{start_time}_{end_time}.json.gz"
-        # Poll for query status
-        while waited_time < max_wait_time:
-            try:
-                bytes_written = self.api_client.xql_api.write_query_results(query_id, temp_gz_file)
-                logger.info(f"Successfully wrote {bytes_written} bytes to {temp_gz_file}")
-                return temp_gz_file
-            except Exception:
-                logger.info(f"XQL query {query_id} is still running, waiting...")
-                time.sleep(2)
-                waited_time += 2
-        logger.error(f"Query {query_id} did not complete within {max_wait_time} seconds.")
-        raise UnsuccessfulQueryStatusException(f"Query {query_id} did not complete in time.")
+    def _is_live(self, end_ms):
+        return time.time() * 1000 - end_ms <= self.live_lag_ms
 
+    def _run_query(self, start_ms, end_ms, timings):
+        window_seconds = (end_ms - start_ms) / 1000
+        reserved = self.quota.acquire(window_seconds, live=self._is_live(end_ms))
+        reply = None
+        try:
+            query_id = self._submit(start_ms, end_ms, timings)
+            schedule = self._poll_schedule()
+            while True:
+                reply = self._query_status(query_id)
+                if reply is not None:
+                    return query_id, reply.get("number_of_results")
+                try:
+                    time.sleep(schedule.next_delay())
+                except PollTimeoutError as e:
+                    logger.error(f"Query {query_id} did not complete: {e}")
+                    raise UnsuccessfulQueryStatusException(f"Query {query_id} did not complete in time.")
+        except XQLQueryError as e:
+            reply = e.reply
+            raise
+        finally:
+            self.quota.release(reserved, window_seconds, reply)
 
+    async def _run_query_async(self, start_ms, end_ms, timings):
+        loop = asyncio.get_running_loop()
+        window_seconds = (end_ms - start_ms) / 1000
+        while True:
+            reserved = self.quota.try_acquire(window_seconds, live=self._is_live(end_ms))
+            if reserved is not None:
+                break
+            await asyncio.sleep(1)
+        reply = None
+        try:
+            query_id = await loop.run_in_executor(None, self._submit, start_ms, end_ms, timings)
+            schedule = self._poll_schedule()
+            while True:
+                reply = await loop.run_in_executor(None, self._query_status, query_id)
+                if reply is not None:
+                    return query_id, reply.get("number_of_results")
+                try:
+                    delay = schedule.next_delay()
+                except PollTimeoutError as e:
+                    logger.error(f"Query {query_id} did not complete: {e}")
+                    raise UnsuccessfulQueryStatusException(f"Query {query_id} did not complete in time.")
+                await asyncio.sleep(delay)
+        except XQLQueryError as e:
+            reply = e.reply
+            raise
+        finally:
+            self.quota.release(reserved, window_seconds, reply)
 
+    def _check_total(self, record_count):
+        # Check before downloading so an oversized window is split instead of fetched
+        if self.max_events_per_window and record_count is not None and record_count >= self.max_events_per_window:
+            raise WindowOverflowError(record_count, self.max_events_per_window)
 
+    def _split_capped(self, results):
+        """Splits the ranges whose query hit the row cap; returns (done, ranges_to_query)."""
+        done, pending = [], []
+        for (start_ms, end_ms), (query_id, record_count) in results:
+            if record_count is None or record_count < self.row_cap:
+                done.append((start_ms, end_ms, query_id, record_count))
+                continue
+            half_ms = (end_ms - start_ms) // 2
+            if half_ms < self.min_split_ms:
+                logger.error(f"Range {start_ms} - {end_ms} still returns {record_count} rows (cap {self.row_cap}) "
+                             f"and cannot be split below {self.min_split_ms // 1000}s.")
+                raise WindowOverflowError(record_count, self.row_cap)
+            logger.info(f"XQL query {query_id} hit the row cap of {self.row_cap}, splitting {start_ms} - {end_ms} in half.")
+            pending.extend([(start_ms, start_ms + half_ms), (start_ms + half_ms, end_ms)])
+        return done, pending
+
+    def _resolve_ranges(self, start_ms, end_ms, timings):
+        """Runs queries, splitting ranges that reach the row cap, until every range is complete.
+
+        Ranges are queried level by level so all halves of one level run in parallel. Every
+        query takes a slot of the tenant's shared scheduler, so sub-queries count against
+        the same ``max_concurrent_queries`` as the queries of every other window.
+        Returns ``(start_ms, end_ms, query_id, record_count)`` sorted by time.
+        """
+        started = time.monotonic()
+        results = [((start_ms, end_ms), self._run_query(start_ms, end_ms, timings))]
+        self._check_total(results[0][1][1])
+        done, pending = self._split_capped(results)
+        while pending:
+            with ThreadPoolExecutor(max_workers=self.max_concurrent_searches, thread_name_prefix="sdc-xql") as executor:
+                futures = [executor.submit(self._run_query, s, e, timings) for s, e in pending]
+                results = [(r, f.result()) for r, f in zip(pending, futures)]
+            new_done, pending = self._split_capped(results)
+            done.extend(new_done)
+        timings["execution"] = round(time.monotonic() - started, 3)
+        return sorted(done)
+
+    async def _resolve_ranges_async(self, start_ms, end_ms, timings):
+        started = time.monotonic()
+        results = [((start_ms, end_ms), await self._run_query_async(start_ms, end_ms, timings))]
+        self._check_total(results[0][1][1])
+        done, pending = self._split_capped(results)
+        while pending:
+            replies = await asyncio.gather(*(self._run_query_async(s, e, timings) for s, e in pending))
+            new_done, pending = self._split_capped(list(zip(pending, replies)))
+            done.extend(new_done)
+        timings["execution"] = round(time.monotonic() - started, 3)
+        return sorted(done)
+
+    def _download_one(self, query_id, output_gz_file):
+        with self.quota.slot():
+            bytes_written = self.api_client.xql_api.write_query_results(query_id, output_gz_file)
+        logger.info(f"Successfully wrote {bytes_written} bytes to {output_gz_file}")
+
+    def _counted(self, ranges, files):
+        """Row counts of the downloaded ranges; counts the rows of the ones whose reply had no count."""
+        counts = [record_count if record_count is not None else count_records(path)
+                  for (_, _, _, record_count), path in zip(ranges, files)]
+        for (start_ms, end_ms, _, record_count), count in zip(ranges, counts):
+            if record_count is None and count >= self.row_cap:
+                # The reply did not say how many rows matched, so the range may have been truncated
+                logger.error(f"Range {start_ms} - {end_ms} returned {count} rows, the row cap ({self.row_cap}).")
+                raise WindowOverflowError(count, self.row_cap)
+        return counts
+
+    def _download(self, ranges, temp_gz_file, timings):
+        """Downloads the results of every range and merges them in time order into ``temp_gz_file``."""
+        started = time.monotonic()
+        if len(ranges) == 1:
+            self._download_one(ranges[0][2], temp_gz_file)
+            try:
+                counts = self._counted(ranges, [temp_gz_file])
+            except WindowOverflowError:
+                os.remove(temp_gz_file)
+                raise
+        else:
+            part_files = [f"{temp_gz_file}.part{i:05d}" for i in range(len(ranges))]
+            try:
+                with ThreadPoolExecutor(max_workers=self.max_concurrent_searches, thread_name_prefix="sdc-xql") as executor:
+                    futures = [executor.submit(self._download_one, query_id, part_file)
+                               for (_, _, query_id, _), part_file in zip(ranges, part_files)]
+                    for future in futures:
+                        future.result()
+                counts = self._counted(ranges, part_files)
+                # Concatenated gzip members form one valid gzip stream
+                with open(temp_gz_file, "wb") as out:
+                    for part_file in part_files:
+                        with open(part_file, "rb") as part:
+                            shutil.copyfileobj(part, out)
+            finally:
+                for part_file in part_files:
+                    if os.path.exists(part_file):
+                        os.remove(part_file)
+        timings["download"] = round(time.monotonic() - started, 3)
+
+        record_count = sum(counts)
+        if self.max_events_per_window and record_count >= self.max_events_per_window:
+            os.remove(temp_gz_file)
+            raise WindowOverflowError(record_count, self.max_events_per_window)
+        return record_count
+
+    def _finish(self, ranges, start_time, end_time, timings):
+        temp_gz_file = self._temp_gz_file(start_time, end_time)
+        record_count = self._download(ranges, temp_gz_file, timings)
+        logger.info(f"Cortex XDR window {start_time} - {end_time} took {len(ranges)} queries; timings: "
+                    + ", ".join(f"{k} {v}s" for k, v in timings.items()))
+        return FilePayload(temp_gz_file, record_count, start_time, end_time, timings=timings)
+
+    def collect_data(self, start_time: datetime, end_time: datetime):
+        logger.info(f"Collecting data from Cortex XDR from {start_time} to {end_time}")
+        timings = {}
+        ranges = self._resolve_ranges(int(start_time.timestamp()*1000), int(end_time.timestamp()*1000), timings)
+        return self._finish(ranges, start_time, end_time, timings)
 
+    async def collect_data_async(self, start_time: datetime, end_time: datetime):
+        logger.info(f"Collecting data from Cortex XDR from {start_time} to {end_time}")
+        timings = {}
+        ranges = await self._resolve_ranges_async(int(start_time.timestamp()*1000), int(end_time.timestamp()*1000),
+                                                  timings)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self._finish, ranges, start_time, end_time, timings)
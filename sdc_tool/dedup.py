@@ -0,0 +1,364 @@
+import gzip
+import hashlib
+import json
+import logging
+import math
+import os
+import sys
+import tempfile
+import threading
+import time
+from array import array
+
+from sdc_tool.compression import get_codec
+from sdc_tool.payload import FilePayload
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 2
+# Rough size of one exact entry: a dict slot plus the 64-bit key object
+_EXACT_KEY_BYTES = 100
+_BLOOM_GENERATIONS = 4
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over 64-bit key hashes (double hashing on the two 32-bit halves)."""
+
+    def __init__(self, num_bits, num_hashes, bits=None, count=0):
+        self.num_bits = max(64, int(num_bits))
+        self.num_hashes = max(1, int(num_hashes))
+        self.bits = bits if bits is not None else bytearray((self.num_bits + 7) // 8)
+        self.count = count
+
+    @classmethod
+    def for_memory(cls, max_bytes, error_rate):
+        # k is the optimum for a filter filled up to the capacity that gives error_rate
+        return cls(max_bytes * 8, round(-math.log2(error_rate)))
+
+    def _positions(self, key):
+        h1, h2 = key & 0xFFFFFFFF, (key >> 32) | 1
+        return ((h1 + i * h2) % self.num_bits for i in range(self.num_hashes))
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    @property
+    def error_rate(self):
+        """Expected false positive rate at the current fill."""
+        return (1 - math.exp(-self.num_hashes * self.count / self.num_bits)) ** self.num_hashes
+
+
+class DedupIndex:
+    """Keys of the events already written, in time buckets of ``bucket_seconds``.
+
+    The ``exact_buckets`` newest buckets keep exact sets (key hash -> window that wrote
+    it); older buckets are folded into Bloom filters, one per generation of buckets,
+    and a generation is dropped once all of its buckets are older than
+    ``retention_buckets``. Each generation also records which windows went into it, so
+    a window that is written again is not matched against its own keys. Ages are counted from the newest bucket written, not from the
+    wall clock, so a backfill keeps its index. Memory is capped at ``max_memory_mb``:
+    half for the exact sets (the oldest ones are folded early when they outgrow it; the
+    bucket being written stays exact), half for the Bloom filters, whose false positive
+    rate rises if they take more keys than that budget allows for ``bloom_error_rate``.
+    """
+
+    def __init__(self, bucket_seconds=3600, exact_buckets=24, retention_buckets=168, max_memory_mb=64,
+                 bloom_error_rate=0.001):
+        self.bucket_ms = max(1, int(bucket_seconds)) * 1000
+        self.exact_buckets = max(1, int(exact_buckets))
+        self.retention_buckets = max(self.exact_buckets, int(retention_buckets))
+        self.bloom_error_rate = bloom_error_rate
+        memory_bytes = max(1, int(max_memory_mb)) * 1024 * 1024
+        self.max_exact_keys = memory_bytes // 2 // _EXACT_KEY_BYTES
+        self.generation_buckets = max(1, math.ceil((self.retention_buckets - self.exact_buckets) / _BLOOM_GENERATIONS))
+        # Early folding can start a generation inside the exact range, hence one generation per span of retention
+        self._bloom_bytes = memory_bytes // 2 // (math.ceil(self.retention_buckets / self.generation_buckets) + 1)
+        self._exact = {}
+        self._blooms = {}
+        self._bloom_windows = {}
+        self._exact_keys = 0
+        self._newest = None
+
+    def _bucket(self, window_ms):
+        return window_ms // self.bucket_ms
+
+    @property
+    def memory_bytes(self):
+        return self._exact_keys * _EXACT_KEY_BYTES + sum(len(bloom.bits) for bloom in self._blooms.values())
+
+    def __len__(self):
+        return self._exact_keys + sum(bloom.count for bloom in self._blooms.values())
+
+    def seen(self, key, window_ms):
+        """True if ``key`` was written by a window other than ``window_ms`` (or may have been, for old buckets)."""
+        for entries in self._exact.values():
+            owner = entries.get(key)
+            if owner is not None:
+                # A window that is written again keeps its own events
+                return owner != window_ms
+        # A Bloom filter cannot tell whose key it holds: skip the ones the window itself went into
+        return any(key in bloom for generation, bloom in self._blooms.items()
+                   if window_ms not in self._bloom_windows.get(generation, ()))
+
+    def add(self, keys, window_ms):
+        bucket = self._bucket(window_ms)
+        entries = self._exact.setdefault(bucket, {})
+        before = len(entries)
+        for key in keys:
+            entries.setdefault(key, window_ms)
+        self._exact_keys += len(entries) - before
+        self._newest = bucket if self._newest is None else max(self._newest, bucket)
+        self._expire()
+
+    def _expire(self):
+        for bucket in sorted(self._exact):
+            if bucket == self._newest:
+                break
+            if bucket > self._newest - self.exact_buckets and self._exact_keys <= self.max_exact_keys:
+                break
+            self._fold(bucket)
+        expired = self._newest - self.retention_buckets
+        for generation in [g for g in self._blooms if (g + 1) * self.generation_buckets - 1 <= expired]:
+            del self._blooms[generation]
+            self._bloom_windows.pop(generation, None)
+
+    def _fold(self, bucket):
+        entries = self._exact.pop(bucket)
+        self._exact_keys -= len(entries)
+        if bucket <= self._newest - self.retention_buckets:
+            return
+        generation = bucket // self.generation_buckets
+        bloom = self._blooms.get(generation)
+        if bloom is None:
+            bloom = self._blooms[generation] = BloomFilter.for_memory(self._bloom_bytes, self.bloom_error_rate)
+        for key in entries:
+            bloom.add(key)
+        self._bloom_windows.setdefault(generation, set()).update(entries.values())
+        if bloom.error_rate > self.bloom_error_rate:
+            logger.warning(f"Dedup Bloom filter of generation {generation} holds {bloom.count} keys; its false "
+                           f"positive rate is {bloom.error_rate:.4%}. Raise dedup.max_memory_mb.")
+
+    def save(self, path):
+        """Writes the index to ``path`` (atomically: temp file, fsync, rename)."""
+        exact = sorted(self._exact.items())
+        blooms = sorted(self._blooms.items())
+        header = {
+            "version": INDEX_VERSION,
+            "byteorder": sys.byteorder,
+            "bucket_ms": self.bucket_ms,
+            "newest": self._newest,
+            "exact": [[bucket, len(entries)] for bucket, entries in exact],
+            "blooms": [[generation, bloom.num_bits, bloom.num_hashes, bloom.count,
+                        sorted(self._bloom_windows.get(generation, ()))] for generation, bloom in blooms],
+        }
+        index_dir = os.path.dirname(path)
+        if index_dir:
+            os.makedirs(index_dir, exist_ok=True)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(json.dumps(header).encode("utf-8") + b"\n")
+            for _, entries in exact:
+                f.write(array("Q", entries.keys()).tobytes())
+                f.write(array("q", entries.values()).tobytes())
+            for _, bloom in blooms:
+                f.write(bloom.bits)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+
+    def load(self, path):
+        """Restores an index saved by ``save``; returns False (and keeps it empty) if there is none usable."""
+        try:
+            with open(path, "rb") as f:
+                header = json.loads(f.readline())
+                if header.get("version") != INDEX_VERSION or header.get("bucket_ms") != self.bucket_ms:
+                    logger.warning(f"Dedup index {path} was written with other settings; starting empty.")
+                    return False
+                swap = header["byteorder"] != sys.byteorder
+                exact = {}
+                for bucket, count in header["exact"]:
+                    keys, windows = array("Q"), array("q")
+                    keys.frombytes(f.read(count * keys.itemsize))
+                    windows.frombytes(f.read(count * windows.itemsize))
+                    if swap:
+                        keys.byteswap()
+                        windows.byteswap()
+                    exact[bucket] = dict(zip(keys, windows))
+                blooms, bloom_windows = {}, {}
+                for generation, num_bits, num_hashes, count, windows in header["blooms"]:
+                    bits = bytearray(f.read((num_bits + 7) // 8))
+                    if len(bits) != (num_bits + 7) // 8:
+                        raise ValueError("truncated Bloom filter")
+                    blooms[generation] = BloomFilter(num_bits, num_hashes, bits=bits, count=count)
+                    bloom_windows[generation] = set(windows)
+        except FileNotFoundError:
+            return False
+        except (ValueError, KeyError, TypeError, EOFError) as e:
+            logger.warning(f"Dedup index {path} is corrupt ({e}); starting empty.")
+            return False
+        self._exact, self._blooms, self._bloom_windows = exact, blooms, bloom_windows
+        self._newest = header["newest"]
+        self._exact_keys = sum(len(entries) for entries in exact.values())
+        if self._newest is not None:
+            self._expire()
+        logger.info(f"Loaded dedup index {path}: {len(self)} keys, {self.memory_bytes} bytes.")
+        return True
+
+
+class DedupResult:
+    """Items of a window with duplicates removed, and the keys to add to the index once they are written."""
+
+    def __init__(self, window_ms, items, keys, dropped, temp_paths):
+        self.window_ms = window_ms
+        self.items = items
+        self.keys = keys
+        self.dropped = dropped
+        self.temp_paths = temp_paths
+
+    def cleanup(self):
+        for path in self.temp_paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+class Deduplicator:
+    """Drops events whose key (built from ``key_fields``) was already written by another window.
+
+    ``filter_window`` removes the duplicates of a window (across windows through the
+    index, and within the window itself); ``commit`` adds the window's keys to the
+    index once it was written, and ``save`` persists the index, at most every
+    ``save_interval_seconds`` unless forced (an index that lags behind only drops fewer
+    duplicates after a restart). Events that have none of
+    the key fields are always kept. A payload file without duplicates is passed on
+    untouched; otherwise the kept events are written to a new temp file in ``tmp_dir``.
+    """
+
+    def __init__(self, index, key_fields, index_path=None, tmp_dir=None, save_interval_seconds=60):
+        if not key_fields:
+            raise ValueError("Deduplication needs at least one key field (dedup.key_fields).")
+        self.index = index
+        self.key_fields = list(key_fields)
+        self.index_path = index_path
+        self.tmp_dir = tmp_dir
+        self.save_interval_seconds = save_interval_seconds
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._saved_at = time.monotonic()
+        if index_path:
+            self.index.load(index_path)
+
+    @classmethod
+    def from_config(cls, config, default_index_path):
+        key_fields = [f.strip() for f in config.get("Dedup.dedup.key_fields", "").split(",") if f.strip()]
+        index = DedupIndex(
+            bucket_seconds=config.getint("Dedup.dedup.bucket_minutes", 60) * 60,
+            exact_buckets=config.getint("Dedup.dedup.exact_buckets", 24),
+            retention_buckets=config.getint("Dedup.dedup.retention_buckets", 168),
+            max_memory_mb=config.getint("Dedup.dedup.max_memory_mb", 64),
+            bloom_error_rate=config.getfloat("Dedup.dedup.bloom_error_rate", 0.001),
+        )
+        return cls(index, key_fields, index_path=config.get("Dedup.dedup.index_path", default_index_path),
+                   tmp_dir=config.get("General.tmp_dir", None),
+                   save_interval_seconds=config.getint("Dedup.dedup.save_interval_seconds", 60))
+
+    def key(self, record):
+        """64-bit hash of the key fields of a record (dict or NDJSON line), or None if it has none of them."""
+        if isinstance(record, (bytes, str)):
+            try:
+                record = json.loads(record)
+            except ValueError:
+                return None
+        if not isinstance(record, dict):
+            return None
+        values = [record.get(field) for field in self.key_fields]
+        if all(value is None for value in values):
+            return None
+        encoded = json.dumps(values, sort_keys=True, default=str).encode("utf-8")
+        return int.from_bytes(hashlib.blake2b(encoded, digest_size=8).digest(), "little")
+
+    def _duplicates(self, records, window_ms, window_keys):
+        """Positions of the duplicate records; new keys are added to ``window_keys``."""
+        duplicates = set()
+        for position, record in enumerate(records):
+            key = self.key(record)
+            if key is None:
+                continue
+            if key in window_keys or self.index.seen(key, window_ms):
+                duplicates.add(position)
+            else:
+                window_keys[key] = None
+        return duplicates
+
+    def _filter_payload(self, payload, duplicates):
+        codec = get_codec(payload.codec)
+        if self.tmp_dir:
+            os.makedirs(self.tmp_dir, exist_ok=True)
+        fd, path = tempfile.mkstemp(prefix="sdc_dedup_", suffix=f".json{codec.extension}", dir=self.tmp_dir)
+        os.close(fd)
+        kept = 0
+        with codec.open(path, "wb") as f:
+            for position, line in enumerate(payload.iter_records()):
+                if position not in duplicates:
+                    f.write(line if line.endswith(b"\n") else line + b"\n")
+                    kept += 1
+        return FilePayload(path, kept, start_time=payload.start_time, end_time=payload.end_time,
+                           timings=payload.timings, codec=payload.codec)
+
+    def _filter_item(self, data, window_ms, window_keys, temp_paths):
+        if isinstance(data, FilePayload):
+            duplicates = self._duplicates(data.iter_records(), window_ms, window_keys)
+            if not duplicates:
+                return data, 0
+            filtered = self._filter_payload(data, duplicates)
+            temp_paths.append(filtered.path)
+            return filtered, len(duplicates)
+        if isinstance(data, bytes):
+            lines = [line for line in gzip.decompress(data).splitlines() if line.strip()]
+            duplicates = self._duplicates(lines, window_ms, window_keys)
+            if not duplicates:
+                return data, 0
+            kept = [line for position, line in enumerate(lines) if position not in duplicates]
+            return (gzip.compress(b"\n".join(kept) + b"\n") if kept else b""), len(duplicates)
+        records = list(data)
+        duplicates = self._duplicates(records, window_ms, window_keys)
+        return [record for position, record in enumerate(records) if position not in duplicates], len(duplicates)
+
+    def filter_window(self, window_ms, items):
+        """Removes duplicate events from the ``(data, ...)`` items of the window starting at ``window_ms``."""
+        with self._lock:
+            window_keys, temp_paths, filtered, dropped = {}, [], [], 0
+            try:
+                for data, *rest in items:
+                    data, count = self._filter_item(data, window_ms, window_keys, temp_paths)
+                    dropped += count
+                    filtered.append((data, *rest))
+            except Exception:
+                DedupResult(window_ms, [], [], 0, temp_paths).cleanup()
+                raise
+        if dropped:
+            logger.info(f"Dropped {dropped} duplicate events from window starting {window_ms}.")
+        return DedupResult(window_ms, filtered, list(window_keys), dropped, temp_paths)
+
+    def commit(self, result):
+        """Adds the keys of a written window to the index."""
+        with self._lock:
+            self.index.add(result.keys, result.window_ms)
+            self._dirty = True
+
+    def save(self, force=False):
+        """Writes the index if it changed and ``save_interval_seconds`` passed since the last save (or ``force``)."""
+        if not self.index_path:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            if not force and time.monotonic() - self._saved_at < self.save_interval_seconds:
+                return
+            self.index.save(self.index_path)
+            self._dirty = False
+            self._saved_at = time.monotonic()
@@ -1,20 +1,28 @@
+import contextlib
 import logging
 import os
-import gzip
-import json
-from datetime import datetime
 import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from hdfs import InsecureClient
 
 from sdc_tool.base_sink import BaseSink
+from sdc_tool.compactor import WebHDFSFileSystem
+from sdc_tool.payload import FilePayload
 
 logger = logging.getLogger(__name__)
 
 class HDFSSink(BaseSink):
-    def __init__(self, config):
-        super().__init__(config)
+    def __init__(self, config, connection_pool=None, pipeline_name=None):
+        super().__init__(config, pipeline_name=pipeline_name)
         self.namenode_url = self.config.get("Hadoop.hadoop.namenode_url")
+        self.session = connection_pool.get_session(self.namenode_url) if connection_pool else None
         self.kerberos_enabled = self.config.getboolean("Hadoop.hadoop.kerberos_enabled", False)
+        # Long-running processes re-run kinit before the ticket expires instead of on every write
+        self.kerberos_renew_interval_minutes = self.config.getint("Hadoop.hadoop.kerberos_renew_interval_minutes", 480)
+        self._kerberos_authenticated_at = None
         if self.kerberos_enabled:
             self.kerberos_principal = self.config.get("Hadoop.hadoop.kerberos_principal")
             self.keytab_path = self.config.get("Hadoop.hadoop.keytab_path")
@@ -27,6 +35,12 @@ class HDFSSink(BaseSink):
 
         self.max_records_per_file = int(self.config.get("Hadoop.hadoop.max_records_per_file", 100000))
         self.max_file_size_mb = int(self.config.get("Hadoop.hadoop.max_file_size_mb", 256))
+        # Số file được tải lên HDFS song song
+        self.upload_workers = max(1, self.config.getint("Hadoop.hadoop.upload_workers", 4))
+
+        self._client = None
+        self._client_lock = threading.Lock()
+        self._upload_executor = None
 
     def _authenticate_kerberos(self):
         if not self.kerberos_enabled:
@@ -37,6 +51,7 @@ class HDFSSink(BaseSink):
             command = ["kinit", "-kt", self.keytab_path, self.kerberos_principal]
             result = subprocess.run(command, capture_output=True, check=True, text=True)
             logger.info(f"Kerberos authentication successful: {result.stdout.strip()}")
+            self._kerberos_authenticated_at = time.monotonic()
         except subprocess.CalledProcessError as e:
             logger.error(f"Kerberos authentication failed: {e.stderr.strip()}")
             raise
@@ -44,8 +59,14 @@ class HDFSSink(BaseSink):
             logger.error("kinit command not found. Ensure Kerberos client is installed and in PATH.")
             raise
 
-    def _get_hdfs_path(self, source_identifier, input_type):
-        today_str = datetime.now().strftime("%Y%m%d")
+    def _ensure_authenticated(self):
+        if not self.kerberos_enabled:
+            return
+        if (self._kerberos_authenticated_at is None or
+                time.monotonic() - self._kerberos_authenticated_at >= self.kerberos_renew_interval_minutes * 60):
+            self._authenticate_kerberos()
+
+    def _output_root(self, source_identifier, input_type):
         base_path = None
 
         if source_identifier == "qradar":
@@ -61,35 +82,150 @@ class HDFSSink(BaseSink):
         if not base_path:
             raise ValueError(f"HDFS base path not configured for source {source_identifier} and input type {input_type}")
 
-        return os.path.join(base_path, today_str)
+        return base_path
 
-    def write_data(self, data, source_identifier, input_type):
-        if not data:
-            logger.info("No data to write to HDFS.")
-            return
+    def _get_hdfs_path(self, source_identifier, input_type, partition):
+        return os.path.join(self._output_root(source_identifier, input_type), partition)
 
-        hdfs_dir = self._get_hdfs_path(source_identifier, input_type)
-        
-        timestamp_str = datetime.now().strftime("%H%M%S")
-        filename = f"data_{timestamp_str}_{os.getpid()}.json.gz"
-        full_hdfs_path = os.path.join(hdfs_dir, filename)
+    def _get_client(self):
+        # One long-lived client per sink, so keep-alive connections and namenode redirects are reused
+        with self._client_lock:
+            if self._client is None:
+                client_kwargs = {"session": self.session} if self.session is not None else {}
+                self._client = InsecureClient(self.namenode_url, **client_kwargs)
+            return self._client
 
+    def _output_fs(self):
+        self._ensure_authenticated()
+        return WebHDFSFileSystem(self._get_client())
+
+    def _executor(self):
+        with self._client_lock:
+            if self._upload_executor is None:
+                self._upload_executor = ThreadPoolExecutor(max_workers=self.upload_workers,
+                                                           thread_name_prefix="sdc-hdfs-upload")
+            return self._upload_executor
+
+    def _upload(self, temp_hdfs_path, full_hdfs_path, data):
+        """Uploads ``data`` (compressed bytes or the path of a local file) to ``temp_hdfs_path``.
+
+        The file goes to ``_temporary/`` under its final name; readers (Hive, Spark) skip
+        "_" directories, so it is only visible once the window commit renames it.
+        """
+        client = self._get_client()
         logger.info(f"Writing data to HDFS path: {full_hdfs_path}")
         try:
-            client = InsecureClient(self.namenode_url) # Initialize client here
-            # If data is already gzipped bytes, write directly
             if isinstance(data, bytes):
-                with client.write(full_hdfs_path, overwrite=True) as writer:
+                with client.write(temp_hdfs_path, overwrite=True) as writer:
                     writer.write(data)
             else:
-                # Otherwise, assume it's a list of records and gzip it
-                with client.write(full_hdfs_path, encoding="utf-8", overwrite=True) as writer:
-                    with gzip.open(writer, "wt", encoding="utf-8") as gz_writer:
-                        for record in data:
-                            gz_writer.write(json.dumps(record) + "\n")
-            logger.info(f"Successfully wrote data to HDFS path {full_hdfs_path}")
+                # Streamed from the open file in chunks, never decompressed or loaded into memory
+                with open(data, "rb") as f:
+                    client.write(temp_hdfs_path, data=f, overwrite=True)
         except Exception as e:
             logger.error(f"Error writing to HDFS {full_hdfs_path}: {e}")
+            try:
+                client.delete(temp_hdfs_path)
+            except Exception as cleanup_error:
+                logger.warning(f"Could not remove partial upload {temp_hdfs_path}: {cleanup_error}")
+            raise
+
+    def _submit(self, uploads, hdfs_dir, stager, data, cleanup=None):
+        # Paths are handed out here, in the writing thread; the stager is not thread-safe
+        temp_hdfs_path, full_hdfs_path = stager.new_paths(hdfs_dir, self.file_extension)
+        # Bounds the rolled files waiting on local disk for a free upload slot
+        pending = [future for future in uploads if not future.done()]
+        if len(pending) >= 2 * self.upload_workers:
+            wait(pending, return_when=FIRST_COMPLETED)
+
+        def upload():
+            try:
+                self._upload(temp_hdfs_path, full_hdfs_path, data)
+            finally:
+                if cleanup is not None:
+                    cleanup()
+        uploads.append(self._executor().submit(upload))
+
+    @contextlib.contextmanager
+    def _rolled_file(self, uploads, hdfs_dir, stager):
+        """Yields a local temp file for one rolled output file and queues its upload once it is closed."""
+        if self.partitioner.tmp_dir:
+            os.makedirs(self.partitioner.tmp_dir, exist_ok=True)
+        fd, path = tempfile.mkstemp(prefix="sdc_upload_", suffix=self.file_extension, dir=self.partitioner.tmp_dir)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                yield f
+        except BaseException:
+            os.remove(path)
+            raise
+        self._submit(uploads, hdfs_dir, stager, path, cleanup=lambda: os.remove(path))
+
+    def _write_item(self, data, source_identifier, input_type, window_start, stager):
+        self._write_staged([(data, source_identifier, input_type, window_start, stager)])
+
+    def _upload_partition(self, data, hdfs_dir, stager, uploads):
+        if isinstance(data, FilePayload) and self._passthrough(data) and self._within_limits(data):
+            self._submit(uploads, hdfs_dir, stager, data.path)
+        # If data is already gzipped bytes, write directly
+        elif isinstance(data, bytes) and self._passthrough(data):
+            self._submit(uploads, hdfs_dir, stager, data)
+        else:
+            # Records (or a payload over the limits, or to convert) are rolled into local files of
+            # bounded size; each one is uploaded while the next is being written
+            files = self._record_writer(
+                lambda index: self._rolled_file(uploads, hdfs_dir, stager),
+                max_records=self.max_records_per_file,
+                max_bytes=self.max_file_size_mb * 1024 * 1024,
+            ).write(self._records(data))
+            logger.info(f"Wrote {sum(count for count, _ in files)} records to {len(files)} files in {hdfs_dir}")
+
+    def _write_staged(self, staged):
+        """Uploads every output file of the staged items (partition splits and rolled files) in parallel."""
+        uploads = []
+        with contextlib.ExitStack() as stack:
+            try:
+                for data, source_identifier, input_type, window_start, stager in staged:
+                    parts = stack.enter_context(self.partitioner.split(data, window_start))
+                    for partition, part in parts:
+                        self._upload_partition(part, self._get_hdfs_path(source_identifier, input_type, partition),
+                                               stager, uploads)
+            finally:
+                # Wait for every upload so none is still running when the split and payload files are removed
+                errors = [future.exception() for future in uploads]
+        for error in errors:
+            if error is not None:
+                raise error
+
+    def write_many(self, items):
+        """Writes each item as its own window; the files of all the windows are uploaded together."""
+        windows = []
+        for data, source_identifier, input_type, *rest in items:
+            if not data:
+                continue
+            start_ms, end_ms, window_start = self._data_window(data, rest[0] if rest else None)
+            windows.append(self._stage_window(start_ms, end_ms, [(data, source_identifier, input_type, window_start)]))
+        if not windows:
+            logger.info("No data to write.")
+            return
+        committed = 0
+        try:
+            self._write_staged([item for _, staged in windows for item in staged])
+            for commit, _ in windows:
+                commit.commit()
+                committed += 1
+        except Exception:
+            for commit, _ in windows[committed:]:
+                commit.abort()
             raise
+        logger.info(f"Published {len(windows)} windows.")
 
+    def compaction_target(self):
+        """Filesystem and root directories the compactor works on for this sink."""
+        roots = [self.hdfs_qradar_api_events_base_path, self.hdfs_qradar_api_offenses_base_path,
+                 self.hdfs_qradar_syslog_base_path, self.hdfs_cortex_xdr_api_alerts_base_path]
+        return WebHDFSFileSystem(self._get_client()), sorted({root for root in roots if root})
 
+    def close(self):
+        if self._upload_executor is not None:
+            self._upload_executor.shutdown(wait=True)
+            self._upload_executor = None
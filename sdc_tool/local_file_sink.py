@@ -1,53 +1,78 @@
 import logging
 import os
-import gzip
-import json
-from datetime import datetime
+import shutil
 
 from sdc_tool.base_sink import BaseSink
+from sdc_tool.compactor import LocalFileSystem
+from sdc_tool.payload import FilePayload
 
 logger = logging.getLogger(__name__)
 
 class LocalFileSink(BaseSink):
-    def __init__(self, config):
-        super().__init__(config)
+    def __init__(self, config, pipeline_name=None):
+        super().__init__(config, pipeline_name=pipeline_name)
         self.base_path = self.config.get("LocalFile.local_file.base_path")
         self.max_records_per_file = int(self.config.get("LocalFile.local_file.max_records_per_file", 100000))
         self.max_file_size_mb = int(self.config.get("LocalFile.local_file.max_file_size_mb", 256))
+        self.fs = LocalFileSystem()
 
-    def write_data(self, data, source_identifier, input_type):
-        if not data:
-            logger.info("No data to write to local file.")
-            return
-
-        # Construct path: base_path/source_identifier/input_type/yyyyMMdd/
-        today_str = datetime.now().strftime("%Y%m%d")
-        output_dir = os.path.join(self.base_path, source_identifier, input_type, today_str)
-        os.makedirs(output_dir, exist_ok=True)
-
-        # Determine filename (simple increment for now, could be more robust)
-        file_count = 0
-        while True:
-            timestamp_str = datetime.now().strftime("%H%M%S")
-            filename = os.path.join(output_dir, f"data_{timestamp_str}_{file_count:04d}.json.gz")
-            if not os.path.exists(filename):
-                break
-            file_count += 1
-
-        logger.info(f"Writing data to local file: {filename}")
+    def _new_file(self, output_dir, stager):
+        temp_path, _ = stager.new_paths(output_dir, self.file_extension)
+        os.makedirs(os.path.dirname(temp_path), exist_ok=True)
+        return temp_path
+
+    def _output_fs(self):
+        return self.fs
+
+    def _output_root(self, source_identifier, input_type):
+        return os.path.join(self.base_path, source_identifier, input_type)
+
+    def _write_item(self, data, source_identifier, input_type, window_start, stager):
+        # Construct path: base_path/source_identifier/input_type/<partition>/, e.g. dt=yyyyMMdd/hr=HH
+        with self.partitioner.split(data, window_start) as parts:
+            for partition, part in parts:
+                self._write_partition(part, os.path.join(self._output_root(source_identifier, input_type), partition),
+                                      stager)
+
+    def _write_partition(self, data, output_dir, stager):
         try:
+            if isinstance(data, FilePayload) and self._passthrough(data) and self._within_limits(data):
+                filename = self._new_file(output_dir, stager)
+                logger.info(f"Writing data to local file: {filename}")
+                self._link_or_copy(data.path, filename)
             # If data is already gzipped bytes, write directly
-            if isinstance(data, bytes):
+            elif isinstance(data, bytes) and self._passthrough(data):
+                filename = self._new_file(output_dir, stager)
+                logger.info(f"Writing data to local file: {filename}")
                 with open(filename, "wb") as f:
                     f.write(data)
             else:
-                # Otherwise, assume it's a list of records and gzip it
-                with gzip.open(filename, "wt", encoding="utf-8") as f:
-                    for record in data:
-                        f.write(json.dumps(record) + "\n")
-            logger.info(f"Successfully wrote data to {filename}")
+                # Records (or a payload over the limits, or to convert) are streamed into files of bounded size
+                files = self._record_writer(
+                    lambda index: open(self._new_file(output_dir, stager), "wb"),
+                    max_records=self.max_records_per_file,
+                    max_bytes=self.max_file_size_mb * 1024 * 1024,
+                ).write(self._records(data))
+                logger.info(f"Successfully wrote {sum(count for count, _ in files)} records to {len(files)} "
+                            f"files in {output_dir}")
         except Exception as e:
-            logger.error(f"Error writing to local file {filename}: {e}")
+            logger.error(f"Error writing to local files in {output_dir}: {e}")
             raise
 
+    def compaction_target(self):
+        """Filesystem and root directories the compactor works on for this sink."""
+        return LocalFileSystem(), [self.base_path]
 
+    @staticmethod
+    def _link_or_copy(src_path, dst_path):
+        # The compressed temp file is handed over as is: a hard link when it is on the same
+        # filesystem, otherwise a kernel-side copy. The source file stays for other sinks.
+        try:
+            # Left by an attempt at the same window that died before committing
+            os.remove(dst_path)
+        except FileNotFoundError:
+            pass
+        try:
+            os.link(src_path, dst_path)
+        except OSError:
+            shutil.copyfile(src_path, dst_path)
@@ -2,13 +2,26 @@
 import logging
 import os
 import time
-import json
+import signal
+import threading
 from datetime import datetime, timedelta
 from typing import List, Tuple
-from datetime import datetime, timedelta
 
+from sdc_tool.async_engine import AsyncCollectionEngine
+from sdc_tool.compactor import Compactor
+from sdc_tool.compression import codec_from_config
 from sdc_tool.config_parser import ConfigParser
+from sdc_tool.dedup import Deduplicator
+from sdc_tool.multi_sink import MultiSink
+from sdc_tool.payload import FilePayload
+from sdc_tool.pipeline import CollectionPipeline
 from sdc_tool.qradar_source import QRadarSource
+from sdc_tool.retry import RetryPolicy
+from sdc_tool.scheduler import DaemonScheduler, RunLock
+from sdc_tool.spool import Spool, SpoolDrainer
+from sdc_tool.state_store import StateStore
+from sdc_tool.window_planner import AdaptiveWindowPlanner
+from sdc_tool.supervisor import PipelineSupervisor
 from sdc_tool.cortex_xdr_source import CortexXDRSource
 from sdc_tool.hdfs_sink import HDFSSink
 from sdc_tool.local_file_sink import LocalFileSink
@@ -17,69 +30,137 @@ from sdc_tool.local_file_sink import LocalFileSink
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
 
+def setup_logging(log_file_path, log_level_str="INFO"):
+    log_level_str = (log_level_str or "INFO").upper()
+    log_level = getattr(logging, log_level_str, logging.INFO)
+
+    # Remove default handlers to avoid duplicate logs
+    for handler in logging.root.handlers[:]:
+        logging.root.removeHandler(handler)
+
+    # File handler
+    if log_file_path:
+        os.makedirs(os.path.dirname(log_file_path), exist_ok=True)
+        file_handler = logging.FileHandler(log_file_path)
+        file_handler.setFormatter(logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s"))
+        logging.root.addHandler(file_handler)
+
+    # Console handler
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
+    logging.root.addHandler(console_handler)
+
+    logging.root.setLevel(log_level)
+    logger.info(f"Logging configured. Level: {log_level_str}, File: {log_file_path or 'N/A'}")
+
+
 class SecurityDataCollector:
-    def __init__(self, config_file):
+    def __init__(self, config_file, connection_pool=None, state_store=None, configure_logging=True, engine=None):
         self.config_parser = ConfigParser(config_file)
         self.config = self.config_parser # Alias for easier access
+        self.connection_pool = connection_pool
 
         self.source_identifier, self.sink_identifier = self.config_parser.get_pipeline_config()
+        self.sink_identifiers = self.config_parser.get_sink_identifiers()
 
-        self._setup_logging()
-        self._initialize_components()
+        if configure_logging:
+            self._setup_logging()
         self.state_file_path = self.config.get("General.state_file_path")
+        self.state_store = state_store or StateStore.for_path(self.state_file_path)
+        # Pipelines sharing a state file need distinct names, e.g. one per QRadar DB or XDR tenant
+        self.pipeline_key = self.config.get("Pipeline.name", f"{self.source_identifier}_{'_'.join(self.sink_identifiers)}")
+        self._initialize_components()
+        self.lock_file_path = self.config.get("General.lock_file_path", f"{self.state_file_path}.{self.pipeline_key}.lock")
+        self.stop_event = threading.Event()
+        self.planner = AdaptiveWindowPlanner(
+            max_events=self.config.getint("General.max_events_per_window", 100000),
+            adaptive=self.config.getboolean("General.adaptive_windows", False),
+            min_window_seconds=self.config.getint("General.min_window_seconds", 60),
+            max_merge_windows=self.config.getint("General.max_merge_windows", 6),
+            history=self.state_store.get(f"{self.pipeline_key}.density"),
+        )
+        # threads: one worker thread per window; asyncio: searches wait on a shared event loop
+        self.collection_engine = self.config.get("General.collection_engine", "threads").strip().lower()
+        if self.collection_engine not in ("threads", "asyncio"):
+            raise ValueError(f"Unsupported collection engine: {self.collection_engine}")
+        self._owns_engine = False
+        self.engine = engine
+        if self.collection_engine == "asyncio" and self.engine is None:
+            self.engine = AsyncCollectionEngine(io_threads=self.config.getint("General.async_io_threads", 4))
+            self._owns_engine = True
+        self.spool = None
+        self.spool_drainer = None
+        if self.config.getboolean("Spool.spool.enabled", False):
+            self._initialize_spool()
+        self.dedup = None
+        if self.config.getboolean("Dedup.dedup.enabled", False):
+            # The index is kept next to the state file, one per pipeline
+            self.dedup = Deduplicator.from_config(self.config, f"{self.state_file_path}.{self.pipeline_key}.dedup")
 
     def _setup_logging(self):
-        log_file_path = self.config.get("General.log_file_path")
-        log_level_str = self.config.get("General.log_level", "INFO").upper()
-        log_level = getattr(logging, log_level_str, logging.INFO)
-
-        # Remove default handlers to avoid duplicate logs
-        for handler in logging.root.handlers[:]:
-            logging.root.removeHandler(handler)
-
-        # File handler
-        if log_file_path:
-            os.makedirs(os.path.dirname(log_file_path), exist_ok=True)
-            file_handler = logging.FileHandler(log_file_path)
-            file_handler.setFormatter(logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s"))
-            logging.root.addHandler(file_handler)
-
-        # Console handler
-        console_handler = logging.StreamHandler()
-        console_handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
-        logging.root.addHandler(console_handler)
-
-        logging.root.setLevel(log_level)
-        logger.info(f"Logging configured. Level: {log_level_str}, File: {log_file_path or 'N/A'}")
+        setup_logging(self.config.get("General.log_file_path"), self.config.get("General.log_level", "INFO"))
 
     def _initialize_components(self):
         # Initialize Source
         if self.source_identifier == "qradar":
-            self.source = QRadarSource(self.config)
+            self.source = QRadarSource(self.config, connection_pool=self.connection_pool)
         elif self.source_identifier == "cortex_xdr":
             self.source = CortexXDRSource(self.config)
         else:
             raise ValueError(f"Unsupported source identifier: {self.source_identifier}")
 
-        # Initialize Sink
-        if self.sink_identifier == "hdfs":
-            self.sink = HDFSSink(self.config)
-        elif self.sink_identifier == "local_file":
-            self.sink = LocalFileSink(self.config)
+        # Initialize Sinks: one fetch is fanned out to every sink of "source > sink1, sink2"
+        self.sinks = {sink_id: self._create_sink(sink_id) for sink_id in self.sink_identifiers}
+        if len(self.sinks) == 1:
+            self.sink = self.sinks[self.sink_identifiers[0]]
         else:
-            raise ValueError(f"Unsupported sink identifier: {self.sink_identifier}")
+            optional = [s.strip() for s in self.config.get("Pipeline.optional_sinks", "").split(",") if s.strip()]
+            self.sink = MultiSink(self.sinks, optional=optional, state_store=self.state_store,
+                                  state_key=f"{self.pipeline_key}.sinks")
+
+    def _create_sink(self, sink_identifier):
+        if sink_identifier == "hdfs":
+            return HDFSSink(self.config, connection_pool=self.connection_pool, pipeline_name=self.pipeline_key)
+        elif sink_identifier == "local_file":
+            return LocalFileSink(self.config, pipeline_name=self.pipeline_key)
+        raise ValueError(f"Unsupported sink identifier: {sink_identifier}")
+
+    def _initialize_spool(self):
+        # Windows are committed to a local spool first and replayed to the sink, so a sink
+        # outage never makes us query QRadar/XDR for the same window again
+        spool_dir = self.config.get("Spool.spool.dir", os.path.join(
+            self.config.get("General.tmp_dir", "./tmp"), "spool", self.pipeline_key))
+        self.spool = Spool(
+            spool_dir,
+            max_size_mb=self.config.getint("Spool.spool.max_size_mb", 10240),
+            eviction=self.config.get("Spool.spool.eviction", "reject").strip().lower(),
+            # Same codec as the sinks, so spooled records are passed through instead of recompressed
+            codec=codec_from_config(self.config),
+        )
+        self.spool_drainer = SpoolDrainer(
+            self.spool, self.sink,
+            retry_policy=RetryPolicy(
+                backoff_base_seconds=self.config.getfloat("Spool.spool.retry_backoff_base_seconds", 5.0),
+                backoff_max_seconds=self.config.getfloat("Spool.spool.retry_backoff_max_seconds", 300.0)),
+            poll_seconds=self.config.getint("Spool.spool.poll_seconds", 30),
+        )
+
+    def drain_spool(self):
+        """Replays spooled windows to the sink; returns how many were written. Failures keep them spooled."""
+        if self.spool is None:
+            return 0
+        try:
+            return self.spool_drainer.drain_once()
+        except Exception as e:
+            logger.error(f"Could not replay spooled windows to {self.sink_identifier}, "
+                         f"{len(self.spool)} stay spooled: {e}")
+            return 0
 
     def _load_last_collection_time(self):
-        if os.path.exists(self.state_file_path):
-            try:
-                with open(self.state_file_path, "r") as f:
-                    state = json.load(f)
-                    # Use the specific pipeline's last collected timestamp
-                    pipeline_key = f"{self.source_identifier}_{self.sink_identifier}"
-                    if pipeline_key in state:
-                        return datetime.fromisoformat(state[pipeline_key])
-            except (json.JSONDecodeError, FileNotFoundError) as e:
-                logger.warning(f"Could not read state file {self.state_file_path}: {e}. Starting from initial timestamp.")
+        # Use the specific pipeline's last collected timestamp
+        last_collected = self.state_store.get(self.pipeline_key)
+        if last_collected:
+            return datetime.fromisoformat(last_collected)
         
         # Fallback to initial_collection_timestamp from config
         if self.source_identifier == "qradar":
@@ -96,21 +177,12 @@ class SecurityDataCollector:
         return datetime(1970, 1, 1) # Default to epoch if nothing else is found
 
     def _save_last_collection_time(self, timestamp: datetime):
-        os.makedirs(os.path.dirname(self.state_file_path), exist_ok=True)
-        state = {}
-        if os.path.exists(self.state_file_path):
-            try:
-                with open(self.state_file_path, "r") as f:
-                    state = json.load(f)
-            except json.JSONDecodeError:
-                logger.warning(f"State file {self.state_file_path} is corrupt. Overwriting.")
-        
-        pipeline_key = f"{self.source_identifier}_{self.sink_identifier}"
-        state[pipeline_key] = timestamp.isoformat()
-
-        with open(self.state_file_path, "w") as f:
-            json.dump(state, f, indent=4)
-        logger.info(f"Saved last collection time ({timestamp}) for pipeline {pipeline_key} to {self.state_file_path}")
+        # The learned event density is saved together with the watermark in a single state update
+        self.state_store.update({
+            self.pipeline_key: timestamp.isoformat(),
+            f"{self.pipeline_key}.density": self.planner.snapshot(),
+        })
+        logger.info(f"Saved last collection time ({timestamp}) for pipeline {self.pipeline_key} to {self.state_file_path}")
 
     def _split_time_windows(self, start_time_ms: int, interval_minutes: int) -> List[Tuple[int, int]]:
         """
@@ -149,100 +221,223 @@ class SecurityDataCollector:
         return result
 
 
+    def _collect_window(self, start_ms: int, end_ms: int):
+        # Blocks that reach max_events_per_window are split and collected as several parts
+        return self.planner.collect(self._collect_part, start_ms, end_ms)
+
+    def _collect_part(self, start_ms: int, end_ms: int):
+        # Thu thập dữ liệu từ source
+        collected_data = self.source.collect_data(datetime.fromtimestamp(start_ms / 1000), datetime.fromtimestamp(end_ms / 1000))
+        if collected_data:
+            logger.info(f"Collected {len(collected_data)} records from {self.source_identifier} ({start_ms} - {end_ms}).")
+        else:
+            logger.info(f"No new data collected from {self.source_identifier} for block {start_ms} - {end_ms}.")
+        return collected_data
+
+    async def _collect_window_async(self, start_ms: int, end_ms: int):
+        return await self.planner.collect_async(self._collect_part_async, start_ms, end_ms)
+
+    async def _collect_part_async(self, start_ms: int, end_ms: int):
+        async with self.engine.limit(self.source.search_quota_key, self.source.max_concurrent_searches):
+            collected_data = await self.source.collect_data_async(
+                datetime.fromtimestamp(start_ms / 1000), datetime.fromtimestamp(end_ms / 1000))
+        if collected_data:
+            logger.info(f"Collected {len(collected_data)} records from {self.source_identifier} ({start_ms} - {end_ms}).")
+        else:
+            logger.info(f"No new data collected from {self.source_identifier} for block {start_ms} - {end_ms}.")
+        return collected_data
+
+    def _write_window(self, start_ms: int, end_ms: int, collected_parts):
+        if not self.config.getboolean("General.write_to_sink", True):
+            return
+        input_type = getattr(self.source, "input_type", "default")
+        # Output is partitioned by the window it was collected for, not by when it was written
+        items = [
+            (collected_data, self.source_identifier, input_type, datetime.fromtimestamp(part_start_ms / 1000))
+            for part_start_ms, _, collected_data in collected_parts if collected_data
+        ]
+        replaces = self.planner.replaced_starts(start_ms)
+        deduped = None
+        if self.dedup is not None:
+            # Events at window edges and from re-queried windows were already written by an earlier window
+            deduped = self.dedup.filter_window(start_ms, items)
+            items = deduped.items
+        try:
+            if self.spool is not None:
+                # The window counts as written once it is durable in the spool; the drainer delivers it
+                self.spool.put(start_ms, end_ms, items, replaces=replaces)
+            else:
+                self.sink.write_window(start_ms, end_ms, items, replaces=replaces)
+        finally:
+            if deduped is not None:
+                deduped.cleanup()
+        if deduped is not None:
+            # Only keys that reached the sink (or the spool) count as seen
+            self.dedup.commit(deduped)
+        # Temp files are only removed once every sink has its copy; on failure they stay for inspection
+        for _, _, collected_data in collected_parts:
+            if isinstance(collected_data, FilePayload) and os.path.exists(collected_data.path):
+                os.remove(collected_data.path)
+
+    def _commit_window(self, start_ms: int, end_ms: int):
+        if self.dedup is not None:
+            # Throttled: an index that lags behind the watermark only drops fewer duplicates
+            self.dedup.save()
+        self._save_last_collection_time(datetime.fromtimestamp(end_ms / 1000))
+        self._prune_manifests(end_ms)
+
+    def _prune_manifests(self, watermark_ms):
+        # Window manifests are never listed on the write path; old ones are dropped here,
+        # at most every manifest_prune_interval_minutes, from a marker kept in the state
+        if not hasattr(self.sink, "prune_manifests"):
+            return
+        marker = f"{self.pipeline_key}.manifests_pruned_at"
+        now_ms = int(time.time() * 1000)
+        interval_ms = self.config.getint("General.manifest_prune_interval_minutes", 60) * 60000
+        pruned_at = self.state_store.get(marker)
+        if pruned_at is not None and now_ms - pruned_at < interval_ms:
+            return
+        retention_ms = self.config.getint("General.manifest_retention_hours", 24) * 3600 * 1000
+        try:
+            self.sink.prune_manifests(watermark_ms - retention_ms)
+        except Exception as e:
+            logger.warning(f"Could not prune window manifests of pipeline {self.pipeline_key}: {e}")
+        self.state_store.set(marker, now_ms)
+
+    def compact(self):
+        """Merges small output files of closed partitions. Returns the number of partitions compacted."""
+        targets = {sink_id: sink for sink_id, sink in self.sinks.items() if hasattr(sink, "compaction_target")}
+        for sink_id in self.sinks.keys() - targets.keys():
+            logger.warning(f"Sink {sink_id} does not support compaction.")
+        if not targets:
+            return 0
+        compact_lock = RunLock(f"{self.lock_file_path}.compact")
+        if not compact_lock.acquire():
+            logger.warning(f"Compaction of pipeline {self.pipeline_key} is already running; skipping.")
+            return 0
+        try:
+            compacted = 0
+            for sink_id, sink in targets.items():
+                fs, roots = sink.compaction_target()
+                state_key = f"{self.pipeline_key}.compaction"
+                compactor = Compactor(
+                    fs, roots, self.state_store,
+                    target_file_size_mb=self.config.getint("Compaction.compaction.target_file_size_mb", 256),
+                    grace_minutes=self.config.getint("Compaction.compaction.grace_minutes", 60),
+                    state_key=state_key if len(self.sinks) == 1 else f"{state_key}.{sink_id}",
+                )
+                compacted += compactor.run()
+            logger.info(f"Compacted {compacted} partitions for pipeline {self.pipeline_key}.")
+            return compacted
+        finally:
+            compact_lock.release()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def close(self):
+        if self.spool_drainer is not None:
+            self.spool_drainer.stop()
+        if self.dedup is not None:
+            self.dedup.save(force=True)
+        if self._owns_engine:
+            self.engine.close()
+        if hasattr(self.sink, "close"):
+            self.sink.close()
+
     def run(self):
         logger.info(f"Starting Security Data Collector for pipeline: {self.source_identifier} > {self.sink_identifier}")
-        
+        run_lock = RunLock(self.lock_file_path)
+        if not run_lock.acquire():
+            logger.warning(f"Another run of pipeline {self.pipeline_key} is still in progress ({self.lock_file_path}); skipping.")
+            return 0
+        try:
+            return self._run_pipeline()
+        finally:
+            if self.dedup is not None:
+                self.dedup.save(force=True)
+            run_lock.release()
+
+    def _run_pipeline(self):
         last_collected_time = self._load_last_collection_time()
         logger.info(f"Last collected time: {last_collected_time}")
 
-        # For simplicity, we'll collect data up to now. In a real scenario, this would be a loop
-        # with a defined collection interval.
         current_time = datetime.now()
-        
-        # Define a collection window (e.g., 1 hour)
-        collection_window_minutes = self.config.get("General.collection_window_minutes", 10) # 1 hour
-        
-        # Break down the collection into smaller blocks if the total time is too large
-        # This logic needs to be refined based on actual requirements for chunking
-        # For now, let's assume a single chunk for demonstration
+        collection_window_minutes = self.config.getint("General.collection_window_minutes", 10)
+
+        # Chia khoảng thời gian cần thu thập thành các block tối đa bằng chu kỳ đồng bộ
         logger.info(f"Building time blocks for collection from {last_collected_time} to {current_time} with interval {collection_window_minutes} minutes.")
-        time_blocks = self._split_time_windows(int(last_collected_time.timestamp() * 1000), int(collection_window_minutes))
+        time_blocks = self._split_time_windows(int(last_collected_time.timestamp() * 1000), collection_window_minutes)
+        time_blocks = self.planner.plan(time_blocks)
         logger.info(f"Time blocks for collection: {time_blocks}")
-        
-        # Example: Collect data in 1-hour chunks
-        # The actual chunking logic should be based on 'chu kỳ đồng bộ' and 'giới hạn ngưỡng số event tối đa'
-        # as described in the requirements.
-        # Lấy thời gian bắt đầu (ms)
-
-        for start_ms, end_ms in time_blocks:
-            try:
-                # Thu thập dữ liệu từ source
-                collected_data = self.source.collect_data(datetime.fromtimestamp(start_ms / 1000),datetime.fromtimestamp( end_ms / 1000))
-                if collected_data:
-                    logger.info(f"Collected {len(collected_data)} records from {self.source_identifier} ({start_ms} - {end_ms}).")
-                    # self.sink.write_data(
-                    #     collected_data,
-                    #     self.source_identifier,
-                    #     getattr(self.source, "input_type", "default")
-                    # )
-                    self._save_last_collection_time(end_ms)
-                else:
-                    logger.info(f"No new data collected from {self.source_identifier} for block {start_ms} - {end_ms}.")
-            except Exception as e:
-                logger.error(f"Error during data collection or sinking for block {start_ms} - {end_ms}: {e}")
-
-        
-        # For this iteration, we'll just collect one chunk from last_collected_time to current_time
-        # In a real application, this would be a loop processing time blocks.
-        
-        # This is a simplified approach. The actual implementation should consider:
-        # - Configurable sync cycle
-        # - Max event threshold
-        # - Handling API rate limits and pagination
-        
-        # For now, let's collect data from the last collected time up to the current time
-        # in one go, or in chunks if the time difference is large.
-        
-        # Let's assume a fixed interval for now, e.g., 1 hour or until current time
-        # This needs to be driven by the 'chu kỳ đồng bộ' from the config.
-        # The config doesn't explicitly define 'chu kỳ đồng bộ' as a general setting,
-        # but mentions it in the 'Mô hình triển khai' section.
-        # For now, let's just collect from last_collected_time to current_time.
-        
-        # Placeholder for actual collection loop based on sync cycle and event limits
-        # For this example, we'll just do one collection run.
-        
-        # The requirement states: 
 
+        # Windows are collected concurrently and handed to the sink stage in order; the
+        # watermark only moves past a window once every earlier window has been written,
+        # so a failed window is retried on the next run instead of being skipped.
+        pipeline = CollectionPipeline(
+            collect_fn=self._collect_window,
+            write_fn=self._write_window,
+            commit_fn=self._commit_window,
+            max_parallel_windows=self.config.getint("General.max_parallel_windows", 1),
+            queue_size=self.config.getint("General.pipeline_queue_size", 2),
+            stop_event=self.stop_event,
+            engine=self.engine if self.collection_engine == "asyncio" else None,
+            async_collect_fn=self._collect_window_async,
+        )
+        logger.info(f"Collecting {len(time_blocks)} time blocks with up to {pipeline.max_parallel_windows} in parallel.")
+        committed = pipeline.run(time_blocks)
+        self.last_run_stats = pipeline.stats()
+        logger.info(f"Committed {committed} of {len(time_blocks)} time blocks.")
+        if self.spool is not None and not self.spool_drainer.running:
+            # One-shot runs deliver what they spooled before exiting; the daemon drains in the background
+            self.drain_spool()
+        return committed
+
+class _CompactionJob:
+    """Adapts ``SecurityDataCollector.compact`` to the scheduler's ``run`` interface."""
+
+    def __init__(self, collector):
+        self.collector = collector
 
-        # "người dùng cấu hình chu kỳ đồng bộ, tại thời điểm ứng dụng khởi chạy thực hiện đọc thời điểm đồng bộ thành công trước đó đã lưu file, tính thời điểm gần nhất theo chu kỳ đồng bộ, chia khung thời gian đồng truy vấn đồng bộ theo các block thời gian với khung tối đa bằng chu kỳ đồng bộ và thực hiện kéo dữ liệu lần lượt trong từng khung thời gian với cấu hình giới hạn ngưỡng số event tối đa cấu hình trước."
-
-        # For simplicity in this initial implementation, we will collect data from the last collected time
-        # up to the current time in one go. A more robust implementation would involve:
-        # 1. Reading a 'sync_interval_seconds' from config.ini (not yet defined in example config)
-        # 2. Iteratively collecting data in chunks up to 'sync_interval_seconds' or until current_time
-        # 3. Handling 'max_event_threshold' (not yet defined in example config) for each API call
-
-        # For now, let's assume a simple one-time collection from last_collected_time to now.
-        # The actual chunking and thresholding will be more complex and depend on the API limits.
+    def run(self):
+        return self.collector.compact()
 
-        # try:
-        #     collected_data = self.source.collect_data(last_collected_time, current_time)
-        #     if collected_data:
-        #         logger.info(f"Collected {len(collected_data)} records from {self.source_identifier}.")
-        #         self.sink.write_data(collected_data, self.source_identifier, self.source.input_type if hasattr(self.source, 'input_type') else 'default')
-        #         self._save_last_collection_time(current_time)
-        #     else:
-        #         logger.info(f"No new data collected from {self.source_identifier}.")
-        # except Exception as e:
-        #     logger.error(f"Error during data collection or sinking: {e}")
 
 def main():
     import argparse
     parser = argparse.ArgumentParser(description="Security Data Collector")
     parser.add_argument("--config", type=str, default="config.ini", help="Path to the configuration file")
+    subparsers = parser.add_subparsers(dest="command")
+    run_parser = subparsers.add_parser("run", help="Collect data for the configured pipeline (default)")
+    run_parser.add_argument("--config", type=str, default=argparse.SUPPRESS, help="Path to the configuration file")
+    run_parser.add_argument("--daemon", action="store_true",
+                            help="Keep running and collect on every collection_window_minutes boundary")
+    compact_parser = subparsers.add_parser("compact", help="Merge small output files of closed partitions")
+    compact_parser.add_argument("--config", type=str, default=argparse.SUPPRESS, help="Path to the configuration file")
+    supervise_parser = subparsers.add_parser("supervise", help="Run every pipeline config in a directory in one process")
+    supervise_parser.add_argument("--config-dir", type=str, required=True, help="Directory containing pipeline *.ini files")
+    supervise_parser.add_argument("--once", action="store_true", help="Run every pipeline once and exit instead of scheduling them")
+    supervise_parser.add_argument("--max-concurrent-pipelines", type=int, default=4,
+                                  help="Maximum number of pipelines collecting at the same time")
+    supervise_parser.add_argument("--pool-size", type=int, default=10, help="HTTP connections kept per remote host")
+    supervise_parser.add_argument("--io-threads", type=int, default=8,
+                                  help="Threads for blocking API calls of pipelines using the asyncio engine")
+    supervise_parser.add_argument("--log-file", type=str, default=None, help="Path to the supervisor log file")
+    supervise_parser.add_argument("--log-level", type=str, default="INFO", help="Log level")
     args = parser.parse_args()
 
+    if args.command == "supervise":
+        setup_logging(args.log_file, args.log_level)
+        supervisor = PipelineSupervisor(args.config_dir, max_concurrent_pipelines=args.max_concurrent_pipelines,
+                                        pool_size=args.pool_size, io_threads=args.io_threads)
+        if args.once:
+            supervisor.run_once()
+            return
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, lambda signum, frame: supervisor.stop())
+        supervisor.run_forever()
+        return
+
     # Ensure the config file exists for the initial run
     if not os.path.exists(args.config):
         # If config.ini doesn't exist, try to use config.ini.example
@@ -256,7 +451,47 @@ def main():
             exit(1)
 
     sdc = SecurityDataCollector(args.config)
-    sdc.run()
+    if args.command == "compact":
+        try:
+            sdc.compact()
+        finally:
+            sdc.close()
+        return
+    if not getattr(args, "daemon", False):
+        try:
+            sdc.run()
+        finally:
+            sdc.close()
+        return
+
+    scheduler = DaemonScheduler(
+        sdc,
+        interval_minutes=sdc.config.getint("General.collection_window_minutes", 10),
+        delay_seconds=sdc.config.getint("General.schedule_delay_seconds", 30),
+        stop_event=sdc.stop_event,
+    )
+    # SIGTERM/SIGINT only stop new windows from starting; windows in flight are finished and committed.
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda signum, frame: scheduler.stop())
+    compaction_thread = None
+    if sdc.config.getboolean("Compaction.compaction.enabled", False):
+        # Background stage: compact closed partitions on its own, slower schedule
+        compaction_scheduler = DaemonScheduler(
+            _CompactionJob(sdc),
+            interval_minutes=sdc.config.getint("Compaction.compaction.interval_minutes", 60),
+            delay_seconds=sdc.config.getint("Compaction.compaction.delay_seconds", 300),
+            stop_event=sdc.stop_event,
+        )
+        compaction_thread = threading.Thread(target=compaction_scheduler.run_forever, name="sdc-compaction")
+        compaction_thread.start()
+    if sdc.spool_drainer is not None:
+        sdc.spool_drainer.start()
+    try:
+        scheduler.run_forever()
+    finally:
+        if compaction_thread is not None:
+            compaction_thread.join()
+        sdc.close()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,106 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class MultiSinkError(Exception):
+    """Raised when a required sink failed to write a window."""
+
+    def __init__(self, failures):
+        self.failures = failures
+        super().__init__("; ".join(f"{name}: {error}" for name, error in failures.items()))
+
+
+class MultiSink:
+    """Writes every collected window to several sinks at once, from a single fetch.
+
+    The sinks write concurrently, each from the same temp files, which stay in place
+    until all of them are done. A window only counts as written once every required
+    sink accepted it; a failed optional sink is logged and skipped. The last window
+    each sink committed is kept in the state store under ``state_key``, so a window
+    retried after a partial failure is only written to the sinks that do not have it yet.
+    """
+
+    def __init__(self, sinks, optional=(), state_store=None, state_key=None):
+        self.sinks = dict(sinks)
+        unknown = set(optional) - set(self.sinks)
+        if unknown:
+            raise ValueError(f"Optional sinks not in the pipeline: {', '.join(sorted(unknown))}")
+        self.optional = set(optional)
+        self.state_store = state_store
+        self.state_key = state_key
+        self.last_status = {}
+        self._executor = ThreadPoolExecutor(max_workers=len(self.sinks), thread_name_prefix="sdc-sink")
+        self._state_lock = threading.Lock()
+
+    def _committed(self):
+        if self.state_store is None or self.state_key is None:
+            return {}
+        return dict(self.state_store.get(self.state_key) or {})
+
+    def _save_committed(self, names, end_ms):
+        if self.state_store is None or self.state_key is None or not names:
+            return
+        with self._state_lock:
+            committed = self._committed()
+            committed.update({name: end_ms for name in names})
+            self.state_store.set(self.state_key, committed)
+
+    def _fan_out(self, call, names):
+        futures = {name: self._executor.submit(call, self.sinks[name]) for name in names}
+        # Wait for every sink, so none still reads the temp files when the caller removes them
+        return {name: future.exception() for name, future in futures.items()}
+
+    def _finish(self, results, status):
+        failures = {}
+        for name, error in results.items():
+            if error is None:
+                status[name] = "ok"
+                continue
+            status[name] = f"failed: {error}"
+            if name in self.optional:
+                logger.warning(f"Optional sink {name} failed, continuing without it: {error}")
+            else:
+                logger.error(f"Sink {name} failed: {error}")
+                failures[name] = error
+        self.last_status = status
+        return failures
+
+    def write_window(self, start_ms, end_ms, items, replaces=()):
+        """Writes the items of one window to every sink that has not committed it yet."""
+        committed = self._committed()
+        status = {name: "skipped" for name in self.sinks if committed.get(name, -1) >= end_ms}
+        pending = [name for name in self.sinks if name not in status]
+        if status:
+            logger.info(f"Window {start_ms} - {end_ms} already written to {', '.join(sorted(status))}.")
+        results = self._fan_out(lambda sink: sink.write_window(start_ms, end_ms, items, replaces=replaces), pending)
+        failures = self._finish(results, status)
+        self._save_committed([name for name, error in results.items() if error is None], end_ms)
+        logger.info(f"Window {start_ms} - {end_ms} sink status: {self.last_status}")
+        if failures:
+            raise MultiSinkError(failures)
+
+    def write_many(self, items):
+        failures = self._finish(self._fan_out(lambda sink: sink.write_many(items), list(self.sinks)), {})
+        if failures:
+            raise MultiSinkError(failures)
+
+    def write_data(self, data, source_identifier, input_type, window_start=None):
+        self.write_many([(data, source_identifier, input_type, window_start)])
+
+    def prune_manifests(self, before_ms):
+        deleted = 0
+        for name, sink in self.sinks.items():
+            try:
+                deleted += sink.prune_manifests(before_ms)
+            except Exception as e:
+                logger.warning(f"Could not prune window manifests of sink {name}: {e}")
+        return deleted
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        for sink in self.sinks.values():
+            if hasattr(sink, "close"):
+                sink.close()
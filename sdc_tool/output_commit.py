@@ -0,0 +1,162 @@
+import json
+import logging
+import os
+import re
+import threading
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_DIR = "_manifests"
+TEMP_DIR = "_temporary"
+
+
+def _safe(part):
+    return re.sub(r"[^A-Za-z0-9._-]+", "-", str(part))
+
+
+def window_file_stem(prefix, pipeline, start_ms=None, end_ms=None):
+    """``<prefix>_<pipeline>_<start_ms>_<end_ms>``; empty parts are left out."""
+    return "_".join(_safe(part) for part in (prefix, pipeline, start_ms, end_ms) if part not in (None, ""))
+
+
+class WindowCommit:
+    """Output files of one window, staged under temporary names and published together.
+
+    File names come from the pipeline, the bounds of the (sub-)window the data was
+    collected for and a part number, e.g. ``data_qradar_hdfs_1704067200000_1704067800000_part0000.json.gz``.
+    Writing a window again (a retry, a replay from the spool, a re-run after a crash)
+    replaces the earlier files instead of adding new ones. Manifests are keyed by the
+    window start. A re-plan can merge windows (``adaptive_windows``) that were already
+    published separately before a crash, and their files get other names; the starts
+    of those windows are passed as ``replaces`` and their files are replaced too.
+
+    Files are written to ``_temporary/`` next to their final place. ``commit`` renames
+    them into place and keeps a manifest per output root in
+    ``_manifests/<prefix>_<pipeline>_<start_ms>.json``. The manifest is written once,
+    before the renames, so every published file of the window is always listed in it;
+    files of an earlier attempt that this attempt did not produce again are removed.
+    Manifests are only read by their names, never listed; ``delete_manifests_before``
+    drops old ones.
+    """
+
+    def __init__(self, fs, start_ms, end_ms, pipeline=None, prefix="data", replaces=()):
+        self.fs = fs
+        self.start_ms = start_ms
+        self.end_ms = end_ms
+        self.pipeline = pipeline
+        self.prefix = prefix
+        self.replaces = sorted(start for start in set(replaces) if start_ms < start < end_ms)
+        self._staged = {}
+        self._lock = threading.Lock()
+
+    def stager(self, root, start_ms, end_ms):
+        """Names the files of one item collected for ``start_ms`` - ``end_ms``, written under ``root``."""
+        return _ItemStager(self, root, window_file_stem(self.prefix, self.pipeline, start_ms, end_ms))
+
+    def _add(self, root, temp_path, final_path):
+        with self._lock:
+            self._staged.setdefault(root, []).append((temp_path, final_path))
+
+    def _manifest_path(self, root, start_ms=None):
+        start_ms = self.start_ms if start_ms is None else start_ms
+        return os.path.join(root, MANIFEST_DIR, f"{window_file_stem(self.prefix, self.pipeline, start_ms)}.json")
+
+    def _manifest_files(self, path):
+        """Files listed in the manifest at ``path``, or None if there is none."""
+        text = self.fs.read_text(path)
+        if text is None:
+            return None
+        try:
+            return set(json.loads(text).get("files", []))
+        except ValueError:
+            logger.warning(f"Ignoring unreadable manifest {path}.")
+            return set()
+
+    def _write_manifest(self, root, files):
+        path = self._manifest_path(root)
+        temp_path = os.path.join(os.path.dirname(path), TEMP_DIR, os.path.basename(path))
+        self.fs.write_text(temp_path, json.dumps({
+            "pipeline": self.pipeline,
+            "start_ms": self.start_ms,
+            "end_ms": self.end_ms,
+            "written_at": datetime.now().isoformat(),
+            "files": files,
+        }, indent=2))
+        self.fs.replace(temp_path, path)
+
+    def commit(self):
+        """Publishes the staged files; returns how many there were."""
+        published = 0
+        for root, staged in sorted(self._staged.items()):
+            files = sorted(os.path.relpath(final_path, root) for _, final_path in staged)
+            previous = self._manifest_files(self._manifest_path(root)) or set()
+            replaced = []
+            for start_ms in self.replaces:
+                path = self._manifest_path(root, start_ms)
+                replaced_files = self._manifest_files(path)
+                if replaced_files is not None:
+                    previous |= replaced_files
+                    replaced.append(path)
+            for stale in sorted(previous - set(files)):
+                logger.info(f"Removing {stale} left by an earlier attempt at window {self.start_ms} - {self.end_ms}.")
+                self.fs.delete(os.path.join(root, stale))
+            self._write_manifest(root, files)
+            for path in replaced:
+                self.fs.delete(path)
+            for temp_path, final_path in staged:
+                self.fs.replace(temp_path, final_path)
+            for temp_dir in sorted({os.path.dirname(temp_path) for temp_path, _ in staged}):
+                self.fs.remove_empty_dir(temp_dir)
+            published += len(staged)
+        return published
+
+    def abort(self):
+        """Removes the staged files after a failed write; published files of earlier attempts stay."""
+        for staged in self._staged.values():
+            for temp_path, _ in staged:
+                try:
+                    self.fs.delete(temp_path)
+                except Exception as e:
+                    logger.warning(f"Could not remove staged file {temp_path}: {e}")
+            for temp_dir in sorted({os.path.dirname(temp_path) for temp_path, _ in staged}):
+                self.fs.remove_empty_dir(temp_dir)
+        self._staged = {}
+
+
+def delete_manifests_before(fs, root, prefix, pipeline, before_ms):
+    """Deletes the manifests under ``root`` of the windows of ``pipeline`` that started before ``before_ms``.
+
+    Only the manifests go, the published files stay; such a window can no longer replace
+    its files when it is written again. Returns how many manifests were deleted.
+    """
+    manifest_dir = os.path.join(root, MANIFEST_DIR)
+    if not fs.exists(manifest_dir):
+        return 0
+    pattern = re.compile(rf"{re.escape(window_file_stem(prefix, pipeline))}_(\d+)\.json")
+    deleted = 0
+    for name in fs.list_files(manifest_dir):
+        match = pattern.fullmatch(name)
+        if match and int(match.group(1)) < before_ms:
+            fs.delete(os.path.join(manifest_dir, name))
+            deleted += 1
+    return deleted
+
+
+class _ItemStager:
+    """Hands out the ``(temp_path, final_path)`` of each file of one item, numbered per output directory."""
+
+    def __init__(self, commit, root, stem):
+        self.commit = commit
+        self.root = root
+        self.stem = stem
+        self._parts = {}
+
+    def new_paths(self, output_dir, extension):
+        part = self._parts.get(output_dir, 0)
+        self._parts[output_dir] = part + 1
+        filename = f"{self.stem}_part{part:04d}{extension}"
+        temp_path = os.path.join(output_dir, TEMP_DIR, filename)
+        final_path = os.path.join(output_dir, filename)
+        self.commit._add(self.root, temp_path, final_path)
+        return temp_path, final_path
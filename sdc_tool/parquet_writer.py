@@ -0,0 +1,180 @@
+import json
+import logging
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow is optional: pip install security_data_collector[parquet]
+    pa = pq = None
+
+logger = logging.getLogger(__name__)
+
+COMPRESSIONS = ("snappy", "zstd", "gzip", "lz4", "brotli", "none")
+
+
+def require_pyarrow():
+    if pa is None:
+        raise ImportError("output_format = parquet requires pyarrow. "
+                          "Install it with: pip install security_data_collector[parquet]")
+
+
+class _CountingStream:
+    """Minimal writable stream for ``pyarrow.PythonFile`` that counts the bytes written."""
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.bytes_written = 0
+        self.closed = False
+
+    def write(self, data):
+        self.fileobj.write(data)
+        self.bytes_written += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.bytes_written
+
+    def flush(self):
+        flush = getattr(self.fileobj, "flush", None)
+        if flush is not None:
+            flush()
+
+    def close(self):
+        # The underlying file belongs to the caller's context manager
+        self.closed = True
+
+
+class RollingParquetWriter:
+    """Streams records into Parquet files, one row group per ``row_group_size`` records.
+
+    Same contract as ``RollingGzipWriter``: ``open_file(index)`` returns a context manager
+    yielding a binary file object, and a new file is started once ``max_records`` records
+    or ``max_bytes`` bytes (checked after each row group) are reached.
+
+    The schema is inferred from the first row group. Ariel and XQL results do not all
+    carry the same fields, so when a later row group brings new fields the schema is
+    widened: the current file is closed and the next one is written with the merged
+    schema (readers merge the file schemas by column name). Earlier fields missing from
+    a row group are written as nulls. A field whose values turn out to have
+    incompatible types (e.g. a number in one event, text in another) is stored as a
+    JSON string column from then on.
+    """
+
+    def __init__(self, open_file, max_records=0, max_bytes=0, row_group_size=100000, compression="snappy"):
+        require_pyarrow()
+        compression = (compression or "none").lower()
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Unsupported parquet compression: {compression}. Expected one of {', '.join(COMPRESSIONS)}.")
+        self.open_file = open_file
+        self.max_records = max(0, int(max_records or 0))
+        self.max_bytes = max(0, int(max_bytes or 0))
+        self.row_group_size = max(1, int(row_group_size))
+        self.compression = compression
+        self.schema = None
+        self._stringified = set()
+
+    @staticmethod
+    def _decode(record):
+        if isinstance(record, (bytes, str)):
+            return json.loads(record)
+        return record
+
+    def _normalize(self, batch):
+        if not self._stringified:
+            return batch
+        for record in batch:
+            for name in self._stringified.intersection(record):
+                value = record[name]
+                if value is not None and not isinstance(value, str):
+                    record[name] = json.dumps(value)
+        return batch
+
+    def _merge(self, batch_schema):
+        """Returns the current schema widened with ``batch_schema``, stringifying conflicting fields."""
+        if self.schema is None:
+            return batch_schema
+        try:
+            return pa.unify_schemas([self.schema, batch_schema], promote_options="permissive")
+        except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError):
+            pass
+        fields = {field.name: field for field in self.schema}
+        for field in batch_schema:
+            current = fields.get(field.name)
+            if current is None:
+                fields[field.name] = field
+            elif current.type != field.type and not pa.types.is_null(field.type):
+                if pa.types.is_null(current.type):
+                    fields[field.name] = field
+                else:
+                    logger.warning(f"Field {field.name} has conflicting types {current.type} and {field.type}; "
+                                   "storing it as a JSON string.")
+                    self._stringified.add(field.name)
+                    fields[field.name] = pa.field(field.name, pa.string())
+        return pa.schema(list(fields.values()))
+
+    @staticmethod
+    def _mixed_fields(batch):
+        kinds = {}
+        for record in batch:
+            for name, value in record.items():
+                if value is not None:
+                    kind = float if isinstance(value, int) and not isinstance(value, bool) else type(value)
+                    kinds.setdefault(name, set()).add(kind)
+        return {name for name, types in kinds.items() if len(types) > 1}
+
+    def _to_table(self, batch):
+        batch = self._normalize(batch)
+        try:
+            batch_schema = pa.Table.from_pylist(batch).schema
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            # The same field holds different types within this batch
+            for name in self._mixed_fields(batch) - self._stringified:
+                logger.warning(f"Field {name} has values of different types; storing it as a JSON string.")
+                self._stringified.add(name)
+            batch = self._normalize(batch)
+            batch_schema = pa.Table.from_pylist(batch).schema
+        schema = self._merge(batch_schema)
+        # Merging may have found fields to store as strings
+        batch = self._normalize(batch)
+        return pa.Table.from_pylist(batch, schema=schema), schema
+
+    def _next_table(self, iterator, limit):
+        batch = []
+        for record in iterator:
+            batch.append(self._decode(record))
+            if len(batch) >= limit:
+                break
+        return self._to_table(batch) if batch else (None, None)
+
+    def _limit(self, count):
+        if self.max_records:
+            return min(self.row_group_size, self.max_records - count)
+        return self.row_group_size
+
+    def write(self, records):
+        """Writes ``records``; returns a list of ``(record_count, bytes)`` per file."""
+        files = []
+        iterator = iter(records)
+        table, schema = self._next_table(iterator, self._limit(0))
+        while table is not None:
+            self.schema = schema
+            with self.open_file(len(files)) as fileobj:
+                stream = _CountingStream(fileobj)
+                count = 0
+                writer = pq.ParquetWriter(pa.PythonFile(stream, mode="w"), self.schema,
+                                          compression=None if self.compression == "none" else self.compression)
+                try:
+                    while True:
+                        writer.write_table(table)
+                        count += table.num_rows
+                        full = ((self.max_records and count >= self.max_records) or
+                                (self.max_bytes and stream.bytes_written >= self.max_bytes))
+                        table, schema = self._next_table(iterator, self._limit(0 if full else count))
+                        # A full file, the end of the records, or new fields (the next file gets the wider schema)
+                        if full or table is None or not schema.equals(self.schema):
+                            break
+                finally:
+                    writer.close()
+            files.append((count, stream.bytes_written))
+            logger.debug(f"Closed parquet file #{len(files)} with {count} records, {stream.bytes_written} bytes.")
+        return files
@@ -0,0 +1,144 @@
+import contextlib
+import json
+import logging
+import os
+import tempfile
+from datetime import datetime
+
+from sdc_tool.compression import GzipCodec
+from sdc_tool.payload import FilePayload
+
+logger = logging.getLogger(__name__)
+
+# Thư mục phân vùng theo kiểu Hive để Hive/Spark/Impala bỏ qua các phân vùng không cần đọc
+LAYOUTS = {
+    "hourly": "dt=%Y%m%d/hr=%H",
+    "daily": "dt=%Y%m%d",
+    "legacy": "%Y%m%d",
+}
+
+
+def parse_event_time(value):
+    """Converts an event timestamp (epoch seconds/milliseconds or ISO 8601 string) to a local naive datetime.
+
+    Returns None if the value cannot be interpreted as a timestamp.
+    """
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, str):
+        value = value.strip()
+        try:
+            value = float(value)
+        except ValueError:
+            try:
+                parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+            except ValueError:
+                return None
+            return parsed.astimezone().replace(tzinfo=None) if parsed.tzinfo else parsed
+    if isinstance(value, (int, float)):
+        # QRadar starttime and XQL _time are epoch milliseconds
+        seconds = value / 1000 if abs(value) >= 1e11 else value
+        try:
+            return datetime.fromtimestamp(seconds)
+        except (OverflowError, OSError, ValueError):
+            return None
+    return None
+
+
+class Partitioner:
+    """Maps collected data to the partition directories it belongs in.
+
+    By default everything collected for a window goes to the partition of the window
+    start, so a backfill lands where the data belongs rather than in today's directory.
+    When ``field`` is set, each record is placed by its own event timestamp instead
+    (records without a usable timestamp fall back to the window start); this needs the
+    records to be decoded and is therefore slower. The split files are written with
+    ``codec`` (the sink's), so a sink can take them as they are.
+    """
+
+    def __init__(self, layout="hourly", field=None, tmp_dir=None, codec=None):
+        if layout not in LAYOUTS:
+            raise ValueError(f"Unsupported partition_layout: {layout}. Expected one of {', '.join(LAYOUTS)}.")
+        self.layout = layout
+        self.field = field or None
+        self.tmp_dir = tmp_dir
+        self.codec = codec or GzipCodec()
+
+    @classmethod
+    def from_config(cls, config, codec=None):
+        return cls(
+            layout=(config.get("General.partition_layout", "hourly") or "hourly").strip().lower(),
+            field=(config.get("General.partition_field", "") or "").strip() or None,
+            tmp_dir=config.get("General.tmp_dir", None),
+            codec=codec,
+        )
+
+    def path_for(self, timestamp):
+        return timestamp.strftime(LAYOUTS[self.layout])
+
+    @staticmethod
+    def window_start(data, window_start=None):
+        if window_start is None and isinstance(data, FilePayload):
+            window_start = data.start_time
+        if window_start is None:
+            logger.warning("Window start unknown; partitioning by the current time.")
+            return datetime.now()
+        if isinstance(window_start, (int, float)):
+            return datetime.fromtimestamp(window_start / 1000)
+        return window_start
+
+    def _event_time(self, record):
+        if isinstance(record, (bytes, str)):
+            try:
+                record = json.loads(record)
+            except ValueError:
+                return None
+        if not isinstance(record, dict):
+            return None
+        return parse_event_time(record.get(self.field))
+
+    @contextlib.contextmanager
+    def split(self, data, window_start=None):
+        """Yields a list of ``(partition, data)`` pairs for ``data`` collected in the given window.
+
+        ``window_start`` is a datetime or epoch milliseconds; for a ``FilePayload`` its own
+        ``start_time`` is used when omitted. Temporary files created while splitting records
+        by event time are removed when the context exits.
+        """
+        default = self.path_for(self.window_start(data, window_start))
+        if not self.field or isinstance(data, bytes):
+            # Already compressed bytes cannot be split without decompressing them; kept whole
+            yield [(default, data)]
+            return
+
+        if self.tmp_dir:
+            os.makedirs(self.tmp_dir, exist_ok=True)
+        records = data.iter_records() if isinstance(data, FilePayload) else data
+        files, counts = {}, {}
+        try:
+            for record in records:
+                event_time = self._event_time(record)
+                partition = self.path_for(event_time) if event_time is not None else default
+                if partition not in files:
+                    fd, path = tempfile.mkstemp(prefix="sdc_partition_", suffix=f".json{self.codec.extension}",
+                                                dir=self.tmp_dir)
+                    os.close(fd)
+                    files[partition] = (path, self.codec.open(path, "wb"))
+                    counts[partition] = 0
+                if isinstance(record, str):
+                    record = record.encode("utf-8")
+                elif not isinstance(record, bytes):
+                    record = json.dumps(record).encode("utf-8")
+                files[partition][1].write(record if record.endswith(b"\n") else record + b"\n")
+                counts[partition] += 1
+            for _, writer in files.values():
+                writer.close()
+            if len(files) > 1:
+                logger.info(f"Split {sum(counts.values())} records by {self.field} into {len(files)} partitions.")
+            yield [(partition, FilePayload(path, counts[partition], codec=self.codec.name))
+                   for partition, (path, _) in sorted(files.items())]
+        finally:
+            for path, writer in files.values():
+                writer.close()
+                if os.path.exists(path):
+                    os.remove(path)
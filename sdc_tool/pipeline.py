@@ -0,0 +1,178 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+_END_OF_WINDOWS = object()
+
+
+class StageTimings:
+    """Wall-clock accounting for one pipeline stage.
+
+    ``busy_seconds`` is time spent doing the stage's own work, ``wait_seconds`` is
+    time the stage sat idle on the hand-off queue (blocked by backpressure for the
+    source stage, starved of input for the sink stage).
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.busy_seconds = 0.0
+        self.wait_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add_busy(self, seconds):
+        with self._lock:
+            self.count += 1
+            self.busy_seconds += seconds
+
+    def add_wait(self, seconds):
+        with self._lock:
+            self.wait_seconds += seconds
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                "count": self.count,
+                "busy_seconds": round(self.busy_seconds, 3),
+                "avg_seconds": round(self.busy_seconds / self.count, 3) if self.count else 0.0,
+                "wait_seconds": round(self.wait_seconds, 3),
+            }
+
+    def __str__(self):
+        stats = self.as_dict()
+        return (f"{self.name}: {stats['count']} windows, busy {stats['busy_seconds']}s "
+                f"(avg {stats['avg_seconds']}s), waiting {stats['wait_seconds']}s")
+
+
+class CollectionPipeline:
+    """Runs time windows through a source stage and a sink stage connected by a bounded queue.
+
+    The source stage collects up to ``max_parallel_windows`` windows at once and hands
+    them to the sink stage in window order. With an ``AsyncCollectionEngine`` the windows
+    are collected by ``async_collect_fn`` on the engine's event loop instead of by a
+    thread each. At most ``queue_size`` collected windows wait
+    for the sink, so a slow sink throttles the source instead of piling up temp files.
+    The sink stage writes each window and then commits it, strictly in order; the first
+    failure stops the pipeline so no later window is committed past it.
+    """
+
+    def __init__(self, collect_fn, write_fn, commit_fn, max_parallel_windows=1, queue_size=2, stop_event=None,
+                 engine=None, async_collect_fn=None):
+        if engine is not None and async_collect_fn is None:
+            raise ValueError("async_collect_fn is required when an engine is given")
+        self.collect_fn = collect_fn
+        self.async_collect_fn = async_collect_fn
+        self.engine = engine
+        self.write_fn = write_fn
+        self.commit_fn = commit_fn
+        self.max_parallel_windows = max(1, int(max_parallel_windows))
+        self.queue_size = max(1, int(queue_size))
+        self.stop_event = stop_event or threading.Event()
+        self.source_timings = StageTimings("source")
+        self.sink_timings = StageTimings("sink")
+        self._failed = threading.Event()
+
+    def stats(self):
+        return {
+            "source": self.source_timings.as_dict(),
+            "sink": self.sink_timings.as_dict(),
+        }
+
+    def _timed_collect(self, start_ms, end_ms):
+        started = time.monotonic()
+        try:
+            return self.collect_fn(start_ms, end_ms)
+        finally:
+            self.source_timings.add_busy(time.monotonic() - started)
+
+    async def _timed_collect_async(self, start_ms, end_ms):
+        started = time.monotonic()
+        try:
+            return await self.async_collect_fn(start_ms, end_ms)
+        finally:
+            self.source_timings.add_busy(time.monotonic() - started)
+
+    def _submit(self, executor, start_ms, end_ms):
+        if self.engine is not None:
+            return self.engine.submit(self._timed_collect_async(start_ms, end_ms))
+        return executor.submit(self._timed_collect, start_ms, end_ms)
+
+    def _put(self, handoff, item):
+        # Poll so that a failing sink stage can release a source stage blocked on a full queue.
+        started = time.monotonic()
+        try:
+            while not self._failed.is_set():
+                try:
+                    handoff.put(item, timeout=0.5)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+        finally:
+            self.source_timings.add_wait(time.monotonic() - started)
+
+    def _dispatch(self, executor, handoff, time_blocks):
+        try:
+            for start_ms, end_ms in time_blocks:
+                if self.stop_event.is_set() or self._failed.is_set():
+                    logger.info(f"Not starting block {start_ms} - {end_ms}; pipeline is stopping.")
+                    break
+                future = self._submit(executor, start_ms, end_ms)
+                if not self._put(handoff, ((start_ms, end_ms), future)):
+                    future.cancel()
+                    break
+        finally:
+            # The sentinel must always arrive, otherwise the sink stage would wait forever.
+            while True:
+                try:
+                    handoff.put(_END_OF_WINDOWS, timeout=0.5)
+                    break
+                except queue.Full:
+                    self._discard_one(handoff)
+
+    @staticmethod
+    def _discard_one(handoff):
+        try:
+            _, future = handoff.get_nowait()
+            future.cancel()
+        except queue.Empty:
+            pass
+
+    def run(self, time_blocks):
+        """Collects, writes and commits ``time_blocks``. Returns the number of committed windows."""
+        # Futures in the queue include windows still being collected, so the bound has to
+        # leave room for max_parallel_windows of them on top of queue_size finished ones.
+        handoff = queue.Queue(maxsize=self.max_parallel_windows + self.queue_size - 1)
+        committed = 0
+        with ThreadPoolExecutor(max_workers=self.max_parallel_windows, thread_name_prefix="sdc-source") as executor:
+            dispatcher = threading.Thread(target=self._dispatch, args=(executor, handoff, time_blocks),
+                                          name="sdc-dispatcher", daemon=True)
+            dispatcher.start()
+            while True:
+                waited = time.monotonic()
+                item = handoff.get()
+                if item is _END_OF_WINDOWS:
+                    break
+                (start_ms, end_ms), future = item
+                if self._failed.is_set():
+                    future.cancel()
+                    continue
+                try:
+                    collected_data = future.result()
+                    self.sink_timings.add_wait(time.monotonic() - waited)
+                    started = time.monotonic()
+                    self.write_fn(start_ms, end_ms, collected_data)
+                    self.sink_timings.add_busy(time.monotonic() - started)
+                    self.commit_fn(start_ms, end_ms)
+                    committed += 1
+                except Exception as e:
+                    logger.error(f"Error during data collection or sinking for block {start_ms} - {end_ms}: {e}")
+                    logger.warning(f"Stopping at block {start_ms} - {end_ms}; later blocks will be collected again on the next run.")
+                    self._failed.set()
+            dispatcher.join()
+        logger.info(f"Pipeline stage timings - {self.source_timings}; {self.sink_timings}")
+        return committed
@@ -0,0 +1,70 @@
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class PollTimeoutError(Exception):
+    """Raised when a polled job stops making progress or exceeds its maximum wait."""
+
+
+class PollSchedule:
+    """Delay calculator for polling a single job; see ``AdaptivePoller``."""
+
+    def __init__(self, poller):
+        self.poller = poller
+        self.started_at = time.monotonic()
+        self.attempt = 0
+        self.last_progress = None
+        self.last_progress_at = self.started_at
+
+    @property
+    def elapsed_seconds(self):
+        return time.monotonic() - self.started_at
+
+    def next_delay(self, progress=None, execution_ms=None):
+        """Returns how long to wait before the next status check.
+
+        ``progress`` is a 0-100 completion percentage and ``execution_ms`` the time
+        the job has been executing, when the API reports them.
+        """
+        now = time.monotonic()
+        if progress is not None and (self.last_progress is None or progress > self.last_progress):
+            self.last_progress, self.last_progress_at = progress, now
+
+        waited = now - self.started_at
+        if waited >= self.poller.max_wait_seconds:
+            raise PollTimeoutError(f"still running after {waited:.0f}s (progress {progress}%)")
+        if now - self.last_progress_at >= self.poller.stall_timeout_seconds:
+            raise PollTimeoutError(f"no progress for {now - self.last_progress_at:.0f}s (stuck at {progress}%)")
+
+        delay = min(self.poller.max_interval_seconds,
+                    self.poller.initial_interval_seconds * (self.poller.backoff_factor ** self.attempt))
+        if progress and 0 < progress < 100:
+            # Predict the remaining time from the rate of progress so far
+            running = execution_ms / 1000 if execution_ms else waited
+            predicted = running * (100 - progress) / progress
+            delay = min(self.poller.max_interval_seconds, max(self.poller.initial_interval_seconds, predicted))
+        self.attempt += 1
+        return delay
+
+
+class AdaptivePoller:
+    """Polling policy that starts fast and backs off exponentially.
+
+    Short jobs are noticed within a fraction of a second, long jobs are not polled
+    more often than every ``max_interval_seconds``. When the job reports progress the
+    next check is timed for its predicted completion. A job is abandoned once it has
+    made no progress for ``stall_timeout_seconds`` or has run for ``max_wait_seconds``.
+    """
+
+    def __init__(self, initial_interval_seconds=0.25, max_interval_seconds=5.0, backoff_factor=2.0,
+                 stall_timeout_seconds=300, max_wait_seconds=3600):
+        self.initial_interval_seconds = float(initial_interval_seconds)
+        self.max_interval_seconds = float(max_interval_seconds)
+        self.backoff_factor = float(backoff_factor)
+        self.stall_timeout_seconds = float(stall_timeout_seconds)
+        self.max_wait_seconds = float(max_wait_seconds)
+
+    def schedule(self):
+        return PollSchedule(self)
@@ -1,87 +1,351 @@
+import asyncio
+import codecs
+import functools
 import logging
 import requests
 import time
-import gzip
 import json
 import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from requests.exceptions import RequestException
-from sdc_tool.base_source import BaseSource
+from sdc_tool.base_source import BaseSource, WindowOverflowError
+from sdc_tool.compression import GzipCodec, codec_from_config
+from sdc_tool.connection_pool import create_session
+from sdc_tool.retry import NON_IDEMPOTENT_RETRY_STATUS_CODES, RETRY_STATUS_CODES, RetryPolicy, parse_retry_after
+from sdc_tool.payload import FilePayload
+from sdc_tool.polling import AdaptivePoller, PollTimeoutError
 from datetime import datetime
 
-from sdc_tool.base_source import BaseSource
-
 logger = logging.getLogger(__name__)
 
+class QRadarAPIError(Exception):
+    """Raised when an Ariel search cannot be created, completed or downloaded."""
+
+
+def _iter_json_array_items(chunks, key, chunk_size_hint=65536):
+    """Yields the objects of ``{"<key>": [{...}, ...]}`` while the body is still streaming in.
+
+    Only one record and one network chunk are held in memory at a time, so the page
+    size no longer bounds memory use.
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder("utf-8")()
+    chunks = iter(chunks)
+    buffer = ""
+    pos = None
+    exhausted = False
+
+    def read_more():
+        nonlocal buffer, exhausted
+        try:
+            buffer += text_decoder.decode(next(chunks))
+        except StopIteration:
+            buffer += text_decoder.decode(b"", final=True)
+            exhausted = True
+
+    # Find the opening bracket of the array stored under key
+    marker = f'"{key}"'
+    while pos is None:
+        key_at = buffer.find(marker)
+        bracket_at = buffer.find("[", key_at + len(marker)) if key_at >= 0 else -1
+        if bracket_at >= 0:
+            pos = bracket_at + 1
+        elif exhausted:
+            return
+        else:
+            read_more()
+
+    while True:
+        while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+            pos += 1
+        if pos >= len(buffer):
+            if exhausted:
+                raise QRadarAPIError(f"Truncated Ariel results: array '{key}' is not closed")
+            read_more()
+            continue
+        if buffer[pos] == "]":
+            return
+        try:
+            item, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if exhausted:
+                raise
+            read_more()
+            continue
+        yield item
+        pos = end
+        if pos > chunk_size_hint:
+            buffer = buffer[pos:]
+            pos = 0
+
+
 class QRadarAPIClient:
-    def __init__(self, host, token):
+    # Download slots are shared by every client talking to the same console, so parallel
+    # windows and pipelines together never exceed the per-host cap.
+    _host_download_slots = {}
+    _host_download_slots_lock = threading.Lock()
+
+    def __init__(self, host, token, session=None, page_size=10000, max_concurrent_downloads=4,
+                 pool_size=10, retry_policy=None, timeout_seconds=60, poller=None, codec=None):
         self.host = host.rstrip("/")
         self.token = token
-        logger.info(f"Initialized QRadarAPIClient for host: {self.host}")
-
-    def get_events(self, query, output_gz_file, db_name="flows"):
-        logger.info(f"QRadar API: get_events with query: {query}")
-        api_url = f"{self.host}/api/ariel/searches"
-        headers = {
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.poller = poller or AdaptivePoller()
+        # Nén file tạm (mặc định gzip mức 6); có thể dùng zstd/lz4 hoặc nén song song nhiều luồng
+        self.codec = codec or GzipCodec()
+        self.timeout_seconds = timeout_seconds
+        self.page_size = max(1, int(page_size))
+        self.max_concurrent_downloads = max(1, int(max_concurrent_downloads))
+        with QRadarAPIClient._host_download_slots_lock:
+            if self.host not in QRadarAPIClient._host_download_slots:
+                QRadarAPIClient._host_download_slots[self.host] = threading.BoundedSemaphore(self.max_concurrent_downloads)
+            self.download_slots = QRadarAPIClient._host_download_slots[self.host]
+        # Keep-alive session: shared with other pipelines under the supervisor, otherwise our own
+        self.http = session if session is not None else create_session(pool_size)
+        self.api_url = f"{self.host}/api/ariel/searches"
+        self.headers = {
             "SEC": self.token,
             "Content-Type": "application/json",
             "Accept": "application/json"
         }
+        logger.info(f"Initialized QRadarAPIClient for host: {self.host}")
 
+    def _request(self, method, url, idempotent=True, **kwargs):
+        """Sends a request, retrying connection errors, 429 and 5xx with jittered backoff.
+
+        A request that is not ``idempotent`` is only retried when it cannot have reached the
+        server (connection refused or connect timeout) or on 429/503, so it is never repeated
+        after the server may already have acted on it.
+        """
+        kwargs.setdefault("verify", False)
+        kwargs.setdefault("timeout", self.timeout_seconds)
+        retry_status_codes = RETRY_STATUS_CODES if idempotent else NON_IDEMPOTENT_RETRY_STATUS_CODES
+        for attempt in range(self.retry_policy.max_retries + 1):
+            last_attempt = attempt == self.retry_policy.max_retries
+            try:
+                resp = getattr(self.http, method)(url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                # ConnectTimeout is a ConnectionError; a ReadTimeout means the request was sent
+                if last_attempt or (not idempotent and not isinstance(e, requests.ConnectionError)):
+                    raise
+                delay = self.retry_policy.sleep(attempt)
+                logger.warning(f"{method.upper()} {url} failed ({e}); retrying in {delay:.1f}s")
+                continue
+            if resp.status_code not in retry_status_codes or last_attempt:
+                return resp
+            retry_after = parse_retry_after(resp.headers.get("Retry-After"))
+            resp.close()
+            delay = self.retry_policy.sleep(attempt, retry_after)
+            logger.warning(f"{method.upper()} {url} returned {resp.status_code}; retrying in {delay:.1f}s")
+
+    def create_search(self, query):
+        # Not idempotent: a repeated POST after a lost reply would start a second Ariel search
+        resp = self._request("post", self.api_url, idempotent=False, headers=self.headers,
+                             json={"query_expression": query})
+        if resp.status_code not in (200, 201):
+            raise QRadarAPIError(f"Failed to create search: {resp.status_code}, {resp.text}")
+        search_id = resp.json().get("search_id")
+        if not search_id:
+            raise QRadarAPIError(f"No search_id in response: {resp.text}")
+        logger.info(f"Created Ariel search with id: {search_id}")
+        return search_id
+
+    def cancel_search(self, search_id):
         try:
-            # 1. Tạo search
-            resp = requests.post(api_url, headers=headers, json={"query_expression": query}, verify=False)
-            if resp.status_code not in (200, 201):
-                logger.error(f"Failed to create search: {resp.status_code}, {resp.text}")
-                return None
-            search_id = resp.json().get("search_id")
-            if not search_id:
-                logger.error(f"No search_id in response: {resp.text}")
-                return None
+            self._request("delete", f"{self.api_url}/{search_id}", headers=self.headers)
+        except requests.RequestException as e:
+            logger.warning(f"Could not cancel Ariel search {search_id}: {e}")
 
-            logger.info(f"Created Ariel search with id: {search_id}")
+    def handle_search_status(self, search_id, status_resp):
+        """Returns the status document of a status response, raising if the search failed."""
+        if status_resp.status_code != 200:
+            logger.warning(f"Check status failed: {status_resp.status_code}, {status_resp.text}")
+            return {}
+        search_status = status_resp.json()
+        status = search_status.get("status")
+        logger.info(f"Search {search_id} status: {status} ({search_status.get('progress', 0)}%)")
+        if status in ("CANCELED", "ERROR"):
+            raise QRadarAPIError(f"Search {search_id} ended with status: {status}")
+        return search_status
 
-            # 2. Poll status
-            status_url = f"{api_url}/{search_id}"
-            for _ in range(60):  # 5 phút
-                time.sleep(5)
-                status_resp = requests.get(status_url, headers=headers, verify=False)
-                if status_resp.status_code != 200:
-                    logger.warning(f"Check status failed: {status_resp.status_code}, {status_resp.text}")
-                    continue
-                status = status_resp.json().get("status")
-                logger.info(f"Search {search_id} status: {status}")
-                if status == "COMPLETED":
+    def wait_for_search(self, search_id):
+        """Polls the search until it completes and returns its final status document."""
+        status_url = f"{self.api_url}/{search_id}"
+        schedule = self.poller.schedule()
+        while True:
+            search_status = self.handle_search_status(search_id, self._request("get", status_url, headers=self.headers))
+            if search_status.get("status") == "COMPLETED":
+                logger.info(f"Search {search_id} completed in {schedule.elapsed_seconds:.2f}s")
+                return search_status
+            try:
+                delay = schedule.next_delay(search_status.get("progress"), search_status.get("query_execution_time"))
+            except PollTimeoutError as e:
+                self.cancel_search(search_id)
+                raise QRadarAPIError(f"Timeout waiting for Ariel search {search_id} to complete: {e}")
+            time.sleep(delay)
+
+    def iter_results_page(self, search_id, db_name, first, last):
+        """Streams the records ``first``..``last`` (inclusive) of a completed search."""
+        headers = dict(self.headers, Range=f"items={first}-{last}")
+        results_resp = self._request("get", f"{self.api_url}/{search_id}/results", headers=headers, stream=True)
+        try:
+            if results_resp.status_code == 416:
+                # Range starts past the last record
+                return
+            if results_resp.status_code not in (200, 206):
+                raise QRadarAPIError(f"Failed to get results: {results_resp.status_code}, {results_resp.text}")
+            yield from _iter_json_array_items(results_resp.iter_content(chunk_size=65536), db_name)
+        finally:
+            results_resp.close()
+
+    def download_results(self, search_id, db_name, record_count, output):
+        """Writes every record of a completed search to ``output`` as NDJSON, page by page."""
+        written = 0
+        first = 0
+        while record_count is None or first < record_count:
+            last = first + self.page_size - 1
+            page_count = 0
+            for event in self.iter_results_page(search_id, db_name, first, last):
+                output.write(json.dumps(event))
+                output.write("\n")
+                page_count += 1
+            written += page_count
+            logger.debug(f"Search {search_id}: fetched items {first}-{last} ({page_count} records)")
+            if page_count < self.page_size:
+                break
+            first += self.page_size
+        return written
+
+    def _download_slice(self, search_id, db_name, first, last, part_file):
+        with self.download_slots:
+            # A slice is self-contained, so a connection dropped mid-stream just restarts that slice
+            for attempt in range(self.retry_policy.max_retries + 1):
+                count = 0
+                try:
+                    with self.codec.open(part_file, "wt") as f:
+                        for event in self.iter_results_page(search_id, db_name, first, last):
+                            f.write(json.dumps(event))
+                            f.write("\n")
+                            count += 1
                     break
-                elif status in ("CANCELED", "ERROR"):
-                    logger.error(f"Search {search_id} ended with status: {status}")
-                    return None
-            else:
-                logger.error("Timeout waiting for Ariel search to complete")
-                return None
+                except requests.RequestException as e:
+                    if attempt == self.retry_policy.max_retries:
+                        raise
+                    delay = self.retry_policy.sleep(attempt)
+                    logger.warning(f"Search {search_id}: items {first}-{last} failed ({e}); retrying in {delay:.1f}s")
+            logger.debug(f"Search {search_id}: fetched items {first}-{last} ({count} records)")
+            return count
 
-            # 3. Lấy results
-            results_url = f"{api_url}/{search_id}/results"
-            final_headers = headers.copy()
-            final_headers["Range"] = "items=0-99999"
-            results_resp = requests.get(results_url, headers=final_headers, verify=False)
-            if results_resp.status_code != 200:
-                logger.error(f"Failed to get results: {results_resp.status_code}, {results_resp.text}")
-                return None
+    def download_results_parallel(self, search_id, db_name, record_count, output_gz_file):
+        """Fetches non-overlapping Range slices of a completed search concurrently.
 
-            events = results_resp.json().get(db_name, [])
-            if not events:
-                logger.info("No events in results.")
-                return None
+        Each slice is compressed into its own gzip member (or zstd/lz4 frame) file; the
+        members are then appended to ``output_gz_file`` in slice order, which yields a
+        standard multi-member file without recompressing anything.
+        """
+        slices = [(first, min(first + self.page_size, record_count) - 1)
+                  for first in range(0, record_count, self.page_size)]
+        part_files = [f"{output_gz_file}.part{i:05d}" for i in range(len(slices))]
+        try:
+            with ThreadPoolExecutor(max_workers=min(self.max_concurrent_downloads, len(slices)),
+                                    thread_name_prefix="sdc-ariel") as executor:
+                futures = [executor.submit(self._download_slice, search_id, db_name, first, last, part_file)
+                           for (first, last), part_file in zip(slices, part_files)]
+                try:
+                    counts = [future.result() for future in futures]
+                except Exception:
+                    for future in futures:
+                        future.cancel()
+                    raise
+            with open(output_gz_file, "wb") as out:
+                for part_file in part_files:
+                    with open(part_file, "rb") as part:
+                        shutil.copyfileobj(part, out)
+        finally:
+            for part_file in part_files:
+                if os.path.exists(part_file):
+                    os.remove(part_file)
+
+        written = sum(counts)
+        if written != record_count:
+            logger.warning(f"Search {search_id} reported {record_count} records but {written} were downloaded")
+        return written
+
+    def fetch_completed_search(self, search_id, search_status, output_gz_file, db_name, max_events=0):
+        # Check the size before downloading so an oversized window can be split instead of truncated
+        record_count = search_status.get("record_count")
+        if max_events and record_count is not None and record_count >= max_events:
+            # The window is split and searched again; free the search's slot and stored results now
+            self.cancel_search(search_id)
+            raise WindowOverflowError(record_count, max_events)
+        if record_count == 0:
+            logger.info("No events in results.")
+            return None
 
-            # 4. Ghi ra file GZIP
-            with gzip.open(output_gz_file, "wt", encoding="utf-8") as f:
-                json.dump(events, f)
-            logger.info(f"Wrote {len(events)} events to gzip file: {output_gz_file}")
-            return output_gz_file
+        # 3. Lấy results theo từng trang và ghi ra file GZIP (NDJSON)
+        if record_count is not None and record_count > self.page_size and self.max_concurrent_downloads > 1:
+            written = self.download_results_parallel(search_id, db_name, record_count, output_gz_file)
+        else:
+            with self.codec.open(output_gz_file, "wt") as f:
+                written = self.download_results(search_id, db_name, record_count, f)
+        if not written:
+            os.remove(output_gz_file)
+            logger.info("No events in results.")
+            return None
+        logger.info(f"Wrote {written} events to {self.codec.name} file: {output_gz_file}")
+        return FilePayload(output_gz_file, written, codec=self.codec.name)
 
+    def get_events(self, query, output_gz_file, db_name="flows", max_events=0):
+        logger.info(f"QRadar API: get_events with query: {query}")
+        try:
+            # 1. Tạo search
+            search_id = self.create_search(query)
+
+            # 2. Poll status
+            search_status = self.wait_for_search(search_id)
+
+            return self.fetch_completed_search(search_id, search_status, output_gz_file, db_name, max_events)
+
+        except WindowOverflowError:
+            raise
         except Exception as e:
             logger.error(f"Error in QRadarAPIClient.get_events: {e}")
-            return None
+            raise
+
+    async def get_events_async(self, query, output_gz_file, db_name="flows", max_events=0):
+        """Same as ``get_events``, but waits for the search without holding a thread.
+
+        Each HTTP call runs in the event loop's executor; the time between status
+        checks is spent in ``asyncio.sleep``.
+        """
+        logger.info(f"QRadar API: get_events_async with query: {query}")
+        loop = asyncio.get_running_loop()
+        try:
+            search_id = await loop.run_in_executor(None, self.create_search, query)
+            status_url = f"{self.api_url}/{search_id}"
+            schedule = self.poller.schedule()
+            while True:
+                status_resp = await loop.run_in_executor(
+                    None, functools.partial(self._request, "get", status_url, headers=self.headers))
+                search_status = self.handle_search_status(search_id, status_resp)
+                if search_status.get("status") == "COMPLETED":
+                    logger.info(f"Search {search_id} completed in {schedule.elapsed_seconds:.2f}s")
+                    break
+                try:
+                    delay = schedule.next_delay(search_status.get("progress"), search_status.get("query_execution_time"))
+                except PollTimeoutError as e:
+                    await loop.run_in_executor(None, self.cancel_search, search_id)
+                    raise QRadarAPIError(f"Timeout waiting for Ariel search {search_id} to complete: {e}")
+                await asyncio.sleep(delay)
+            return await loop.run_in_executor(None, self.fetch_completed_search, search_id, search_status,
+                                              output_gz_file, db_name, max_events)
+        except WindowOverflowError:
+            raise
+        except Exception as e:
+            logger.error(f"Error in QRadarAPIClient.get_events_async: {e}")
+            raise
 
     def get_offenses(self, query):
         logger.info(f"Dummy QRadar API call: get_offenses with query: {query}")
@@ -90,7 +354,7 @@ class QRadarAPIClient:
 
 
 class QRadarSource(BaseSource):
-    def __init__(self, config):
+    def __init__(self, config, connection_pool=None):
         super().__init__(config)
         # Correctly access input_type from the QRadar section
         self.input_type = self.config.get_section("QRadar").get("qradar.input_type")
@@ -98,7 +362,11 @@ class QRadarSource(BaseSource):
         if self.input_type in ["api_events", "api_offenses"]:
             self.host = self.config.get("QRadar.qradar.api.host")
             self.token = self.config.get("QRadar.qradar.api.token")
-            self.api_client = QRadarAPIClient(self.host, self.token)
+            self.codec = codec_from_config(self.config)
+            self.api_client = self._build_api_client(connection_pool)
+            # Ariel limits concurrent searches per console; the async engine enforces this per host
+            self.search_quota_key = f"qradar:{self.host}"
+            self.max_concurrent_searches = self.config.getint("QRadar.qradar.api.max_concurrent_searches", 5)
 
         elif self.input_type == "syslog":
             self.protocol = self.config.get("QRadar.qradar.syslog.protocol")
@@ -108,9 +376,29 @@ class QRadarSource(BaseSource):
             # TODO: Implement Syslog listener
             raise ValueError(f"Unsupported QRadar input type: {self.input_type}")
 
-    def collect_data(self, start_time: datetime, end_time: datetime):
-        logger.info(f"Collecting data from QRadar (type: {self.input_type}) from {start_time} to {end_time}")
+    def _build_api_client(self, connection_pool):
+        config = self.config
+        session = connection_pool.get_session(self.host) if connection_pool else None
+        retry_policy = RetryPolicy(
+            max_retries=config.getint("QRadar.qradar.api.max_retries", 5),
+            backoff_base_seconds=config.getfloat("QRadar.qradar.api.backoff_base_seconds", 1.0),
+            backoff_max_seconds=config.getfloat("QRadar.qradar.api.backoff_max_seconds", 60.0))
+        poller = AdaptivePoller(
+            initial_interval_seconds=config.getfloat("QRadar.qradar.api.poll_initial_seconds", 0.25),
+            max_interval_seconds=config.getfloat("QRadar.qradar.api.poll_max_seconds", 5.0),
+            stall_timeout_seconds=config.getfloat("QRadar.qradar.api.poll_stall_timeout_seconds", 300),
+            max_wait_seconds=config.getfloat("QRadar.qradar.api.poll_max_wait_seconds", 3600))
+        return QRadarAPIClient(
+            self.host, self.token, session=session,
+            page_size=config.getint("QRadar.qradar.api.page_size", 10000),
+            max_concurrent_downloads=config.getint("QRadar.qradar.api.max_concurrent_downloads", 4),
+            pool_size=config.getint("QRadar.qradar.api.pool_size", 10),
+            retry_policy=retry_policy,
+            timeout_seconds=config.getint("QRadar.qradar.api.timeout_seconds", 60),
+            poller=poller,
+            codec=self.codec)
 
+    def _temp_gz_file(self, start_time: datetime, end_time: datetime):
         # Build tmp dir and prefix như bên CortexXDR
         tmp_dir = self.config.get("QRadar.qradar.tmp_dir", "./tmp/qradar")
         prefix_filename = self.config.get("QRadar.qradar.prefix_filename", "qradar_data")
@@ -121,26 +409,51 @@ class QRadarSource(BaseSource):
         # Build file name (dạng ISO, tránh ký tự đặc biệt cho file path)
         s_str = start_time.strftime("%Y%m%dT%H%M%S")
         e_str = end_time.strftime("%Y%m%dT%H%M%S")
-        temp_gz_file = f"{tmp_dir}/{prefix_filename}_{s_str}_{e_str}.json.gz"
+        return f"{tmp_dir}/{prefix_filename}_{s_str}_{e_str}.json{self.codec.extension}"
+
+    def _build_query(self, template_key, start_time: datetime, end_time: datetime):
+        query_template = self.config.get(template_key)
+        query = query_template.format(
+            start_time=start_time.strftime("%Y-%m-%d %H:%M:%S"),
+            end_time=end_time.strftime("%Y-%m-%d %H:%M:%S"))
+        logger.debug(f"Executing AQL query: {query}")
+        return query
+
+    async def collect_data_async(self, start_time: datetime, end_time: datetime):
+        if self.input_type != "api_events":
+            return await super().collect_data_async(start_time, end_time)
+        logger.info(f"Collecting data from QRadar (type: {self.input_type}) from {start_time} to {end_time}")
+        try:
+            query = self._build_query("QRadar.qradar.api.aql_query_template_events", start_time, end_time)
+            db_name = self.config.get("QRadar.qradar.api.db_name", "flows")
+            result = await self.api_client.get_events_async(query, self._temp_gz_file(start_time, end_time), db_name,
+                                                            max_events=self.max_events_per_window)
+            if isinstance(result, FilePayload):
+                result.start_time, result.end_time = start_time, end_time
+            return result
+        except WindowOverflowError:
+            raise
+        except Exception as e:
+            logger.error(f"Error during QRadar data collection: {e}")
+            raise
+
+    def collect_data(self, start_time: datetime, end_time: datetime):
+        logger.info(f"Collecting data from QRadar (type: {self.input_type}) from {start_time} to {end_time}")
+        temp_gz_file = self._temp_gz_file(start_time, end_time)
 
         try:
             if self.input_type == "api_events":
-                query_template = self.config.get("QRadar.qradar.api.aql_query_template_events")
-                query = query_template.format(
-                    start_time=start_time.strftime("%Y-%m-%d %H:%M:%S"),
-                    end_time=end_time.strftime("%Y-%m-%d %H:%M:%S"))
+                query = self._build_query("QRadar.qradar.api.aql_query_template_events", start_time, end_time)
                 db_name = self.config.get("QRadar.qradar.api.db_name", "flows")
-                logger.debug(f"Executing AQL query: {query}")
-                result = self.api_client.get_events(query, temp_gz_file, db_name)  # Ghi ra file GZIP luôn
-                # Nếu hàm get_events trả về tên file thì đã ghi xong
+                result = self.api_client.get_events(query, temp_gz_file, db_name,
+                                                    max_events=self.max_events_per_window)  # Ghi ra file GZIP luôn
+                # Nếu hàm get_events trả về FilePayload thì đã ghi xong
+                if isinstance(result, FilePayload):
+                    result.start_time, result.end_time = start_time, end_time
                 return result
 
             elif self.input_type == "api_offenses":
-                query_template = self.config.get("QRadar.qradar.api.aql_query_template_offenses")
-                query = query_template.format(
-                    start_time=start_time.strftime("%Y-%m-%d %H:%M:%S"),
-                    end_time=end_time.strftime("%Y-%m-%d %H:%M:%S"))
-                logger.debug(f"Executing AQL query: {query}")
+                query = self._build_query("QRadar.qradar.api.aql_query_template_offenses", start_time, end_time)
                 # Nếu muốn offenses cũng ghi ra GZIP file, bạn cần sửa get_offenses tương tự get_events
                 result = self.api_client.get_offenses(query, temp_gz_file)
                 return result
@@ -153,9 +466,11 @@ class QRadarSource(BaseSource):
                 logger.error(f"Unsupported QRadar input type: {self.input_type}")
                 return None
 
+        except WindowOverflowError:
+            raise
         except Exception as e:
             logger.error(f"Error during QRadar data collection: {e}")
-            return None
+            raise
 
 
 
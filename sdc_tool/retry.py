@@ -0,0 +1,53 @@
+import email.utils
+import logging
+import random
+import time
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+# Throttling and transient server-side failures worth retrying
+RETRY_STATUS_CODES = frozenset((429, 500, 502, 503, 504))
+# For requests that are not idempotent (e.g. creating a search): only answers that say the
+# request was not acted on; a 500/502/504 may come after the server already did the work
+NON_IDEMPOTENT_RETRY_STATUS_CODES = frozenset((429, 503))
+
+
+def parse_retry_after(value):
+    """Returns the delay in seconds asked for by a ``Retry-After`` header, or None."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter, capped at ``backoff_max_seconds``.
+
+    A server-provided ``Retry-After`` always wins over the computed delay (still
+    capped), so throttled requests wait as long as the server asks.
+    """
+
+    def __init__(self, max_retries=5, backoff_base_seconds=1.0, backoff_max_seconds=60.0):
+        self.max_retries = max(0, int(max_retries))
+        self.backoff_base_seconds = float(backoff_base_seconds)
+        self.backoff_max_seconds = float(backoff_max_seconds)
+
+    def delay(self, attempt, retry_after=None):
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max_seconds)
+        ceiling = min(self.backoff_max_seconds, self.backoff_base_seconds * (2 ** attempt))
+        return random.uniform(0, ceiling)
+
+    def sleep(self, attempt, retry_after=None):
+        delay = self.delay(attempt, retry_after)
+        time.sleep(delay)
+        return delay
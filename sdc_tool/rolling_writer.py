@@ -0,0 +1,84 @@
+import json
+import logging
+
+from sdc_tool.compression import GzipCodec
+
+logger = logging.getLogger(__name__)
+
+_END = object()
+
+
+class _CountingWriter:
+    """Passes writes through to ``fileobj`` and counts the (compressed) bytes written."""
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.bytes_written = 0
+
+    def write(self, data):
+        self.fileobj.write(data)
+        self.bytes_written += len(data)
+        return len(data)
+
+    def flush(self):
+        flush = getattr(self.fileobj, "flush", None)
+        if flush is not None:
+            flush()
+
+
+class RollingGzipWriter:
+    """Streams records into gzip NDJSON files, starting a new file when a limit is hit.
+
+    ``open_file(index)`` returns a context manager yielding a binary file object for the
+    ``index``-th output file; it is only called once the first record of that file is
+    ready, so an empty iterator produces no file. A file is closed as soon as it holds
+    ``max_records`` records or ``max_bytes`` compressed bytes (0 disables a limit). The
+    byte count is what has reached the file so far, so a file may exceed ``max_bytes``
+    by what the compressor still buffers (tens of KB).
+
+    Records are consumed lazily: dicts are serialized to JSON, ``bytes``/``str`` are taken
+    as already serialized NDJSON lines. ``codec`` (see ``sdc_tool.compression``) replaces
+    gzip at ``compresslevel``, e.g. with zstd or a multi-threaded compressor; a parallel
+    compressor holds more data in flight, so files overshoot ``max_bytes`` by more.
+    """
+
+    def __init__(self, open_file, max_records=0, max_bytes=0, compresslevel=6, codec=None):
+        self.open_file = open_file
+        self.max_records = max(0, int(max_records or 0))
+        self.max_bytes = max(0, int(max_bytes or 0))
+        self.codec = codec or GzipCodec(level=compresslevel)
+
+    @staticmethod
+    def _encode(record):
+        if isinstance(record, bytes):
+            line = record
+        elif isinstance(record, str):
+            line = record.encode("utf-8")
+        else:
+            line = json.dumps(record).encode("utf-8")
+        return line if line.endswith(b"\n") else line + b"\n"
+
+    def _full(self, records, counter):
+        return ((self.max_records and records >= self.max_records) or
+                (self.max_bytes and counter.bytes_written >= self.max_bytes))
+
+    def write(self, records):
+        """Writes ``records``; returns a list of ``(record_count, compressed_bytes)`` per file."""
+        files = []
+        iterator = iter(records)
+        for first in iterator:
+            with self.open_file(len(files)) as fileobj:
+                counter = _CountingWriter(fileobj)
+                count = 0
+                with self.codec.open_writer(counter) as gz:
+                    gz.write(self._encode(first))
+                    count += 1
+                    while not self._full(count, counter):
+                        record = next(iterator, _END)
+                        if record is _END:
+                            break
+                        gz.write(self._encode(record))
+                        count += 1
+            files.append((count, counter.bytes_written))
+            logger.debug(f"Closed output file #{len(files)} with {count} records, {counter.bytes_written} bytes.")
+        return files
@@ -0,0 +1,93 @@
+import fcntl
+import logging
+import os
+import threading
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+
+class RunLock:
+    """Non-blocking exclusive file lock that keeps two runs of one pipeline from overlapping.
+
+    The lock is held with ``flock`` so it also guards against a cron-started run
+    racing a daemon, and is released automatically if the process dies.
+    """
+
+    def __init__(self, lock_file_path):
+        self.lock_file_path = lock_file_path
+        self._fd = None
+
+    def acquire(self):
+        lock_dir = os.path.dirname(self.lock_file_path)
+        if lock_dir:
+            os.makedirs(lock_dir, exist_ok=True)
+        fd = os.open(self.lock_file_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode("ascii"))
+        self._fd = fd
+        return True
+
+    def release(self):
+        if self._fd is None:
+            return
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+        os.close(self._fd)
+        self._fd = None
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+
+class DaemonScheduler:
+    """Runs a collector on wall-clock boundaries aligned to the collection window.
+
+    Each tick fires ``delay_seconds`` after a boundary (e.g. 10:20:30 for 10-minute
+    windows) so the block that just closed is complete. Ticks never overlap: if a run
+    overruns the next boundary, the missed ticks are skipped and the following run
+    simply picks up the extra blocks from the saved state.
+    """
+
+    def __init__(self, collector, interval_minutes, delay_seconds=30, stop_event=None):
+        self.collector = collector
+        self.interval_seconds = max(1, int(interval_minutes)) * 60
+        self.delay_seconds = max(0, int(delay_seconds))
+        self.stop_event = stop_event or threading.Event()
+
+    def next_tick(self, now: datetime) -> datetime:
+        now_ts = now.timestamp()
+        boundary_ts = (int(now_ts - self.delay_seconds) // self.interval_seconds) * self.interval_seconds
+        tick_ts = boundary_ts + self.interval_seconds + self.delay_seconds
+        return datetime.fromtimestamp(tick_ts)
+
+    def stop(self):
+        logger.info("Stop requested; finishing the window in flight before shutting down.")
+        self.stop_event.set()
+
+    def run_forever(self):
+        logger.info(f"Daemon started: running every {self.interval_seconds // 60} minutes "
+                    f"({self.delay_seconds}s after each boundary).")
+        while not self.stop_event.is_set():
+            planned_tick = self.next_tick(datetime.now())
+            try:
+                self.collector.run()
+            except Exception as e:
+                logger.error(f"Scheduled run failed: {e}")
+            if self.stop_event.is_set():
+                break
+            now = datetime.now()
+            tick = self.next_tick(now)
+            skipped = int((tick - planned_tick).total_seconds() // self.interval_seconds)
+            if skipped > 0:
+                logger.warning(f"Run overran the schedule; skipped {skipped} tick(s).")
+            logger.info(f"Next run at {tick}.")
+            self.stop_event.wait((tick - now).total_seconds())
+        logger.info("Daemon stopped.")
@@ -0,0 +1,301 @@
+import json
+import logging
+import os
+import shutil
+import threading
+from datetime import datetime
+
+from sdc_tool.compression import GzipCodec
+from sdc_tool.payload import FilePayload, count_records
+from sdc_tool.retry import RetryPolicy
+from sdc_tool.rolling_writer import RollingGzipWriter
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = "entry.json"
+EVICTION_POLICIES = ("reject", "drop_oldest")
+
+
+class SpoolFullError(Exception):
+    """Raised when a window does not fit in the spool and the eviction policy is ``reject``."""
+
+
+def _fsync_dir(path):
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class Spool:
+    """Disk-backed FIFO of collected windows that still have to be written to the sink.
+
+    A window is committed to the spool as one directory holding its compressed data
+    files and a manifest. The directory is built under a hidden name, fsynced and then
+    renamed into place, so after a crash an entry is either complete or absent. Entries
+    are replayed in the order they were committed.
+
+    The spool is capped at ``max_size_mb``. When a window does not fit, ``reject``
+    raises ``SpoolFullError`` (the window is not committed and will be collected again),
+    ``drop_oldest`` evicts the oldest entries to make room, losing their data.
+    Records are spooled with ``codec`` (the sink's), so the sink can take the files as they are.
+    """
+
+    def __init__(self, spool_dir, max_size_mb=10240, eviction="reject", codec=None):
+        if eviction not in EVICTION_POLICIES:
+            raise ValueError(f"Unsupported spool eviction policy: {eviction}. Expected one of {', '.join(EVICTION_POLICIES)}.")
+        self.spool_dir = spool_dir
+        self.max_bytes = max(0, int(max_size_mb)) * 1024 * 1024
+        self.eviction = eviction
+        self.codec = codec or GzipCodec()
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._in_use = set()
+        os.makedirs(self.spool_dir, exist_ok=True)
+        for name in os.listdir(self.spool_dir):
+            if name.startswith("."):
+                # An entry that was still being committed when the process died
+                logger.warning(f"Removing incomplete spool entry {name}.")
+                shutil.rmtree(os.path.join(self.spool_dir, name), ignore_errors=True)
+        entries = self.entries()
+        self._size_bytes = sum(self._entry_size(name) for name in entries)
+        self._sequence = int(entries[-1].split("_", 1)[0]) + 1 if entries else 0
+        if entries:
+            logger.info(f"Spool {self.spool_dir} holds {len(entries)} windows ({self._size_bytes} bytes) to replay.")
+
+    def _entry_size(self, name):
+        entry_dir = os.path.join(self.spool_dir, name)
+        return sum(os.path.getsize(os.path.join(entry_dir, f)) for f in os.listdir(entry_dir))
+
+    def entries(self):
+        """Names of the committed entries, oldest first."""
+        return sorted(name for name in os.listdir(self.spool_dir) if not name.startswith("."))
+
+    @property
+    def size_bytes(self):
+        return self._size_bytes
+
+    def __len__(self):
+        return len(self.entries())
+
+    @staticmethod
+    def _incoming_size(items):
+        size = 0
+        for data, *_ in items:
+            if isinstance(data, FilePayload):
+                size += data.size_bytes
+            elif isinstance(data, bytes):
+                size += len(data)
+        return size
+
+    def _make_room(self, needed):
+        """Called with the lock held."""
+        if not self.max_bytes or self._size_bytes + needed <= self.max_bytes:
+            return
+        if self.eviction == "reject":
+            raise SpoolFullError(f"Spool {self.spool_dir} is full ({self._size_bytes} of {self.max_bytes} bytes)")
+        for name in self.entries():
+            if self._size_bytes + needed <= self.max_bytes:
+                break
+            if name in self._in_use:
+                continue
+            size = self._entry_size(name)
+            shutil.rmtree(os.path.join(self.spool_dir, name))
+            self._size_bytes -= size
+            logger.error(f"Spool full: dropped oldest window {name} ({size} bytes) without writing it to the sink.")
+
+    def put(self, start_ms, end_ms, items, replaces=()):
+        """Commits the ``(data, source_identifier, input_type, window_start)`` items of a window.
+
+        ``FilePayload`` files are moved into the spool; records and bytes are written to
+        new compressed files. ``replaces`` is kept for ``BaseSink.write_window``. Returns the entry name.
+        """
+        items = [item for item in items if item[0]]
+        with self._lock:
+            self._make_room(self._incoming_size(items))
+            name = f"{self._sequence:012d}_{start_ms}_{end_ms}"
+            self._sequence += 1
+        staging = os.path.join(self.spool_dir, f".{name}")
+        os.makedirs(staging)
+        try:
+            manifest = {"start_ms": start_ms, "end_ms": end_ms, "replaces": sorted(replaces),
+                        "created_at": datetime.now().isoformat(), "items": []}
+            for i, (data, source_identifier, input_type, *rest) in enumerate(items):
+                window_start = rest[0] if rest else None
+                manifest["items"].append(dict(
+                    self._store(data, staging, i),
+                    source_identifier=source_identifier,
+                    input_type=input_type,
+                    window_start_ms=int(window_start.timestamp() * 1000) if window_start is not None else None,
+                ))
+            with open(os.path.join(staging, MANIFEST), "w") as f:
+                json.dump(manifest, f)
+                f.flush()
+                os.fsync(f.fileno())
+            _fsync_dir(staging)
+            os.rename(staging, os.path.join(self.spool_dir, name))
+            _fsync_dir(self.spool_dir)
+        except Exception:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        with self._changed:
+            self._size_bytes += self._entry_size(name)
+            self._changed.notify_all()
+        logger.info(f"Spooled window {start_ms} - {end_ms} as {name}.")
+        return name
+
+    def _store(self, data, staging, index):
+        if isinstance(data, FilePayload):
+            filename = os.path.basename(data.path) or f"part{index:04d}"
+            path = os.path.join(staging, f"{index:04d}_{filename}")
+            try:
+                os.replace(data.path, path)
+            except OSError:
+                # Different filesystem: copy, the caller removes the temp file
+                shutil.copyfile(data.path, path)
+            with open(path, "rb+") as f:
+                os.fsync(f.fileno())
+            return {"file": os.path.basename(path), "record_count": data.record_count, "codec": data.codec}
+        if isinstance(data, bytes):
+            # Already gzipped NDJSON
+            path = os.path.join(staging, f"{index:04d}_records.json.gz")
+            with open(path, "wb") as raw:
+                raw.write(data)
+                raw.flush()
+                os.fsync(raw.fileno())
+            return {"file": os.path.basename(path), "record_count": count_records(path), "codec": "gzip"}
+        path = os.path.join(staging, f"{index:04d}_records.json{self.codec.extension}")
+        count = 0
+        with self.codec.open(path, "wb") as f:
+            for record in data:
+                f.write(RollingGzipWriter._encode(record))
+                count += 1
+        with open(path, "rb+") as f:
+            os.fsync(f.fileno())
+        return {"file": os.path.basename(path), "record_count": count, "codec": self.codec.name}
+
+    def load(self, name):
+        """Returns ``(start_ms, end_ms, items, replaces)`` of an entry, with its files as ``FilePayload``."""
+        entry_dir = os.path.join(self.spool_dir, name)
+        with open(os.path.join(entry_dir, MANIFEST)) as f:
+            manifest = json.load(f)
+        items = []
+        for item in manifest["items"]:
+            window_start = (datetime.fromtimestamp(item["window_start_ms"] / 1000)
+                            if item.get("window_start_ms") is not None else None)
+            payload = FilePayload(os.path.join(entry_dir, item["file"]), item["record_count"],
+                                  start_time=window_start, codec=item.get("codec", "gzip"))
+            items.append((payload, item["source_identifier"], item["input_type"], window_start))
+        return manifest["start_ms"], manifest["end_ms"], items, manifest.get("replaces", [])
+
+    def acquire(self, name):
+        with self._lock:
+            self._in_use.add(name)
+        return os.path.isdir(os.path.join(self.spool_dir, name))
+
+    def release(self, name):
+        with self._lock:
+            self._in_use.discard(name)
+
+    def remove(self, name):
+        entry_dir = os.path.join(self.spool_dir, name)
+        with self._lock:
+            size = self._entry_size(name) if os.path.isdir(entry_dir) else 0
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            self._size_bytes -= size
+            self._in_use.discard(name)
+
+    def wait(self, timeout):
+        """Waits until a new entry is committed or ``timeout`` seconds pass."""
+        with self._changed:
+            self._changed.wait(timeout)
+
+    def wake(self):
+        with self._changed:
+            self._changed.notify_all()
+
+
+class SpoolDrainer:
+    """Replays spooled windows to the sink, oldest first, retrying with backoff.
+
+    Entries are written strictly in order: a failed entry is retried (after a jittered,
+    growing delay) before anything newer is written. An entry is removed only after the
+    sink has accepted all of it, so delivery is at-least-once: a crash between the write
+    and the removal replays that window.
+    """
+
+    def __init__(self, spool, sink, retry_policy=None, poll_seconds=30, stop_event=None):
+        self.spool = spool
+        self.sink = sink
+        self.retry_policy = retry_policy or RetryPolicy(max_retries=0, backoff_base_seconds=5, backoff_max_seconds=300)
+        self.poll_seconds = poll_seconds
+        self.stop_event = stop_event or threading.Event()
+        self._drain_lock = threading.Lock()
+        self._thread = None
+        self.failures = 0
+
+    def drain_once(self):
+        """Writes spooled entries in order until the spool is empty or a write fails.
+
+        Returns the number of entries written; raises the sink error of a failed entry.
+        Returns 0 at once if another drain is in progress.
+        """
+        if not self._drain_lock.acquire(blocking=False):
+            return 0
+        written = 0
+        try:
+            for name in self.spool.entries():
+                if self.stop_event.is_set():
+                    break
+                if not self.spool.acquire(name):
+                    # Evicted meanwhile
+                    self.spool.release(name)
+                    continue
+                try:
+                    start_ms, end_ms, items, replaces = self.spool.load(name)
+                    self.sink.write_window(start_ms, end_ms, items, replaces=replaces)
+                except Exception:
+                    self.spool.release(name)
+                    raise
+                self.spool.remove(name)
+                written += 1
+                logger.info(f"Replayed spooled window {start_ms} - {end_ms} to the sink.")
+            return written
+        finally:
+            self._drain_lock.release()
+
+    def run_forever(self):
+        while not self.stop_event.is_set():
+            try:
+                self.drain_once()
+                self.failures = 0
+            except Exception as e:
+                delay = self.retry_policy.delay(min(self.failures, 30))
+                self.failures += 1
+                logger.error(f"Sink unavailable, {len(self.spool)} windows stay spooled "
+                             f"({self.spool.size_bytes} bytes); retrying in {delay:.1f}s: {e}")
+                self.stop_event.wait(delay)
+                continue
+            self.spool.wait(self.poll_seconds)
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if not self.running:
+            self._thread = threading.Thread(target=self.run_forever, name="sdc-spool-drainer", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        self.stop_event.set()
+        self.spool.wake()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
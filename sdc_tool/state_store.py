@@ -0,0 +1,234 @@
+import fcntl
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+SQLITE_HEADER = b"SQLite format 3\x00"
+SCHEMA = "CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT NOT NULL, updated_at REAL NOT NULL)"
+
+
+def _fsync(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class _Commit:
+    __slots__ = ("values", "done", "error")
+
+    def __init__(self, values):
+        self.values = values
+        self.done = False
+        self.error = None
+
+
+class StateStore:
+    """Key/value state shared by every pipeline that points at the same state file.
+
+    The state file is a SQLite database in WAL mode with one row per key. Each
+    ``update`` is a single transaction, so a pipeline's checkpoint (watermark and
+    density together) is saved atomically and never touches other pipelines' keys.
+    Updates that arrive while another one is being committed are written together in
+    the next transaction, so many windows finishing at once cost one fsync, not one
+    each. After a crash SQLite rolls the WAL forward on the next open: a checkpoint is
+    either fully there or not at all.
+
+    A JSON state file written by older versions is imported on first open and kept as
+    ``<path>.json.bak``. The database is built next to it and renamed over it once
+    durable, so a crash during the import leaves the JSON file in place to import again. Use ``StateStore.for_path`` to get the shared instance for a path.
+    """
+
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, state_file_path, busy_timeout_seconds=30):
+        self.state_file_path = state_file_path
+        self.busy_timeout_seconds = busy_timeout_seconds
+        self._conn = None
+        self._file_id = None
+        self._conn_lock = threading.Lock()
+        self._commit_cond = threading.Condition()
+        self._pending = []
+        self._committing = False
+
+    @classmethod
+    def for_path(cls, state_file_path):
+        key = os.path.abspath(state_file_path)
+        with cls._instances_lock:
+            if key not in cls._instances:
+                cls._instances[key] = cls(state_file_path)
+            return cls._instances[key]
+
+    def _file_identity(self):
+        try:
+            st = os.stat(self.state_file_path)
+        except FileNotFoundError:
+            return None
+        return st.st_dev, st.st_ino
+
+    def _connection(self):
+        """Called with the connection lock held."""
+        if self._conn is not None and self._file_identity() == self._file_id:
+            return self._conn
+        if self._conn is not None:
+            # The state file was removed or replaced (e.g. reset by hand); start over on the new one
+            logger.warning(f"State file {self.state_file_path} changed on disk. Reopening.")
+            self._conn.close()
+            self._conn = None
+        state_dir = os.path.dirname(self.state_file_path)
+        if state_dir:
+            os.makedirs(state_dir, exist_ok=True)
+        # Serializes the legacy import and schema setup between processes opening the same file
+        fd = os.open(f"{self.state_file_path}.lock", os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            self._import_legacy_file()
+            try:
+                self._conn = self._connect()
+            except sqlite3.DatabaseError as e:
+                logger.error(f"State database {self.state_file_path} is corrupt ({e}). "
+                             f"Moving it to {self.state_file_path}.corrupt and starting empty.")
+                self._move_aside(f"{self.state_file_path}.corrupt")
+                self._conn = self._connect()
+            self._file_id = self._file_identity()
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+        return self._conn
+
+    def _connect(self):
+        conn = sqlite3.connect(self.state_file_path, timeout=self.busy_timeout_seconds,
+                               isolation_level=None, check_same_thread=False)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            # FULL syncs the WAL on every commit, so a committed checkpoint survives a power loss
+            conn.execute("PRAGMA synchronous=FULL")
+            conn.execute(SCHEMA)
+        except sqlite3.DatabaseError:
+            conn.close()
+            raise
+        return conn
+
+    def _move_aside(self, target):
+        os.replace(self.state_file_path, target)
+        for suffix in ("-wal", "-shm"):
+            if os.path.exists(f"{self.state_file_path}{suffix}"):
+                os.remove(f"{self.state_file_path}{suffix}")
+
+    def _import_legacy_file(self):
+        """Replaces a JSON state file of older versions with a database holding its keys."""
+        try:
+            with open(self.state_file_path, "rb") as f:
+                header = f.read(len(SQLITE_HEADER))
+        except FileNotFoundError:
+            return
+        if not header or header == SQLITE_HEADER:
+            return
+        try:
+            with open(self.state_file_path, "r") as f:
+                state = json.load(f)
+        except ValueError:
+            logger.warning(f"State file {self.state_file_path} is corrupt. Overwriting.")
+            self._move_aside(f"{self.state_file_path}.corrupt")
+            return
+        if not isinstance(state, dict):
+            state = {}
+        backup = f"{self.state_file_path}.json.bak"
+        shutil.copyfile(self.state_file_path, backup)
+        _fsync(backup)
+        # Built under another name and committed first: until the rename the JSON file stays the state
+        importing = f"{self.state_file_path}.importing"
+        for path in (importing, f"{importing}-journal"):
+            if os.path.exists(path):
+                os.remove(path)
+        conn = sqlite3.connect(importing, isolation_level=None)
+        try:
+            conn.execute(SCHEMA)
+            self._write(state, conn)
+        finally:
+            conn.close()
+        _fsync(importing)
+        os.replace(importing, self.state_file_path)
+        _fsync(os.path.dirname(self.state_file_path) or ".")
+        logger.info(f"Imported {len(state)} keys from JSON state file {self.state_file_path} "
+                    f"(kept as {backup}).")
+
+    def _write(self, values, conn=None):
+        """Writes ``values`` in one transaction. Called with the connection lock held."""
+        conn = conn or self._conn
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT INTO state (key, value, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at",
+                [(key, json.dumps(value), now) for key, value in values.items()],
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _write_batch(self, batch):
+        values = {}
+        for commit in batch:
+            # Later updates of the same key win, as if they had been committed one by one
+            values.update(commit.values)
+        with self._conn_lock:
+            self._connection()
+            self._write(values)
+
+    def get(self, key, default=None):
+        with self._conn_lock:
+            row = self._connection().execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def to_dict(self):
+        with self._conn_lock:
+            rows = self._connection().execute("SELECT key, value FROM state ORDER BY key").fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    def update(self, values):
+        """Saves all of ``values`` atomically; returns once they are durable."""
+        commit = _Commit(dict(values))
+        with self._commit_cond:
+            self._pending.append(commit)
+            while self._committing and not commit.done:
+                self._commit_cond.wait()
+            if commit.done:
+                # Written by the group commit of another thread
+                if commit.error is not None:
+                    raise commit.error
+                return
+            self._committing = True
+            batch, self._pending = self._pending, []
+        error = None
+        try:
+            self._write_batch(batch)
+        except Exception as e:
+            error = e
+        with self._commit_cond:
+            for pending in batch:
+                pending.done = True
+                pending.error = error
+            self._committing = False
+            self._commit_cond.notify_all()
+        if error is not None:
+            raise error
+
+    def set(self, key, value):
+        self.update({key: value})
+
+    def close(self):
+        with self._conn_lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -0,0 +1,106 @@
+import glob
+import logging
+import os
+import threading
+
+from sdc_tool.async_engine import AsyncCollectionEngine
+from sdc_tool.connection_pool import ConnectionPool
+from sdc_tool.scheduler import DaemonScheduler
+
+logger = logging.getLogger(__name__)
+
+
+class _LimitedRun:
+    """Runs one collector while holding a slot of the supervisor-wide run limit."""
+
+    def __init__(self, collector, run_slots):
+        self.collector = collector
+        self.run_slots = run_slots
+
+    def run(self):
+        with self.run_slots:
+            return self.collector.run()
+
+
+class PipelineSupervisor:
+    """Schedules every pipeline defined in a directory of config files inside one process.
+
+    Pipelines share a ``ConnectionPool`` (one keep-alive session per QRadar console or
+    WebHDFS namenode) and the ``StateStore`` of their state file. Each pipeline keeps its
+    own schedule and ``max_parallel_windows``; ``max_concurrent_pipelines`` caps how many
+    pipelines are collecting at the same time. Pipelines using the asyncio collection
+    engine share one event loop, so search quotas are enforced across pipelines.
+    """
+
+    def __init__(self, config_dir, max_concurrent_pipelines=4, pool_size=10, io_threads=8):
+        # Imported here to avoid a circular import, main imports this module for the CLI
+        from sdc_tool.main import SecurityDataCollector
+
+        self.config_dir = config_dir
+        self.connection_pool = ConnectionPool(pool_size)
+        self.engine = AsyncCollectionEngine(io_threads=io_threads)
+        self.stop_event = threading.Event()
+        self.run_slots = threading.BoundedSemaphore(max(1, int(max_concurrent_pipelines)))
+
+        config_files = sorted(glob.glob(os.path.join(config_dir, "*.ini")))
+        if not config_files:
+            raise ValueError(f"No pipeline config files (*.ini) found in {config_dir}")
+
+        self.collectors = []
+        seen = {}
+        for config_file in config_files:
+            collector = SecurityDataCollector(config_file, connection_pool=self.connection_pool,
+                                              configure_logging=False, engine=self.engine)
+            state_key = (os.path.abspath(collector.state_file_path), collector.pipeline_key)
+            if state_key in seen:
+                raise ValueError(f"Pipelines {seen[state_key]} and {config_file} share state key "
+                                 f"'{collector.pipeline_key}' in {collector.state_file_path}; set a unique "
+                                 f"[Pipeline] name in each config.")
+            seen[state_key] = config_file
+            collector.stop_event = self.stop_event
+            self.collectors.append(collector)
+        logger.info(f"Loaded {len(self.collectors)} pipelines from {config_dir}: "
+                    f"{', '.join(c.pipeline_key for c in self.collectors)}")
+
+    def close(self):
+        for collector in self.collectors:
+            collector.close()
+        self.engine.close()
+        self.connection_pool.close()
+
+    def stop(self):
+        logger.info("Stop requested; finishing the windows in flight before shutting down.")
+        self.stop_event.set()
+
+    def _run_all(self, target):
+        threads = []
+        for collector in self.collectors:
+            thread = threading.Thread(target=target, args=(collector,), name=f"sdc-{collector.pipeline_key}")
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+
+    def run_once(self):
+        def run(collector):
+            try:
+                _LimitedRun(collector, self.run_slots).run()
+            except Exception as e:
+                logger.error(f"Pipeline {collector.pipeline_key} failed: {e}")
+        try:
+            self._run_all(run)
+        finally:
+            self.close()
+
+    def run_forever(self):
+        def run(collector):
+            DaemonScheduler(
+                _LimitedRun(collector, self.run_slots),
+                interval_minutes=collector.config.getint("General.collection_window_minutes", 10),
+                delay_seconds=collector.config.getint("General.schedule_delay_seconds", 30),
+                stop_event=self.stop_event,
+            ).run_forever()
+        try:
+            self._run_all(run)
+        finally:
+            self.close()
@@ -0,0 +1,156 @@
+import asyncio
+import logging
+import math
+import threading
+from datetime import datetime
+
+from sdc_tool.base_source import WindowOverflowError
+
+logger = logging.getLogger(__name__)
+
+
+class AdaptiveWindowPlanner:
+    """Sizes collection windows from the event volume they hold.
+
+    Two mechanisms work together:
+
+    * ``collect`` bisects a window whenever the source reports that it reached the
+      event ceiling (``WindowOverflowError``), recursively, so busy periods are
+      collected completely instead of being truncated.
+    * ``plan`` (only when ``adaptive`` is enabled) uses the learned event density per
+      hour of day to split blocks that are expected to be too busy up front and to
+      merge runs of quiet blocks into a single query.
+
+    Density is an exponentially weighted average of events per second for each hour
+    of the day, kept in ``history`` so it can be persisted in the state file.
+    """
+
+    def __init__(self, max_events, adaptive=False, min_window_seconds=60, max_merge_windows=6,
+                 target_fill=0.5, smoothing=0.3, history=None):
+        self.max_events = max_events
+        self.adaptive = adaptive
+        self.min_window_seconds = max(1, int(min_window_seconds))
+        self.max_merge_windows = max(1, int(max_merge_windows))
+        self.target_fill = target_fill
+        self.smoothing = smoothing
+        self.history = dict(history or {})
+        # Starts of the blocks merged into each planned window after its first one
+        self._merged = {}
+        self._lock = threading.Lock()
+
+    @property
+    def target_events(self):
+        return self.max_events * self.target_fill
+
+    @staticmethod
+    def _hour(start_ms):
+        return str(datetime.fromtimestamp(start_ms / 1000).hour)
+
+    def predict(self, start_ms, end_ms):
+        """Expected event count for a window, or None while its hour has no history yet."""
+        with self._lock:
+            density = self.history.get(self._hour(start_ms))
+        if density is None:
+            return None
+        return density * (end_ms - start_ms) / 1000
+
+    def record(self, start_ms, end_ms, record_count):
+        seconds = (end_ms - start_ms) / 1000
+        if seconds <= 0:
+            return
+        density = record_count / seconds
+        hour = self._hour(start_ms)
+        with self._lock:
+            previous = self.history.get(hour)
+            self.history[hour] = density if previous is None else (
+                self.smoothing * density + (1 - self.smoothing) * previous)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.history)
+
+    def plan(self, time_blocks):
+        if not self.adaptive or not self.max_events or not time_blocks:
+            return list(time_blocks)
+
+        planned, merged = [], {}
+        merged_start, merged_end, merged_events, merged_count = None, None, 0.0, 0
+        for start_ms, end_ms in time_blocks:
+            predicted = self.predict(start_ms, end_ms)
+            can_merge = (merged_start is not None and merged_end == start_ms and predicted is not None
+                         and merged_count < self.max_merge_windows
+                         and merged_events + predicted <= self.target_events)
+            if can_merge:
+                merged.setdefault(merged_start, []).append(start_ms)
+                merged_end = end_ms
+                merged_events += predicted
+                merged_count += 1
+                continue
+            if merged_start is not None:
+                planned.append((merged_start, merged_end))
+                merged_start = None
+
+            if predicted is not None and predicted > self.target_events:
+                planned.extend(self._split(start_ms, end_ms, predicted))
+            elif predicted is not None:
+                merged_start, merged_end, merged_events, merged_count = start_ms, end_ms, predicted, 1
+            else:
+                planned.append((start_ms, end_ms))
+        if merged_start is not None:
+            planned.append((merged_start, merged_end))
+        with self._lock:
+            self._merged = merged
+
+        if len(planned) != len(time_blocks):
+            logger.info(f"Adaptive planner turned {len(time_blocks)} time blocks into {len(planned)} queries.")
+        return planned
+
+    def replaced_starts(self, start_ms):
+        """Starts of the blocks ``plan`` merged into the window starting at ``start_ms``, after its first one.
+
+        A run that crashed before moving the watermark may have published them as windows
+        of their own; the merged window replaces their files.
+        """
+        with self._lock:
+            return list(self._merged.get(start_ms, []))
+
+    def _split(self, start_ms, end_ms, predicted):
+        max_parts = max(1, (end_ms - start_ms) // (self.min_window_seconds * 1000))
+        parts = int(min(max_parts, math.ceil(predicted / self.target_events)))
+        step = (end_ms - start_ms) / parts
+        bounds = [start_ms + int(round(i * step)) for i in range(parts)] + [end_ms]
+        return list(zip(bounds[:-1], bounds[1:]))
+
+    def _bisect_or_raise(self, error, start_ms, end_ms):
+        half_ms = (end_ms - start_ms) // 2
+        if half_ms < self.min_window_seconds * 1000:
+            logger.error(f"Block {start_ms} - {end_ms} holds {error.record_count} events and cannot be split below "
+                         f"{self.min_window_seconds}s; raise max_events_per_window.")
+            raise error
+        logger.info(f"Block {start_ms} - {end_ms} reached {error.record_count} events, splitting in half.")
+        return start_ms + half_ms
+
+    def collect(self, collect_fn, start_ms, end_ms):
+        """Collects a window, bisecting it while the source reports an overflow.
+
+        Returns a list of ``(start_ms, end_ms, collected_data)`` in time order.
+        """
+        try:
+            collected_data = collect_fn(start_ms, end_ms)
+        except WindowOverflowError as e:
+            middle_ms = self._bisect_or_raise(e, start_ms, end_ms)
+            return self.collect(collect_fn, start_ms, middle_ms) + self.collect(collect_fn, middle_ms, end_ms)
+        self.record(start_ms, end_ms, len(collected_data) if collected_data else 0)
+        return [(start_ms, end_ms, collected_data)]
+
+    async def collect_async(self, collect_fn, start_ms, end_ms):
+        """``collect`` for a coroutine ``collect_fn``; both halves of a split are searched concurrently."""
+        try:
+            collected_data = await collect_fn(start_ms, end_ms)
+        except WindowOverflowError as e:
+            middle_ms = self._bisect_or_raise(e, start_ms, end_ms)
+            first, second = await asyncio.gather(self.collect_async(collect_fn, start_ms, middle_ms),
+                                                 self.collect_async(collect_fn, middle_ms, end_ms))
+            return first + second
+        self.record(start_ms, end_ms, len(collected_data) if collected_data else 0)
+        return [(start_ms, end_ms, collected_data)]
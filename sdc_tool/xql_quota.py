@@ -0,0 +1,171 @@
+import contextlib
+import logging
+import threading
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+
+class QuotaExhaustedError(Exception):
+    """Raised when a query cannot run without eating into the quota kept for live windows."""
+
+
+def query_cost_units(reply):
+    """Compute units charged for a query, from the ``query_cost`` of its results reply.
+
+    ``query_cost`` is a mapping of tenant to units (or a bare number); None if absent.
+    """
+    cost = reply.get("query_cost") if isinstance(reply, dict) else None
+    if isinstance(cost, dict):
+        return sum(float(v) for v in cost.values() if isinstance(v, (int, float)))
+    if isinstance(cost, (int, float)):
+        return float(cost)
+    return None
+
+
+class QuotaScheduler:
+    """Admission control for XQL queries against a tenant's daily compute-unit quota.
+
+    Every finished query reports what it cost and how much quota is left; the scheduler
+    learns the average cost per second of queried time from that. A backfill query is
+    only started if its predicted cost fits above ``live_reserve_units``, so catching up
+    on old windows can never starve live collection; live queries may use the reserve.
+    The number of queries in flight shrinks as the budget above the reserve runs low,
+    between ``max_concurrency`` and one. Use ``QuotaScheduler.for_tenant`` to share one
+    scheduler among all pipelines querying the same tenant.
+    """
+
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, live_reserve_units=0.0, daily_quota_units=0.0, max_concurrency=4, smoothing=0.3):
+        self.live_reserve_units = max(0.0, float(live_reserve_units))
+        self.daily_quota_units = max(0.0, float(daily_quota_units))
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.smoothing = smoothing
+        self.remaining_units = None
+        self.consumed_units = 0.0
+        self.cost_per_second = None
+        self.cost_per_query = None
+        self.in_flight = 0
+        self._reserved_units = 0.0
+        self._day = self._today()
+        self._condition = threading.Condition()
+
+    @classmethod
+    def for_tenant(cls, tenant, **kwargs):
+        with cls._instances_lock:
+            if tenant not in cls._instances:
+                cls._instances[tenant] = cls(**kwargs)
+            return cls._instances[tenant]
+
+    @staticmethod
+    def _today():
+        return datetime.now(timezone.utc).date()
+
+    def _roll_day(self):
+        today = self._today()
+        if today != self._day:
+            logger.info(f"XQL quota day changed; used {self.consumed_units:.4f} units on {self._day}.")
+            self._day, self.consumed_units = today, 0.0
+            self.remaining_units = None
+
+    def _remaining(self):
+        if self.remaining_units is not None:
+            return self.remaining_units
+        if self.daily_quota_units:
+            return self.daily_quota_units - self.consumed_units
+        return None
+
+    def predict(self, window_seconds):
+        if self.cost_per_second is None:
+            return 0.0
+        return self.cost_per_second * max(0.0, window_seconds)
+
+    def concurrency(self, live=False):
+        """How many queries may be in flight given the remaining budget."""
+        remaining = self._remaining()
+        if remaining is None or not self.cost_per_query:
+            return self.max_concurrency
+        budget = remaining - self._reserved_units - (0.0 if live else self.live_reserve_units)
+        # Queries already in flight hold their reservation, the budget decides how many more may start
+        return max(1, min(self.max_concurrency, self.in_flight + int(budget // self.cost_per_query)))
+
+    def _check(self, predicted, live):
+        """Returns True if the query may start now, False if it should wait; raises if it never will."""
+        self._roll_day()
+        remaining = self._remaining()
+        if remaining is not None:
+            budget = remaining - self._reserved_units - (0.0 if live else self.live_reserve_units)
+            if budget <= 0 or predicted > budget:
+                if self.in_flight == 0 or budget <= 0:
+                    kind = "live" if live else "backfill"
+                    raise QuotaExhaustedError(
+                        f"XQL quota left {remaining:.4f} units (reserve {self.live_reserve_units}), "
+                        f"{kind} query needs about {predicted:.4f}")
+                return False
+        return self.in_flight < self.concurrency(live)
+
+    def try_acquire(self, window_seconds, live=False):
+        """Non-blocking ``acquire``; returns the units reserved, or None if the query has to wait."""
+        predicted = self.predict(window_seconds)
+        with self._condition:
+            if not self._check(predicted, live):
+                return None
+            self.in_flight += 1
+            self._reserved_units += predicted
+            return predicted
+
+    def acquire(self, window_seconds, live=False):
+        """Blocks until a query over ``window_seconds`` of data may start; returns the units reserved."""
+        predicted = self.predict(window_seconds)
+        with self._condition:
+            while not self._check(predicted, live):
+                self._condition.wait(1.0)
+            self.in_flight += 1
+            self._reserved_units += predicted
+            return predicted
+
+    @contextlib.contextmanager
+    def slot(self):
+        """Holds one of the tenant's concurrent request slots without charging quota (e.g. to download results)."""
+        with self._condition:
+            while self.in_flight >= self.max_concurrency:
+                self._condition.wait(1.0)
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self.in_flight -= 1
+                self._condition.notify_all()
+
+    def release(self, reserved_units, window_seconds, reply=None):
+        """Frees a slot and learns from the reply of the finished query (``query_cost``, ``remaining_quota``)."""
+        with self._condition:
+            self.in_flight -= 1
+            self._reserved_units = max(0.0, self._reserved_units - reserved_units)
+            cost = query_cost_units(reply)
+            if cost is not None:
+                self.consumed_units += cost
+                self.cost_per_query = cost if self.cost_per_query is None else (
+                    self.smoothing * cost + (1 - self.smoothing) * self.cost_per_query)
+                if window_seconds > 0:
+                    rate = cost / window_seconds
+                    self.cost_per_second = rate if self.cost_per_second is None else (
+                        self.smoothing * rate + (1 - self.smoothing) * self.cost_per_second)
+            remaining = reply.get("remaining_quota") if isinstance(reply, dict) else None
+            if isinstance(remaining, (int, float)):
+                self.remaining_units = float(remaining)
+            elif cost is not None and self.remaining_units is not None:
+                self.remaining_units -= cost
+            self._condition.notify_all()
+
+    def stats(self):
+        with self._condition:
+            return {
+                "remaining_units": self._remaining(),
+                "consumed_units": round(self.consumed_units, 6),
+                "cost_per_second": self.cost_per_second,
+                "in_flight": self.in_flight,
+            }
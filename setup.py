@@ -10,6 +10,11 @@ setup(
         'cortex-xdr-client',
         'hdfs',
     ],
+    extras_require={
+        'parquet': ['pyarrow>=10'],
+        'zstd': ['zstandard>=0.17'],
+        'lz4': ['lz4>=3'],
+    },
     entry_points={
         'console_scripts': [
             'sdc = sdc_tool.main:main',
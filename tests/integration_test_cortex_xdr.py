@@ -8,6 +8,8 @@ import time
 import shutil
 from datetime import datetime
 
+from sdc_tool.state_store import StateStore
+
 class IntegrationTestCortexXDRSource(unittest.TestCase):
     def setUp(self):
         self.config_file = "/tmp/integration_test_cortex_xdr_config.ini"
@@ -126,8 +128,7 @@ local_file.max_file_size_mb = 100
         self.assertEqual(decompressed_read_data, json_data)
 
         # Verify state file content
-        with open(self.state_file, "r") as f:
-            state_content = json.load(f)
+        state_content = StateStore(self.state_file).to_dict()
         self.assertIn("cortex_xdr_local_file", state_content)
         self.assertIsNotNone(state_content["cortex_xdr_local_file"])
 
@@ -0,0 +1,76 @@
+import asyncio
+import threading
+import time
+import unittest
+
+from sdc_tool.async_engine import AsyncCollectionEngine
+from sdc_tool.base_source import WindowOverflowError
+from sdc_tool.pipeline import CollectionPipeline
+from sdc_tool.window_planner import AdaptiveWindowPlanner
+
+
+class TestAsyncCollectionEngine(unittest.TestCase):
+    def setUp(self):
+        self.engine = AsyncCollectionEngine(io_threads=2)
+
+    def tearDown(self):
+        self.engine.close()
+
+    def test_many_searches_wait_concurrently_on_one_loop(self):
+        threads = set()
+
+        async def search(i):
+            threads.add(threading.current_thread().name)
+            await asyncio.sleep(0.2)
+            return i
+
+        started = time.monotonic()
+        futures = [self.engine.submit(search(i)) for i in range(30)]
+        self.assertEqual([f.result(timeout=5) for f in futures], list(range(30)))
+        # 30 searches of 0.2s each overlap instead of running one after another
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertEqual(threads, {"sdc-event-loop"})
+
+    def test_limit_caps_searches_per_quota_key(self):
+        state = {"open": 0, "max_open": 0}
+
+        async def search(key):
+            async with self.engine.limit(key, 2):
+                state["open"] += 1
+                state["max_open"] = max(state["max_open"], state["open"])
+                await asyncio.sleep(0.02)
+                state["open"] -= 1
+
+        futures = [self.engine.submit(search("qradar:console")) for _ in range(8)]
+        for future in futures:
+            future.result(timeout=5)
+        self.assertEqual(state["max_open"], 2)
+
+    def test_pipeline_collects_windows_on_engine(self):
+        written = []
+
+        async def collect(start_ms, end_ms):
+            await asyncio.sleep(0.01)
+            return f"data-{start_ms}"
+
+        pipeline = CollectionPipeline(None, lambda s, e, d: written.append(d), lambda s, e: None,
+                                      max_parallel_windows=4, engine=self.engine, async_collect_fn=collect)
+        committed = pipeline.run([(i * 1000, (i + 1) * 1000) for i in range(6)])
+
+        self.assertEqual(committed, 6)
+        self.assertEqual(written, [f"data-{i * 1000}" for i in range(6)])
+
+    def test_planner_collect_async_splits_overflowing_window(self):
+        planner = AdaptiveWindowPlanner(max_events=10, min_window_seconds=60)
+
+        async def collect(start_ms, end_ms):
+            if end_ms - start_ms > 300000:
+                raise WindowOverflowError(10, 10)
+            return ["x"]
+
+        parts = self.engine.submit(planner.collect_async(collect, 0, 600000)).result(timeout=5)
+        self.assertEqual([(s, e) for s, e, _ in parts], [(0, 300000), (300000, 600000)])
+
+
+if __name__ == "__main__":
+    unittest.main()
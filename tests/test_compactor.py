@@ -0,0 +1,222 @@
+import gzip
+import json
+import os
+import shutil
+import unittest
+from datetime import datetime
+from unittest.mock import MagicMock
+
+from sdc_tool.compression import get_codec, lz4_frame, zstandard
+from sdc_tool.compactor import Compactor, LocalFileSystem, WebHDFSFileSystem, partition_end
+from sdc_tool.state_store import StateStore
+
+
+class TestCompactor(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = "/tmp/sdc_test_compactor"
+        self.root = os.path.join(self.test_dir, "output")
+        os.makedirs(self.root, exist_ok=True)
+        self.state_store = StateStore(os.path.join(self.test_dir, "state.json"))
+        self.now = datetime(2024, 1, 3, 12, 0, 0)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def _write(self, partition, name, records):
+        path = os.path.join(self.root, partition, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+        return path
+
+    def _read_partition(self, partition):
+        records = []
+        directory = os.path.join(self.root, partition)
+        for name in sorted(os.listdir(directory)):
+            with gzip.open(os.path.join(directory, name), "rt", encoding="utf-8") as f:
+                records.extend(json.loads(line) for line in f)
+        return sorted(records, key=lambda r: r["id"])
+
+    def _compactor(self, **kwargs):
+        return Compactor(LocalFileSystem(), [self.root], self.state_store, state_key="test.compaction", **kwargs)
+
+    def test_partition_end(self):
+        self.assertEqual(partition_end("qradar/api_events/20240101"), datetime(2024, 1, 2))
+        self.assertEqual(partition_end("dt=20240101/hr=05"), datetime(2024, 1, 1, 6))
+        self.assertIsNone(partition_end("qradar/api_events"))
+
+    def test_merges_closed_partition_without_recompressing(self):
+        for i in range(5):
+            self._write("20240101", f"data_00{i}000_1.json.gz", [{"id": i}])
+        inputs = sorted(os.listdir(os.path.join(self.root, "20240101")))
+        original_bytes = b"".join(open(os.path.join(self.root, "20240101", n), "rb").read() for n in inputs)
+
+        self.assertEqual(self._compactor().run(self.now), 1)
+
+        files = os.listdir(os.path.join(self.root, "20240101"))
+        self.assertEqual(len(files), 1)
+        self.assertTrue(files[0].startswith("compacted_"))
+        # Byte-for-byte concatenation of the original gzip members
+        with open(os.path.join(self.root, "20240101", files[0]), "rb") as f:
+            self.assertEqual(f.read(), original_bytes)
+        self.assertEqual(self._read_partition("20240101"), [{"id": i} for i in range(5)])
+        self.assertEqual(os.listdir(self.root), ["20240101"])
+
+    def test_open_partition_is_left_alone(self):
+        self._write("20240103", "data_000000_1.json.gz", [{"id": 1}])
+        self._write("20240103", "data_001000_1.json.gz", [{"id": 2}])
+
+        self.assertEqual(self._compactor().run(self.now), 0)
+        self.assertEqual(len(os.listdir(os.path.join(self.root, "20240103"))), 2)
+
+    def test_compacted_partition_is_not_processed_twice(self):
+        for i in range(3):
+            self._write("20240101", f"data_00{i}000_1.json.gz", [{"id": i}])
+        compactor = self._compactor()
+        compactor.run(self.now)
+        self.assertEqual(compactor.run(self.now), 0)
+
+        # A late file makes the partition eligible again
+        self._write("20240101", "data_235959_1.json.gz", [{"id": 9}])
+        self.assertEqual(compactor.run(self.now), 1)
+        self.assertEqual(self._read_partition("20240101"), [{"id": 0}, {"id": 1}, {"id": 2}, {"id": 9}])
+
+    def test_large_files_are_kept_and_bins_respect_target(self):
+        big = self._write("dt=20240101/hr=00", "data_big.json.gz",
+                          [{"id": i, "blob": os.urandom(4096).hex()} for i in range(400)])
+        for i in range(3):
+            self._write("dt=20240101/hr=00", f"data_small_{i}.json.gz", [{"id": 1000 + i}])
+        big_inode = os.stat(big).st_ino
+
+        self._compactor(target_file_size_mb=1).run(self.now)
+
+        files = sorted(os.listdir(os.path.join(self.root, "dt=20240101", "hr=00")))
+        self.assertEqual(len(files), 2)
+        self.assertEqual(os.stat(os.path.join(self.root, "dt=20240101", "hr=00", "data_big.json.gz")).st_ino, big_inode)
+        self.assertEqual(len(self._read_partition("dt=20240101/hr=00")), 403)
+
+    def test_files_not_merged_are_published_with_the_merged_files(self):
+        self._write("dt=20240101/hr=00", "data_big.json.gz", [{"id": i, "blob": os.urandom(4096).hex()} for i in range(400)])
+        for i in range(3):
+            self._write("dt=20240101/hr=00", f"data_small_{i}.json.gz", [{"id": 1000 + i}])
+        compactor = self._compactor(target_file_size_mb=1)
+        compactor._finish_swap = MagicMock(side_effect=RuntimeError("killed"))
+
+        compactor.run(self.now)
+
+        # The swap published the large file together with the merged one, not after it
+        files = sorted(os.listdir(os.path.join(self.root, "dt=20240101", "hr=00")))
+        self.assertEqual(len(files), 2)
+        self.assertIn("data_big.json.gz", files)
+        self.assertEqual(len(self._read_partition("dt=20240101/hr=00")), 403)
+
+    def test_swap_killed_before_it_started_puts_staged_files_back(self):
+        self._write("dt=20240101/hr=00", "data_big.json.gz", [{"id": i, "blob": os.urandom(4096).hex()} for i in range(400)])
+        for i in range(3):
+            self._write("dt=20240101/hr=00", f"data_small_{i}.json.gz", [{"id": 1000 + i}])
+        compactor = self._compactor(target_file_size_mb=1)
+        original_rename = compactor.fs.rename
+
+        def rename(src, dst):
+            if dst.endswith("_old_hr=00"):
+                raise RuntimeError("killed")
+            original_rename(src, dst)
+        compactor.fs.rename = rename
+        compactor.run(self.now)
+        self.assertNotIn("data_big.json.gz", os.listdir(os.path.join(self.root, "dt=20240101", "hr=00")))
+
+        compactor = self._compactor(target_file_size_mb=1)
+        compactor._recover()
+        self.assertEqual(sorted(os.listdir(os.path.join(self.root, "dt=20240101", "hr=00"))),
+                         ["data_big.json.gz"] + [f"data_small_{i}.json.gz" for i in range(3)])
+        self.assertEqual(os.listdir(os.path.join(self.root, "dt=20240101")), ["hr=00"])
+
+    @unittest.skipUnless(zstandard is not None and lz4_frame is not None, "zstandard and lz4 are not installed")
+    def test_zstd_and_lz4_files_are_merged_by_codec(self):
+        partition = os.path.join(self.root, "20240101")
+        os.makedirs(partition)
+        for codec in ("zstd", "lz4"):
+            for i in range(3):
+                with get_codec(codec).open(os.path.join(partition, f"data_{i}.json{get_codec(codec).extension}"), "wt") as f:
+                    f.write(json.dumps({"id": i, "codec": codec}) + "\n")
+
+        self.assertEqual(self._compactor().run(self.now), 1)
+
+        files = sorted(os.listdir(partition))
+        self.assertEqual(sorted(os.path.splitext(name)[1] for name in files), [".lz4", ".zst"])
+        for name in files:
+            codec = "zstd" if name.endswith(".zst") else "lz4"
+            with get_codec(codec).open(os.path.join(partition, name), "rt") as f:
+                self.assertEqual([json.loads(line) for line in f], [{"id": i, "codec": codec} for i in range(3)])
+
+    def test_interrupted_swap_is_completed(self):
+        for i in range(3):
+            self._write("20240101", f"data_00{i}000_1.json.gz", [{"id": i}])
+        compactor = self._compactor()
+        partition = os.path.join(self.root, "20240101")
+        original_finish = compactor._finish_swap
+        compactor._finish_swap = MagicMock(side_effect=RuntimeError("killed"))
+        compactor.run(self.now)
+        self.assertTrue(os.path.exists(os.path.join(self.root, "_old_20240101")))
+
+        compactor._finish_swap = original_finish
+        compactor.run(self.now)
+
+        self.assertEqual(os.listdir(self.root), ["20240101"])
+        self.assertEqual(self._read_partition("20240101"), [{"id": 0}, {"id": 1}, {"id": 2}])
+        self.assertEqual(self.state_store.get("test.compaction")[partition]["status"], "done")
+
+    def test_partition_recreated_during_swap_keeps_every_file(self):
+        for i in range(3):
+            self._write("20240101", f"data_00{i}000_1.json.gz", [{"id": i}])
+        fs = LocalFileSystem()
+        original_rename = fs.rename
+
+        def rename(src, dst):
+            original_rename(src, dst)
+            if dst.endswith("_old_20240101"):
+                # A late write lands between the two renames of the swap
+                self._write("20240101", "data_235959_1.json.gz", [{"id": 9}])
+        fs.rename = rename
+        compactor = Compactor(fs, [self.root], self.state_store, state_key="test.compaction")
+
+        self.assertEqual(compactor.run(self.now), 1)
+
+        self.assertEqual(os.listdir(self.root), ["20240101"])
+        self.assertEqual(self._read_partition("20240101"), [{"id": 0}, {"id": 1}, {"id": 2}, {"id": 9}])
+
+    def test_old_files_are_kept_until_merged_files_are_in_place(self):
+        for i in range(3):
+            self._write("20240101", f"data_00{i}000_1.json.gz", [{"id": i}])
+        compactor = self._compactor()
+        compactor._move_files = MagicMock(side_effect=RuntimeError("killed"))
+        original_rename = compactor.fs.rename
+
+        def rename(src, dst):
+            if src.endswith("_compacting_20240101"):
+                raise OSError("Directory not empty")
+            original_rename(src, dst)
+        compactor.fs.rename = rename
+        compactor.run(self.now)
+        self.assertTrue(os.path.exists(os.path.join(self.root, "_old_20240101")))
+
+        compactor = self._compactor()
+        compactor.run(self.now)
+        self.assertEqual(os.listdir(self.root), ["20240101"])
+        self.assertEqual(self._read_partition("20240101"), [{"id": 0}, {"id": 1}, {"id": 2}])
+
+    def test_webhdfs_concat_streams_chunks(self):
+        client = MagicMock()
+        readers = {"/a": [b"one", b"two"], "/b": [b"three"]}
+        client.read.side_effect = lambda path, chunk_size: MagicMock(
+            __enter__=lambda self: iter(readers[path]), __exit__=lambda self, *args: None)
+        uploaded = []
+        client.write.side_effect = lambda path, data, overwrite: uploaded.extend(data)
+
+        WebHDFSFileSystem(client).concat("/out", ["/a", "/b"])
+        self.assertEqual(uploaded, [b"one", b"two", b"three"])
+
+
+if __name__ == "__main__":
+    unittest.main()
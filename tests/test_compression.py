@@ -0,0 +1,68 @@
+import gzip
+import io
+import os
+import shutil
+import unittest
+
+from sdc_tool.compression import Codec, ParallelBlockWriter, get_codec, lz4_frame, zstandard
+
+
+class TestCompression(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = "/tmp/sdc_test_compression"
+        os.makedirs(self.test_dir, exist_ok=True)
+        self.data = b"".join(b'{"id": %d, "payload": "%s"}\n' % (i, os.urandom(16).hex().encode()) for i in range(20000))
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def _round_trip(self, codec):
+        path = os.path.join(self.test_dir, f"data.json{codec.extension}")
+        with codec.open(path, "wb") as f:
+            f.write(self.data)
+        with codec.open_reader(path) as f:
+            self.assertEqual(f.read(), self.data)
+        with codec.open(path, "rt") as f:
+            self.assertEqual(sum(1 for _ in f), 20000)
+
+    def test_gzip_round_trip(self):
+        self._round_trip(get_codec("gzip", level=1))
+        self._round_trip(get_codec("gzip", threads=4))
+
+    @unittest.skipUnless(zstandard is not None, "zstandard is not installed")
+    def test_zstd_round_trip(self):
+        self._round_trip(get_codec("zstd"))
+        self._round_trip(get_codec("zstd", threads=4))
+
+    @unittest.skipUnless(lz4_frame is not None, "lz4 is not installed")
+    def test_lz4_round_trip(self):
+        self._round_trip(get_codec("lz4"))
+        self._round_trip(get_codec("lz4", threads=4))
+
+    def test_parallel_gzip_is_standard_multi_member_stream(self):
+        output = io.BytesIO()
+        codec = get_codec("gzip", threads=3)
+        with ParallelBlockWriter(output, codec.compress_block, threads=3, block_size=64 * 1024) as writer:
+            for i in range(0, len(self.data), 10000):
+                writer.write(self.data[i:i + 10000])
+
+        # Blocks are written back in order as independent gzip members
+        self.assertEqual(gzip.decompress(output.getvalue()), self.data)
+        self.assertGreater(output.getvalue().count(b"\x1f\x8b\x08"), len(self.data) // (64 * 1024))
+        self.assertFalse(output.closed)
+
+    def test_unknown_codec(self):
+        with self.assertRaises(ValueError):
+            get_codec("bzip2")
+
+    def test_codec_must_implement_every_operation(self):
+        class HalfCodec(Codec):
+            def compress_block(self, data):
+                return data
+
+        with self.assertRaises(TypeError):
+            HalfCodec()
+
+
+if __name__ == "__main__":
+    unittest.main()
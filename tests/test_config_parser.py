@@ -44,6 +44,16 @@ hadoop.hdfs_qradar_api_events_base_path = /data/test/qradar/events
         source, sink = parser.get_pipeline_config()
         self.assertEqual(source, "qradar")
         self.assertEqual(sink, "hdfs")
+        self.assertEqual(parser.get_sink_identifiers(), ["hdfs"])
+
+    def test_get_multiple_sinks(self):
+        parser = ConfigParser(self.test_config_file)
+        parser.config["Pipeline"]["pipeline"] = "qradar > hdfs,  local_file"
+        self.assertEqual(parser.get_pipeline_config(), ("qradar", "hdfs, local_file"))
+        self.assertEqual(parser.get_sink_identifiers(), ["hdfs", "local_file"])
+        parser.config["Pipeline"]["pipeline"] = "qradar > hdfs, hdfs"
+        with self.assertRaises(ValueError):
+            parser.get_sink_identifiers()
 
     def test_get_general_settings(self):
         parser = ConfigParser(self.test_config_file)
@@ -4,8 +4,11 @@ from datetime import datetime, timedelta
 import os
 import gzip
 import json
+import re
 
-from sdc_tool.cortex_xdr_source import CortexXDRSource
+from sdc_tool.base_source import WindowOverflowError
+from sdc_tool.cortex_xdr_source import CortexXDRSource, XQLQueryError
+from sdc_tool.xql_quota import QuotaExhaustedError, QuotaScheduler
 from sdc_tool.config_parser import ConfigParser
 
 class TestCortexXDRSource(unittest.TestCase):
@@ -29,6 +32,7 @@ cortex_xdr.api.fqdn = mock_cortex_xdr_fqdn
 cortex_xdr.api.key_id = mock_cortex_xdr_key_id
 cortex_xdr.api.key = mock_cortex_xdr_key
 cortex_xdr.api.xql_query_template_alerts = dataset = xdr_data | filter _time > \'{start_time}\' and _time <= \'{end_time}\' | fields * | limit 10000
+cortex_xdr.tmp_dir = /tmp
 """
         with open(self.mock_config_file, "w") as f:
             f.write(config_content)
@@ -100,3 +104,166 @@ cortex_xdr.api.xql_query_template_alerts = dataset = xdr_data | filter _time > \
         self.assertEqual(decompressed_data.strip(), expected_data.strip())
 
 
+
+    def _source_with_client(self, MockCortexXDRClient, statuses, records=None):
+        xql_api = MockCortexXDRClient.return_value.xql_api = MagicMock()
+        xql_api.start_xql_query.return_value = "query_1"
+        xql_api.get_query_results_request.side_effect = statuses
+        body = gzip.compress("\n".join(json.dumps(r) for r in (records or [])).encode("utf-8"))
+
+        def write_query_results(query_id, output_gz_file):
+            with open(output_gz_file, "wb") as f:
+                f.write(body)
+            return len(body)
+
+        xql_api.write_query_results.side_effect = write_query_results
+        return CortexXDRSource(self.config_parser), xql_api
+
+    @patch("sdc_tool.cortex_xdr_source.CortexXDRClient")
+    @patch("time.sleep")
+    def test_polls_status_and_downloads_once(self, MockSleep, MockCortexXDRClient):
+        records = [{"alert_id": 1}, {"alert_id": 2}]
+        source, xql_api = self._source_with_client(MockCortexXDRClient, [
+            {"reply": {"status": "PENDING"}},
+            {"reply": {"status": "PENDING", "number_of_results": 0}},
+            {"reply": {"status": "SUCCESS", "number_of_results": 2}},
+        ], records)
+
+        payload = source.collect_data(datetime(2024, 1, 1, 0, 0, 0), datetime(2024, 1, 1, 1, 0, 0))
+        try:
+            self.assertEqual(len(payload), 2)
+            xql_api.write_query_results.assert_called_once()
+            self.assertEqual(set(payload.timings), {"submit", "execution", "download"})
+            # Backoff between status checks instead of a fixed 2s
+            self.assertEqual([c.args[0] for c in MockSleep.call_args_list], [0.5, 1.0])
+        finally:
+            os.remove(payload.path)
+
+    @patch("sdc_tool.cortex_xdr_source.CortexXDRClient")
+    @patch("time.sleep")
+    def test_failed_query_fails_fast(self, MockSleep, MockCortexXDRClient):
+        source, xql_api = self._source_with_client(MockCortexXDRClient, [
+            {"reply": {"status": "PENDING"}},
+            {"reply": {"status": "FAIL", "error": "quota exceeded"}},
+        ])
+
+        with self.assertRaises(XQLQueryError) as ctx:
+            source.collect_data(datetime(2024, 1, 1, 0, 0, 0), datetime(2024, 1, 1, 1, 0, 0))
+        self.assertEqual(ctx.exception.status, "FAIL")
+        self.assertEqual(MockSleep.call_count, 1)
+        xql_api.write_query_results.assert_not_called()
+
+    @patch("sdc_tool.cortex_xdr_source.CortexXDRClient")
+    def test_failed_query_cost_is_learned(self, MockCortexXDRClient):
+        source, xql_api = self._source_with_client(MockCortexXDRClient, [
+            {"reply": {"status": "PARTIAL_SUCCESS", "query_cost": {"tenant": 2.0}, "remaining_quota": 0.5}},
+        ])
+        source.quota = QuotaScheduler()
+
+        with self.assertRaises(XQLQueryError):
+            source.collect_data(datetime(2024, 1, 1, 0, 0, 0), datetime(2024, 1, 1, 1, 0, 0))
+        self.assertEqual(source.quota.remaining_units, 0.5)
+        self.assertEqual(source.quota.stats()["consumed_units"], 2.0)
+
+    @patch("sdc_tool.cortex_xdr_source.CortexXDRClient")
+    def test_overflow_detected_before_download(self, MockCortexXDRClient):
+        source, xql_api = self._source_with_client(MockCortexXDRClient, [
+            {"reply": {"status": "SUCCESS", "number_of_results": 500000}},
+        ])
+
+        with self.assertRaises(WindowOverflowError):
+            source.collect_data(datetime(2024, 1, 1, 0, 0, 0), datetime(2024, 1, 1, 1, 0, 0))
+        xql_api.write_query_results.assert_not_called()
+
+    @patch("sdc_tool.cortex_xdr_source.CortexXDRClient")
+    @patch("time.sleep")
+    def test_range_hitting_row_cap_is_split_and_merged_in_order(self, MockSleep, MockCortexXDRClient):
+        # The template in the mock config ends with "| limit 10000"
+        start_ms = int(datetime(2024, 1, 1, 0, 0, 0).timestamp() * 1000)
+        end_ms = int(datetime(2024, 1, 1, 1, 0, 0).timestamp() * 1000)
+        middle_ms = start_ms + (end_ms - start_ms) // 2
+        xql_api = MockCortexXDRClient.return_value.xql_api = MagicMock()
+        counts = {(start_ms, end_ms): 10000, (start_ms, middle_ms): 4000, (middle_ms, end_ms): 6000}
+        queries = {}
+
+        def start_xql_query(query):
+            start, end = map(int, re.findall(r"'(\d+)'", query))
+            query_id = f"q_{start}_{end}"
+            queries[query_id] = (start, end)
+            return query_id
+
+        def get_query_results_request(query_id, pending_flag, limit):
+            return {"reply": {"status": "SUCCESS", "number_of_results": counts[queries[query_id]]}}
+
+        def write_query_results(query_id, output_gz_file):
+            with open(output_gz_file, "wb") as f:
+                f.write(gzip.compress(json.dumps({"range": list(queries[query_id])}).encode("utf-8") + b"\n"))
+
+        xql_api.start_xql_query.side_effect = start_xql_query
+        xql_api.get_query_results_request.side_effect = get_query_results_request
+        xql_api.write_query_results.side_effect = write_query_results
+        source = CortexXDRSource(self.config_parser)
+        self.assertEqual(source.row_cap, 10000)
+
+        payload = source.collect_data(datetime(2024, 1, 1, 0, 0, 0), datetime(2024, 1, 1, 1, 0, 0))
+        try:
+            self.assertEqual(len(payload), 10000)
+            with gzip.open(payload.path, "rt") as f:
+                self.assertEqual([json.loads(line)["range"] for line in f],
+                                 [[start_ms, middle_ms], [middle_ms, end_ms]])
+            # Only the two complete halves were downloaded, never the truncated full range
+            self.assertEqual(xql_api.write_query_results.call_count, 2)
+        finally:
+            os.remove(payload.path)
+
+    @patch("cortex_xdr_client.api.base_api.requests.request")
+    @patch("time.sleep")
+    def test_status_and_count_come_from_the_full_reply(self, MockSleep, MockRequest):
+        # Real client, fake HTTP: get_query_results would drop everything but "results"
+        replies = [
+            {"reply": "query_1"},
+            {"reply": {"status": "PENDING", "number_of_results": 0, "results": {"data": []}}},
+            {"reply": {"status": "SUCCESS", "number_of_results": 2, "query_cost": {"tenant": 0.5},
+                       "remaining_quota": 9.5, "results": {"data": []}}},
+        ]
+
+        def request(method, url, json=None, **kwargs):
+            response = MagicMock(status_code=200, is_redirect=False, headers={"Content-Type": "application/json"})
+            response.json.return_value = replies.pop(0)
+            if url.endswith("/get_query_results"):
+                self.assertEqual(json["request_data"], {"query_id": "query_1", "pending_flag": True, "limit": 0})
+            return response
+
+        MockRequest.side_effect = request
+        source = CortexXDRSource(self.config_parser)
+        source.quota = QuotaScheduler()
+        start_ms = int(datetime(2024, 1, 1, 0, 0, 0).timestamp() * 1000)
+
+        ranges = source._resolve_ranges(start_ms, start_ms + 3600000, {})
+
+        self.assertEqual(ranges, [(start_ms, start_ms + 3600000, "query_1", 2)])
+        self.assertEqual(MockSleep.call_count, 1)
+        # The quota fields of the reply reach the tenant's scheduler
+        self.assertEqual(source.quota.remaining_units, 9.5)
+        self.assertAlmostEqual(source.quota.predict(3600), 0.5)
+
+    @patch("sdc_tool.cortex_xdr_source.CortexXDRClient")
+    def test_range_without_count_is_checked_against_row_cap(self, MockCortexXDRClient):
+        source, xql_api = self._source_with_client(MockCortexXDRClient, [
+            {"reply": {"status": "SUCCESS"}},
+        ], [{"alert_id": i} for i in range(10000)])
+
+        with self.assertRaises(WindowOverflowError):
+            source.collect_data(datetime(2024, 1, 1, 0, 0, 0), datetime(2024, 1, 1, 1, 0, 0))
+        self.assertFalse(os.path.exists(source._temp_gz_file(datetime(2024, 1, 1, 0, 0, 0),
+                                                             datetime(2024, 1, 1, 1, 0, 0))))
+
+    @patch("sdc_tool.cortex_xdr_source.CortexXDRClient")
+    def test_backfill_query_refused_when_only_live_reserve_left(self, MockCortexXDRClient):
+        source, xql_api = self._source_with_client(MockCortexXDRClient, [])
+        source.quota = QuotaScheduler(live_reserve_units=5.0)
+        source.quota.remaining_units = 4.0
+
+        with self.assertRaises(QuotaExhaustedError):
+            source.collect_data(datetime(2024, 1, 1, 0, 0, 0), datetime(2024, 1, 1, 1, 0, 0))
+        xql_api.start_xql_query.assert_not_called()
@@ -0,0 +1,172 @@
+import gzip
+import json
+import os
+import shutil
+import unittest
+
+from sdc_tool.dedup import BloomFilter, DedupIndex, Deduplicator
+from sdc_tool.payload import FilePayload
+
+HOUR_MS = 3600 * 1000
+
+
+class TestDedupIndex(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = "/tmp/sdc_test_dedup"
+        os.makedirs(self.test_dir, exist_ok=True)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def test_bloom_filter_has_no_false_negatives(self):
+        bloom = BloomFilter.for_memory(64 * 1024, 0.001)
+        keys = [hash((i, "key")) & 0xFFFFFFFFFFFFFFFF for i in range(5000)]
+        for key in keys:
+            bloom.add(key)
+        self.assertTrue(all(key in bloom for key in keys))
+        self.assertLess(bloom.error_rate, 0.001)
+
+    def test_key_is_not_a_duplicate_of_its_own_window(self):
+        index = DedupIndex()
+        index.add([1, 2], window_ms=0)
+        self.assertFalse(index.seen(1, window_ms=0))
+        self.assertTrue(index.seen(1, window_ms=600000))
+        self.assertFalse(index.seen(3, window_ms=600000))
+
+    def test_old_buckets_are_folded_into_bloom_and_expire(self):
+        index = DedupIndex(bucket_seconds=3600, exact_buckets=2, retention_buckets=6)
+        index.add([1], window_ms=0)
+        index.add([2], window_ms=2 * HOUR_MS)
+
+        # Bucket 0 is past the exact range: only the Bloom filter knows key 1 now
+        self.assertEqual(len(index._exact), 1)
+        self.assertTrue(index.seen(1, window_ms=2 * HOUR_MS))
+
+        index.add([3], window_ms=10 * HOUR_MS)
+        self.assertFalse(index.seen(1, window_ms=10 * HOUR_MS))
+        self.assertTrue(index.seen(3, window_ms=11 * HOUR_MS))
+
+    def test_folded_window_is_not_a_duplicate_of_itself(self):
+        index = DedupIndex(bucket_seconds=3600, exact_buckets=1, retention_buckets=6)
+        index.add([1], window_ms=0)
+        index.add([2], window_ms=2 * HOUR_MS)
+        self.assertEqual(list(index._exact), [2])
+
+        # Window 0 is queried again: its own keys are only in the Bloom filter now
+        self.assertFalse(index.seen(1, window_ms=0))
+        self.assertTrue(index.seen(1, window_ms=2 * HOUR_MS))
+
+    def test_exact_sets_are_folded_early_over_memory_cap(self):
+        index = DedupIndex(exact_buckets=24, max_memory_mb=1)
+        index.add(range(3000), window_ms=0)
+        index.add(range(3000, 6000), window_ms=HOUR_MS)
+
+        self.assertLessEqual(index._exact_keys, index.max_exact_keys)
+        self.assertTrue(index.seen(5, window_ms=HOUR_MS))
+        self.assertLessEqual(index.memory_bytes, 1024 * 1024)
+
+    def test_save_and_load(self):
+        path = os.path.join(self.test_dir, "state.json.p.dedup")
+        index = DedupIndex(exact_buckets=1)
+        index.add([1, 2], window_ms=0)
+        index.add([3], window_ms=HOUR_MS)
+        index.save(path)
+
+        loaded = DedupIndex(exact_buckets=1)
+        self.assertTrue(loaded.load(path))
+        self.assertTrue(loaded.seen(1, window_ms=HOUR_MS))
+        self.assertFalse(loaded.seen(3, window_ms=HOUR_MS))
+        self.assertTrue(loaded.seen(3, window_ms=2 * HOUR_MS))
+        self.assertFalse(loaded.seen(1, window_ms=0))
+
+    def test_corrupt_index_starts_empty(self):
+        path = os.path.join(self.test_dir, "broken.dedup")
+        with open(path, "wb") as f:
+            f.write(b"not an index")
+        index = DedupIndex()
+        self.assertFalse(index.load(path))
+        self.assertEqual(len(index), 0)
+
+
+class TestDeduplicator(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = "/tmp/sdc_test_dedup"
+        os.makedirs(self.test_dir, exist_ok=True)
+        self.dedup = Deduplicator(DedupIndex(), ["qid", "starttime", "sourceip"], tmp_dir=self.test_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def _event(self, qid, starttime=1000, sourceip="10.0.0.1"):
+        return {"qid": qid, "starttime": starttime, "sourceip": sourceip}
+
+    def _payload(self, name, records):
+        path = os.path.join(self.test_dir, name)
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+        return FilePayload(path, len(records))
+
+    def test_duplicates_within_and_across_windows_are_dropped(self):
+        first = self.dedup.filter_window(0, [([self._event(1), self._event(1), self._event(2)], "qradar", "api_events")])
+        self.assertEqual(first.items[0][0], [self._event(1), self._event(2)])
+        self.assertEqual(first.dropped, 1)
+        self.dedup.commit(first)
+
+        second = self.dedup.filter_window(600000, [([self._event(2), self._event(3), {"other": 1}], "qradar", "api_events")])
+        self.assertEqual(second.items[0][0], [self._event(3), {"other": 1}])
+
+    def test_uncommitted_window_does_not_hide_its_events(self):
+        # The sink failed: the retry of the next window must still write them
+        self.dedup.filter_window(0, [([self._event(1)], "qradar", "api_events")])
+        retry = self.dedup.filter_window(600000, [([self._event(1)], "qradar", "api_events")])
+        self.assertEqual(retry.items[0][0], [self._event(1)])
+
+    def test_rewritten_window_keeps_its_events(self):
+        result = self.dedup.filter_window(0, [([self._event(1)], "qradar", "api_events")])
+        self.dedup.commit(result)
+        again = self.dedup.filter_window(0, [([self._event(1), self._event(2)], "qradar", "api_events")])
+        self.assertEqual(again.items[0][0], [self._event(1), self._event(2)])
+
+    def test_payload_without_duplicates_is_passed_through(self):
+        payload = self._payload("a.json.gz", [self._event(1), self._event(2)])
+        result = self.dedup.filter_window(0, [(payload, "qradar", "api_events")])
+        self.assertIs(result.items[0][0], payload)
+        self.assertEqual(result.temp_paths, [])
+
+    def test_payload_with_duplicates_is_rewritten(self):
+        self.dedup.commit(self.dedup.filter_window(0, [([self._event(1)], "qradar", "api_events")]))
+        payload = self._payload("b.json.gz", [self._event(1), self._event(2)])
+
+        result = self.dedup.filter_window(600000, [(payload, "qradar", "api_events")])
+
+        filtered = result.items[0][0]
+        self.assertEqual(len(filtered), 1)
+        self.assertEqual([json.loads(line) for line in filtered.iter_records()], [self._event(2)])
+        result.cleanup()
+        self.assertFalse(os.path.exists(filtered.path))
+        self.assertTrue(os.path.exists(payload.path))
+
+    def test_gzipped_bytes_are_filtered(self):
+        data = gzip.compress(b"".join(json.dumps(self._event(i % 2)).encode() + b"\n" for i in range(4)))
+        result = self.dedup.filter_window(0, [(data, "qradar", "api_events")])
+        lines = gzip.decompress(result.items[0][0]).splitlines()
+        self.assertEqual([json.loads(line)["qid"] for line in lines], [0, 1])
+
+    def test_index_save_is_throttled(self):
+        path = os.path.join(self.test_dir, "throttled.dedup")
+        dedup = Deduplicator(DedupIndex(), ["qid"], index_path=path, save_interval_seconds=3600)
+        dedup.commit(dedup.filter_window(0, [([self._event(1)], "qradar", "api_events")]))
+
+        dedup.save()
+        self.assertFalse(os.path.exists(path))
+        dedup.save(force=True)
+        self.assertTrue(os.path.exists(path))
+
+    def test_key_fields_are_required(self):
+        with self.assertRaises(ValueError):
+            Deduplicator(DedupIndex(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
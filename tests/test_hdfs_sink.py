@@ -1,4 +1,5 @@
 import unittest
+import io
 import os
 import shutil
 import json
@@ -6,8 +7,11 @@ import gzip
 from unittest.mock import patch, MagicMock
 from datetime import datetime
 import subprocess
+import threading
+import time
 
 from sdc_tool.hdfs_sink import HDFSSink
+from sdc_tool.payload import FilePayload
 from sdc_tool.config_parser import ConfigParser
 
 class TestHDFSSink(unittest.TestCase):
@@ -71,8 +75,15 @@ hadoop.max_file_size_mb = 256
 
         # Mock the HDFS client and its write method
         mock_hdfs_client = MagicMock()
+        mock_hdfs_client.status.return_value = None
         MockInsecureClient.return_value = mock_hdfs_client
-        mock_hdfs_client.write.return_value.__enter__.return_value = MagicMock()
+        written = io.BytesIO()
+
+        def write(hdfs_path, data=None, **kwargs):
+            if "/_manifests/" not in hdfs_path:
+                written.write(data.read())
+
+        mock_hdfs_client.write.side_effect = write
 
         sink = HDFSSink(self.config_parser)
         test_data = [
@@ -82,24 +93,194 @@ hadoop.max_file_size_mb = 256
         source_id = "qradar"
         input_type = "api_events"
 
-        sink.write_data(test_data, source_id, input_type)
+        sink.write_data(test_data, source_id, input_type, datetime(2024, 1, 1, 9, 0))
 
         # Assert that InsecureClient was called with the namenode URL
         MockInsecureClient.assert_called_once_with(sink.namenode_url)
 
-        # Assert that the write method was called on the HDFS client
-        # We need to be careful with the exact path as it includes datetime
-        mock_hdfs_client.write.assert_called_once()
-        args, kwargs = mock_hdfs_client.write.call_args
-        self.assertTrue(args[0].startswith("/data/security/qradar/events/"))
+        # Assert that the write method was called on the HDFS client (the other writes are the manifest)
+        data_writes = [c for c in mock_hdfs_client.write.call_args_list if "/_manifests/" not in c.args[0]]
+        self.assertEqual(len(data_writes), 1)
+        args, kwargs = data_writes[0]
+        self.assertTrue(args[0].startswith("/data/security/qradar/events/dt=20240101/hr=09/_temporary/"))
         self.assertTrue(args[0].endswith(".json.gz"))
-        self.assertEqual(kwargs["encoding"], "utf-8")
+        # Compressed bytes are written, so the WebHDFS writer must not text-encode them
+        self.assertNotIn("encoding", kwargs)
         self.assertTrue(kwargs["overwrite"])
+        lines = gzip.decompress(written.getvalue()).decode("utf-8").splitlines()
+        self.assertEqual([json.loads(line) for line in lines], test_data)
 
         # Assert that data was written (this is a conceptual check as we mocked the write)
         # In a real test, you might inspect the mock_hdfs_client.write.return_value
         # to ensure the correct data was passed to the underlying file-like object.
 
+    @patch("subprocess.run")
+    @patch("sdc_tool.hdfs_sink.InsecureClient")
+    def test_write_file_payload_streams_open_file(self, MockInsecureClient, MockSubprocessRun):
+        MockSubprocessRun.return_value = MagicMock(stdout="Kerberos ticket obtained", stderr="")
+        temp_file = "/tmp/sdc_test_hdfs_payload.json.gz"
+        with gzip.open(temp_file, "wt", encoding="utf-8") as f:
+            f.write('{"id": 1}\n')
+        streamed = {}
+
+        def write(hdfs_path, data=None, **kwargs):
+            if "/_manifests/" not in hdfs_path:
+                streamed["name"], streamed["closed"] = data.name, data.closed
+
+        MockInsecureClient.return_value.write.side_effect = write
+        MockInsecureClient.return_value.status.return_value = None
+        sink = HDFSSink(self.config_parser)
+        try:
+            sink.write_data(FilePayload(temp_file, 1, start_time=datetime(2024, 1, 1, 9, 0)), "qradar", "api_events")
+        finally:
+            os.remove(temp_file)
+
+        # The open file object is passed to WebHDFS, which uploads it in chunks
+        self.assertEqual(streamed, {"name": temp_file, "closed": False})
+        self.assertTrue(MockInsecureClient.return_value.write.call_args_list[0].kwargs["overwrite"])
+
+    @staticmethod
+    def _data_renames(client):
+        return [c.args for c in client.rename.call_args_list if "/_manifests/" not in c.args[0]]
+
+    @patch("subprocess.run")
+    @patch("sdc_tool.hdfs_sink.InsecureClient")
+    def test_uploads_to_temporary_name_then_renames(self, MockInsecureClient, MockSubprocessRun):
+        MockSubprocessRun.return_value = MagicMock(stdout="Kerberos ticket obtained", stderr="")
+        client = MockInsecureClient.return_value
+        client.status.return_value = None
+        client.write.return_value.__enter__.side_effect = lambda: io.BytesIO()
+        sink = HDFSSink(self.config_parser, pipeline_name="qradar_hdfs")
+        start, end = int(datetime(2024, 1, 1, 9, 0).timestamp() * 1000), int(datetime(2024, 1, 1, 9, 10).timestamp() * 1000)
+
+        sink.write_window(start, end, [(b"compressed", "qradar", "api_events", datetime(2024, 1, 1, 9, 0))])
+        sink.write_window(end, end + 600000, [(b"compressed", "qradar", "api_events", datetime(2024, 1, 1, 9, 10))])
+
+        # One client for the lifetime of the sink
+        MockInsecureClient.assert_called_once()
+        first_temp, first_final = self._data_renames(client)[0]
+        self.assertEqual(client.write.call_args_list[0].args[0], first_temp)
+        self.assertIn("/_temporary/", first_temp)
+        self.assertEqual(os.path.dirname(first_final), os.path.dirname(os.path.dirname(first_temp)))
+        self.assertEqual(os.path.basename(first_final), os.path.basename(first_temp))
+        # Named from the pipeline and the window, not from the time of writing
+        self.assertEqual(first_final, f"/data/security/qradar/events/dt=20240101/hr=09/"
+                                      f"data_qradar_hdfs_{start}_{end}_part0000.json.gz")
+        self.assertNotEqual(first_final, self._data_renames(client)[1][1])
+        self.assertTrue(any(c.args[1] == f"/data/security/qradar/events/_manifests/data_qradar_hdfs_{start}.json"
+                            for c in client.rename.call_args_list))
+
+    @patch("subprocess.run")
+    @patch("sdc_tool.hdfs_sink.InsecureClient")
+    def test_rewritten_window_replaces_its_files(self, MockInsecureClient, MockSubprocessRun):
+        MockSubprocessRun.return_value = MagicMock(stdout="Kerberos ticket obtained", stderr="")
+        client = MockInsecureClient.return_value
+        client.status.return_value = None
+        client.write.return_value.__enter__.side_effect = lambda: io.BytesIO()
+        sink = HDFSSink(self.config_parser, pipeline_name="qradar_hdfs")
+        item = (b"compressed", "qradar", "api_events", datetime(2024, 1, 1, 9, 0))
+
+        sink.write_window(0, 600000, [item])
+        sink.write_window(0, 600000, [item])
+
+        first, second = self._data_renames(client)
+        self.assertEqual(first, second)
+        # WebHDFS rename does not overwrite, so the earlier file is dropped first
+        client.delete.assert_any_call(first[1])
+
+    @patch("subprocess.run")
+    @patch("sdc_tool.hdfs_sink.InsecureClient")
+    def test_failed_upload_removes_temporary_file(self, MockInsecureClient, MockSubprocessRun):
+        MockSubprocessRun.return_value = MagicMock(stdout="Kerberos ticket obtained", stderr="")
+        client = MockInsecureClient.return_value
+        client.write.side_effect = IOError("datanode unreachable")
+        client.status.return_value = None
+        sink = HDFSSink(self.config_parser)
+
+        with self.assertRaises(IOError):
+            sink.write_data(b"compressed", "qradar", "api_events")
+        client.rename.assert_not_called()
+        self.assertIn("/_temporary/", client.delete.call_args.args[0])
+
+    @staticmethod
+    def _track_uploads(client):
+        lock = threading.Lock()
+        state = {"active": 0, "max_active": 0, "records": 0}
+
+        def write(hdfs_path, data=None, **kwargs):
+            if "/_manifests/" in hdfs_path:
+                return
+            with lock:
+                state["active"] += 1
+                state["max_active"] = max(state["max_active"], state["active"])
+                state["records"] += len(gzip.decompress(data.read()).splitlines())
+            time.sleep(0.05)
+            with lock:
+                state["active"] -= 1
+
+        client.write.side_effect = write
+        client.status.return_value = None
+        return state
+
+    @patch("subprocess.run")
+    @patch("sdc_tool.hdfs_sink.InsecureClient")
+    def test_sub_windows_upload_in_parallel(self, MockInsecureClient, MockSubprocessRun):
+        MockSubprocessRun.return_value = MagicMock(stdout="Kerberos ticket obtained", stderr="")
+        state = self._track_uploads(MockInsecureClient.return_value)
+        self.config_parser.config["Hadoop"]["hadoop.upload_workers"] = "3"
+        sink = HDFSSink(self.config_parser)
+        temp_file = "/tmp/sdc_test_hdfs_parallel.json.gz"
+        with open(temp_file, "wb") as f:
+            f.write(gzip.compress(b'{"id": 1}\n'))
+        try:
+            sink.write_window(0, 6 * 60000, [(FilePayload(temp_file, 1), "qradar", "api_events",
+                                              datetime.fromtimestamp(i * 60)) for i in range(6)])
+        finally:
+            sink.close()
+            os.remove(temp_file)
+
+        self.assertEqual(len(self._data_renames(MockInsecureClient.return_value)), 6)
+        self.assertEqual(state["max_active"], 3)
+
+    @patch("subprocess.run")
+    @patch("sdc_tool.hdfs_sink.InsecureClient")
+    def test_rolled_files_of_one_payload_upload_in_parallel(self, MockInsecureClient, MockSubprocessRun):
+        MockSubprocessRun.return_value = MagicMock(stdout="Kerberos ticket obtained", stderr="")
+        state = self._track_uploads(MockInsecureClient.return_value)
+        self.config_parser.config["Hadoop"]["hadoop.upload_workers"] = "3"
+        self.config_parser.config["Hadoop"]["hadoop.max_records_per_file"] = "2"
+        sink = HDFSSink(self.config_parser)
+        temp_file = "/tmp/sdc_test_hdfs_rolled.json.gz"
+        with open(temp_file, "wb") as f:
+            f.write(gzip.compress(b"".join(b'{"id": %d}\n' % i for i in range(12))))
+        try:
+            # Over max_records_per_file, so the payload is rolled into 6 files
+            sink.write_data(FilePayload(temp_file, 12, start_time=datetime(2024, 1, 1, 9, 0)), "qradar", "api_events")
+        finally:
+            sink.close()
+            os.remove(temp_file)
+
+        self.assertEqual(len(self._data_renames(MockInsecureClient.return_value)), 6)
+        self.assertEqual(state["records"], 12)
+        self.assertEqual(state["max_active"], 3)
+
+    @patch("subprocess.run")
+    @patch("sdc_tool.hdfs_sink.InsecureClient")
+    def test_write_many_uploads_windows_in_parallel(self, MockInsecureClient, MockSubprocessRun):
+        MockSubprocessRun.return_value = MagicMock(stdout="Kerberos ticket obtained", stderr="")
+        state = self._track_uploads(MockInsecureClient.return_value)
+        self.config_parser.config["Hadoop"]["hadoop.upload_workers"] = "3"
+        sink = HDFSSink(self.config_parser, pipeline_name="qradar_hdfs")
+        try:
+            sink.write_many([([{"id": i}], "qradar", "api_events", datetime.fromtimestamp(i * 60)) for i in range(6)])
+        finally:
+            sink.close()
+
+        renames = self._data_renames(MockInsecureClient.return_value)
+        self.assertEqual(len(renames), 6)
+        self.assertEqual(len({final for _, final in renames}), 6)
+        self.assertEqual(state["max_active"], 3)
+
     @patch("subprocess.run")
     @patch("sdc_tool.hdfs_sink.InsecureClient")
     def test_write_empty_data(self, MockInsecureClient, MockSubprocessRun):
@@ -114,6 +295,22 @@ hadoop.max_file_size_mb = 256
         # We can assert that it was called once for initialization.
         MockSubprocessRun.assert_called_once()
 
+    @patch("subprocess.run")
+    @patch("sdc_tool.hdfs_sink.InsecureClient")
+    def test_kerberos_ticket_renewed_after_interval(self, MockInsecureClient, MockSubprocessRun):
+        MockSubprocessRun.return_value = MagicMock(stdout="Kerberos ticket obtained", stderr="")
+        MockInsecureClient.return_value.write.return_value.__enter__.side_effect = lambda: io.BytesIO()
+        MockInsecureClient.return_value.status.return_value = None
+
+        sink = HDFSSink(self.config_parser)
+        sink.write_data([{"id": 1}], "qradar", "api_events")
+        self.assertEqual(MockSubprocessRun.call_count, 1)
+
+        # Pretend the ticket was obtained longer ago than the renewal interval
+        sink._kerberos_authenticated_at -= sink.kerberos_renew_interval_minutes * 60
+        sink.write_data([{"id": 2}], "qradar", "api_events")
+        self.assertEqual(MockSubprocessRun.call_count, 2)
+
     @patch("subprocess.run")
     @patch("sdc_tool.hdfs_sink.InsecureClient")
     def test_kerberos_authentication_failure(self, MockInsecureClient, MockSubprocessRun):
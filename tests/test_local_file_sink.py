@@ -6,6 +6,9 @@ import shutil
 from datetime import datetime
 
 from sdc_tool.local_file_sink import LocalFileSink
+from sdc_tool.compression import get_codec, zstandard
+from sdc_tool.parquet_writer import pa, pq
+from sdc_tool.payload import FilePayload
 from sdc_tool.config_parser import ConfigParser
 
 class TestLocalFileSink(unittest.TestCase):
@@ -44,22 +47,23 @@ local_file.max_file_size_mb = 1
         source_id = "qradar"
         input_type = "api_events"
 
-        sink.write_data(test_data, source_id, input_type)
+        sink.write_data(test_data, source_id, input_type, datetime(2024, 1, 1, 13, 50))
 
-        today_str = datetime.now().strftime("%Y%m%d")
-        expected_dir = os.path.join(self.test_output_dir, source_id, input_type, today_str)
+        expected_dir = os.path.join(self.test_output_dir, source_id, input_type, "dt=20240101", "hr=13")
         self.assertTrue(os.path.exists(expected_dir))
 
-        # Check if a .json.gz file was created
-        written_files = [f for f in os.listdir(expected_dir) if f.endswith(".json.gz")]
-        self.assertGreater(len(written_files), 0)
+        # max_records_per_file = 2, so the three records are rolled into two files
+        written_files = sorted(f for f in os.listdir(expected_dir) if f.endswith(".json.gz"))
+        self.assertEqual(len(written_files), 2)
 
         # Read the content and verify
-        with gzip.open(os.path.join(expected_dir, written_files[0]), "rt", encoding="utf-8") as f:
-            lines = f.readlines()
-            self.assertEqual(len(lines), len(test_data))
-            for i, line in enumerate(lines):
-                self.assertEqual(json.loads(line.strip()), test_data[i])
+        lines = []
+        for written_file in written_files:
+            with gzip.open(os.path.join(expected_dir, written_file), "rt", encoding="utf-8") as f:
+                lines.extend(f.readlines())
+        self.assertEqual(len(lines), len(test_data))
+        for i, line in enumerate(lines):
+            self.assertEqual(json.loads(line.strip()), test_data[i])
 
     def test_write_empty_data(self):
         sink = LocalFileSink(self.config_parser)
@@ -67,12 +71,205 @@ local_file.max_file_size_mb = 1
         input_type = "api_events"
 
         # Ensure no directory is created for empty data
-        expected_dir = os.path.join(self.test_output_dir, source_id, input_type, datetime.now().strftime("%Y%m%d"))
+        expected_dir = os.path.join(self.test_output_dir, source_id, input_type)
         self.assertFalse(os.path.exists(expected_dir))
 
-        sink.write_data([], source_id, input_type)
+        sink.write_data([], source_id, input_type, datetime(2024, 1, 1))
         self.assertFalse(os.path.exists(expected_dir))
 
+    def test_write_file_payload_links_compressed_file(self):
+        sink = LocalFileSink(self.config_parser)
+        os.makedirs(self.test_output_dir, exist_ok=True)
+        temp_file = os.path.join(self.test_output_dir, "collected.json.gz")
+        with gzip.open(temp_file, "wt", encoding="utf-8") as f:
+            f.write('{"id": 1}\n{"id": 2}\n')
+
+        sink.write_data(FilePayload(temp_file, 2, start_time=datetime(2024, 1, 1, 9, 0)), "qradar", "api_events")
+
+        expected_dir = os.path.join(self.test_output_dir, "qradar", "api_events", "dt=20240101", "hr=09")
+        written = os.path.join(expected_dir, os.listdir(expected_dir)[0])
+        # Same inode: the compressed data was handed over without being read or rewritten
+        self.assertEqual(os.stat(written).st_ino, os.stat(temp_file).st_ino)
+        self.assertTrue(os.path.exists(temp_file))
+
+    def test_file_payload_over_limit_is_rolled(self):
+        sink = LocalFileSink(self.config_parser)
+        os.makedirs(self.test_output_dir, exist_ok=True)
+        temp_file = os.path.join(self.test_output_dir, "collected.json.gz")
+        with gzip.open(temp_file, "wt", encoding="utf-8") as f:
+            for i in range(5):
+                f.write(json.dumps({"id": i}) + "\n")
+
+        sink.write_data(FilePayload(temp_file, 5), "qradar", "api_events", datetime(2024, 1, 1, 9, 0))
+
+        expected_dir = os.path.join(self.test_output_dir, "qradar", "api_events", "dt=20240101", "hr=09")
+        written_files = sorted(os.listdir(expected_dir))
+        counts = []
+        for written_file in written_files:
+            with gzip.open(os.path.join(expected_dir, written_file), "rt", encoding="utf-8") as f:
+                counts.append(len(f.readlines()))
+        self.assertEqual(counts, [2, 2, 1])
+
+    def test_partition_by_event_time_field(self):
+        self.config_parser.config["General"] = {"partition_field": "starttime", "tmp_dir": self.test_output_dir}
+        sink = LocalFileSink(self.config_parser)
+        test_data = [
+            {"id": 1, "starttime": int(datetime(2024, 1, 1, 9, 59).timestamp() * 1000)},
+            {"id": 2, "starttime": int(datetime(2024, 1, 1, 10, 1).timestamp() * 1000)},
+            {"id": 3},
+        ]
+
+        sink.write_data(test_data, "qradar", "api_events", datetime(2024, 1, 1, 9, 50))
+
+        def read_ids(partition_dir):
+            ids = []
+            for name in sorted(os.listdir(partition_dir)):
+                with gzip.open(os.path.join(partition_dir, name), "rt", encoding="utf-8") as f:
+                    ids.extend(json.loads(line)["id"] for line in f)
+            return ids
+
+        base_dir = os.path.join(self.test_output_dir, "qradar", "api_events", "dt=20240101")
+        # Records without the field fall back to the window start partition
+        self.assertEqual(read_ids(os.path.join(base_dir, "hr=09")), [1, 3])
+        self.assertEqual(read_ids(os.path.join(base_dir, "hr=10")), [2])
+        # The per-partition temp files are cleaned up
+        self.assertEqual([name for name in os.listdir(self.test_output_dir) if name.startswith("sdc_partition_")], [])
+
+    def test_legacy_daily_layout(self):
+        self.config_parser.config["General"] = {"partition_layout": "legacy"}
+        sink = LocalFileSink(self.config_parser)
+
+        sink.write_data([{"id": 1}], "qradar", "api_events", datetime(2023, 12, 31, 23, 0))
+
+        self.assertTrue(os.path.isdir(os.path.join(self.test_output_dir, "qradar", "api_events", "20231231")))
+
+    @unittest.skipUnless(pa is not None, "pyarrow is not installed")
+    def test_parquet_output_converts_file_payload(self):
+        self.config_parser.config["General"] = {"output_format": "parquet"}
+        sink = LocalFileSink(self.config_parser)
+        os.makedirs(self.test_output_dir, exist_ok=True)
+        temp_file = os.path.join(self.test_output_dir, "collected.json.gz")
+        with gzip.open(temp_file, "wt", encoding="utf-8") as f:
+            f.write('{"id": 1}\n{"id": 2}\n')
+
+        sink.write_data(FilePayload(temp_file, 2), "qradar", "api_events", datetime(2024, 1, 1, 9, 0))
+
+        expected_dir = os.path.join(self.test_output_dir, "qradar", "api_events", "dt=20240101", "hr=09")
+        written_files = os.listdir(expected_dir)
+        self.assertEqual(len(written_files), 1)
+        self.assertTrue(written_files[0].endswith(".parquet"))
+        self.assertEqual(pq.read_table(os.path.join(expected_dir, written_files[0])).to_pylist(),
+                         [{"id": 1}, {"id": 2}])
+
+    @unittest.skipUnless(zstandard is not None, "zstandard is not installed")
+    def test_event_time_split_uses_the_sink_codec(self):
+        self.config_parser.config["General"] = {"partition_field": "starttime", "tmp_dir": self.test_output_dir,
+                                                "compression_codec": "zstd"}
+        sink = LocalFileSink(self.config_parser)
+        test_data = [{"id": 1, "starttime": int(datetime(2024, 1, 1, 9, 59).timestamp() * 1000)},
+                     {"id": 2, "starttime": int(datetime(2024, 1, 1, 10, 1).timestamp() * 1000)}]
+
+        with sink.partitioner.split(test_data, datetime(2024, 1, 1, 9, 50)) as parts:
+            self.assertEqual([part.codec for _, part in parts], ["zstd", "zstd"])
+            self.assertTrue(all(part.path.endswith(".json.zst") for _, part in parts))
+            # Already in the sink's format, so the split files are passed through as they are
+            self.assertTrue(all(sink._passthrough(part) for _, part in parts))
+            self.assertEqual([json.loads(line) for _, part in parts for line in part.iter_records()], test_data)
+
+    @unittest.skipUnless(zstandard is not None, "zstandard is not installed")
+    def test_zstd_codec_recompresses_gzip_payload(self):
+        self.config_parser.config["General"] = {"compression_codec": "zstd", "compression_threads": "2"}
+        sink = LocalFileSink(self.config_parser)
+        os.makedirs(self.test_output_dir, exist_ok=True)
+        temp_file = os.path.join(self.test_output_dir, "collected.json.gz")
+        with gzip.open(temp_file, "wt", encoding="utf-8") as f:
+            f.write('{"id": 1}\n{"id": 2}\n')
+
+        sink.write_data(FilePayload(temp_file, 2), "qradar", "api_events", datetime(2024, 1, 1, 9, 0))
+
+        expected_dir = os.path.join(self.test_output_dir, "qradar", "api_events", "dt=20240101", "hr=09")
+        written_files = os.listdir(expected_dir)
+        self.assertTrue(written_files[0].endswith(".json.zst"))
+        with get_codec("zstd").open(os.path.join(expected_dir, written_files[0]), "rt") as f:
+            self.assertEqual([json.loads(line) for line in f], [{"id": 1}, {"id": 2}])
+
+    def test_rewritten_window_replaces_its_files(self):
+        sink = LocalFileSink(self.config_parser, pipeline_name="qradar_local_file")
+        start = int(datetime(2024, 1, 1, 9, 0).timestamp() * 1000)
+        end = start + 600000
+        records = [{"id": i} for i in range(3)]
+
+        sink.write_window(start, end, [(records, "qradar", "api_events", datetime(2024, 1, 1, 9, 0))])
+        # A retry after a crash returns fewer records: the surplus file of the first attempt goes away
+        sink.write_window(start, end, [(records[:2], "qradar", "api_events", datetime(2024, 1, 1, 9, 0))])
+
+        root = os.path.join(self.test_output_dir, "qradar", "api_events")
+        self.assertEqual(sorted(os.listdir(os.path.join(root, "dt=20240101", "hr=09"))),
+                         [f"data_qradar_local_file_{start}_{end}_part0000.json.gz"])
+        with open(os.path.join(root, "_manifests", f"data_qradar_local_file_{start}.json")) as f:
+            manifest = json.load(f)
+        self.assertEqual(manifest["files"], [f"dt=20240101/hr=09/data_qradar_local_file_{start}_{end}_part0000.json.gz"])
+
+    def test_merged_window_replaces_windows_published_inside_it(self):
+        sink = LocalFileSink(self.config_parser, pipeline_name="p")
+        first, second = datetime(2024, 1, 1, 9, 0), datetime(2024, 1, 1, 9, 10)
+        start, middle, end = (int(t.timestamp() * 1000) for t in (first, second, datetime(2024, 1, 1, 9, 20)))
+        sink.write_window(start, middle, [([{"id": 1}], "qradar", "api_events", first)])
+        sink.write_window(middle, end, [([{"id": 2}], "qradar", "api_events", second)])
+
+        # Crash before the watermark was saved; the re-plan merges both windows into one
+        sink.write_window(start, end, [([{"id": 1}, {"id": 2}], "qradar", "api_events", first)], replaces=[middle])
+
+        root = os.path.join(self.test_output_dir, "qradar", "api_events")
+        self.assertEqual(os.listdir(os.path.join(root, "dt=20240101", "hr=09")), [f"data_p_{start}_{end}_part0000.json.gz"])
+        manifests = [name for name in os.listdir(os.path.join(root, "_manifests")) if name.endswith(".json")]
+        self.assertEqual(manifests, [f"data_p_{start}.json"])
+
+    def test_old_manifests_are_pruned(self):
+        sink = LocalFileSink(self.config_parser, pipeline_name="p")
+        day = datetime(2024, 1, 1, 9, 0)
+        start = int(day.timestamp() * 1000)
+        sink.write_window(start, start + 600000, [([{"id": 1}], "qradar", "api_events", day)])
+        later = start + 25 * 3600 * 1000
+        sink.write_window(later, later + 600000, [([{"id": 2}], "qradar", "api_events", datetime(2024, 1, 2, 10, 0))])
+
+        self.assertEqual(sink.prune_manifests(later - 24 * 3600 * 1000), 1)
+
+        manifest_dir = os.path.join(self.test_output_dir, "qradar", "api_events", "_manifests")
+        self.assertEqual([name for name in os.listdir(manifest_dir) if name.endswith(".json")], [f"data_p_{later}.json"])
+        # Only the manifest goes; the published files stay
+        self.assertEqual(len(os.listdir(os.path.join(self.test_output_dir, "qradar", "api_events", "dt=20240101", "hr=09"))), 1)
+
+    def test_items_of_a_window_are_named_by_their_sub_window(self):
+        sink = LocalFileSink(self.config_parser, pipeline_name="p")
+        first, middle = datetime(2024, 1, 1, 9, 0), datetime(2024, 1, 1, 9, 5)
+        start, split, end = (int(t.timestamp() * 1000) for t in (first, middle, datetime(2024, 1, 1, 9, 10)))
+
+        sink.write_window(start, end, [([{"id": 1}], "qradar", "api_events", first),
+                                       ([{"id": 2}], "qradar", "api_events", middle)])
+
+        self.assertEqual(sorted(os.listdir(os.path.join(self.test_output_dir, "qradar", "api_events", "dt=20240101", "hr=09"))),
+                         [f"data_p_{start}_{split}_part0000.json.gz", f"data_p_{split}_{end}_part0000.json.gz"])
+
+    def test_failed_window_leaves_no_files(self):
+        sink = LocalFileSink(self.config_parser)
+
+        def broken_records():
+            yield {"id": 1}
+            yield {"id": 2}
+            yield {"id": 3}
+            raise IOError("source stream broke")
+
+        with self.assertRaises(IOError):
+            sink.write_window(0, 600000, [(broken_records(), "qradar", "api_events", datetime(2024, 1, 1, 9, 0))])
+        partition_dir = os.path.join(self.test_output_dir, "qradar", "api_events", "dt=20240101", "hr=09")
+        self.assertEqual(os.listdir(partition_dir), [])
+
+    def test_unsupported_output_format(self):
+        self.config_parser.config["General"] = {"output_format": "csv"}
+        with self.assertRaises(ValueError):
+            LocalFileSink(self.config_parser)
+
 if __name__ == '__main__':
     unittest.main()
 
@@ -0,0 +1,176 @@
+import unittest
+from unittest.mock import patch
+from datetime import datetime
+import os
+import json
+import shutil
+import gzip
+
+from sdc_tool.main import SecurityDataCollector
+from sdc_tool.payload import FilePayload
+from sdc_tool.state_store import StateStore
+
+class TestSecurityDataCollector(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = "/tmp/sdc_test_main"
+        self.state_file = os.path.join(self.test_dir, "state.json")
+        self.mock_config_file = "mock_main_config.ini"
+        os.makedirs(self.test_dir, exist_ok=True)
+        self.create_mock_config()
+
+    def tearDown(self):
+        if os.path.exists(self.mock_config_file):
+            os.remove(self.mock_config_file)
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+
+    def create_mock_config(self):
+        config_content = f"""
+[Pipeline]
+pipeline = qradar > local_file
+
+[General]
+state_file_path = {self.state_file}
+log_level = INFO
+collection_window_minutes = 10
+max_parallel_windows = 4
+
+[QRadar]
+qradar.initial_collection_timestamp = 2024-01-01 00:00:00
+qradar.input_type = api_events
+
+[LocalFile]
+local_file.base_path = {self.test_dir}/output
+"""
+        with open(self.mock_config_file, "w") as f:
+            f.write(config_content)
+
+    def _blocks(self, count):
+        start = int(datetime(2024, 1, 1, 0, 0, 0).timestamp() * 1000)
+        step = 10 * 60 * 1000
+        return [(start + i * step, start + (i + 1) * step) for i in range(count)]
+
+    def _saved_time(self):
+        return datetime.fromisoformat(StateStore(self.state_file).get("qradar_local_file"))
+
+    @patch("sdc_tool.main.QRadarSource")
+    def test_run_commits_all_windows_in_order(self, MockQRadarSource):
+        MockQRadarSource.return_value.collect_data.return_value = "/tmp/data.json.gz"
+        sdc = SecurityDataCollector(self.mock_config_file)
+        blocks = self._blocks(5)
+
+        with patch.object(sdc, "_split_time_windows", return_value=blocks):
+            sdc.run()
+
+        self.assertEqual(MockQRadarSource.return_value.collect_data.call_count, 5)
+        self.assertEqual(self._saved_time(), datetime.fromtimestamp(blocks[-1][1] / 1000))
+
+    @patch("sdc_tool.main.QRadarSource")
+    def test_run_does_not_skip_failed_middle_window(self, MockQRadarSource):
+        blocks = self._blocks(5)
+        failed_start = datetime.fromtimestamp(blocks[2][0] / 1000)
+
+        def collect_data(start_time, end_time):
+            if start_time == failed_start:
+                raise RuntimeError("search failed")
+            return "/tmp/data.json.gz"
+
+        MockQRadarSource.return_value.collect_data.side_effect = collect_data
+        sdc = SecurityDataCollector(self.mock_config_file)
+
+        with patch.object(sdc, "_split_time_windows", return_value=blocks):
+            sdc.run()
+
+        # The watermark stops right before the failed window even though later windows finished.
+        self.assertEqual(self._saved_time(), datetime.fromtimestamp(blocks[1][1] / 1000))
+
+    @patch("sdc_tool.main.QRadarSource")
+    def test_written_temp_files_are_removed(self, MockQRadarSource):
+        temp_file = os.path.join(self.test_dir, "collected.json.gz")
+        with open(temp_file, "wb") as f:
+            f.write(b"compressed")
+        MockQRadarSource.return_value.collect_data.return_value = FilePayload(temp_file, 1)
+        MockQRadarSource.return_value.input_type = "api_events"
+        sdc = SecurityDataCollector(self.mock_config_file)
+
+        with patch.object(sdc, "_split_time_windows", return_value=self._blocks(1)):
+            sdc.run()
+
+        self.assertFalse(os.path.exists(temp_file))
+        # Partitioned by the window start, not by the day the window was written
+        output_dir = os.path.join(self.test_dir, "output", "qradar", "api_events", "dt=20240101", "hr=00")
+        self.assertEqual(len(os.listdir(output_dir)), 1)
+
+    @patch("sdc_tool.main.QRadarSource")
+    def test_spooled_windows_survive_sink_outage(self, MockQRadarSource):
+        with open(self.mock_config_file, "a") as f:
+            f.write(f"\n[Spool]\nspool.enabled = true\nspool.dir = {self.test_dir}/spool\n")
+
+        def collect_data(start_time, end_time):
+            path = os.path.join(self.test_dir, f"collected_{start_time:%H%M}.json.gz")
+            with gzip.open(path, "wt", encoding="utf-8") as f:
+                f.write('{"id": 1}\n')
+            return FilePayload(path, 1)
+
+        MockQRadarSource.return_value.collect_data.side_effect = collect_data
+        MockQRadarSource.return_value.input_type = "api_events"
+        sdc = SecurityDataCollector(self.mock_config_file)
+        blocks = self._blocks(3)
+
+        with patch.object(sdc, "_split_time_windows", return_value=blocks), \
+                patch.object(sdc.sink, "_write_staged", side_effect=ConnectionError("sink down")):
+            sdc.run()
+
+        # The watermark advances although the sink failed; the windows wait in the spool
+        self.assertEqual(self._saved_time(), datetime.fromtimestamp(blocks[-1][1] / 1000))
+        self.assertEqual(len(sdc.spool.entries()), 3)
+
+        with patch.object(sdc, "_split_time_windows", return_value=[]):
+            sdc.run()
+
+        self.assertEqual(sdc.spool.entries(), [])
+        output_dir = os.path.join(self.test_dir, "output", "qradar", "api_events", "dt=20240101", "hr=00")
+        self.assertEqual(len(os.listdir(output_dir)), 3)
+        # Nothing was queried again
+        self.assertEqual(MockQRadarSource.return_value.collect_data.call_count, 3)
+
+    @patch("sdc_tool.main.QRadarSource")
+    def test_dedup_drops_events_seen_in_earlier_windows(self, MockQRadarSource):
+        with open(self.mock_config_file, "a") as f:
+            f.write("\n[Dedup]\ndedup.enabled = true\ndedup.key_fields = qid, starttime\n")
+
+        def collect_data(start_time, end_time):
+            # Each window returns the last event of the previous one again
+            minute = start_time.minute
+            return [{"qid": minute - 10, "starttime": 0}, {"qid": minute, "starttime": 0}]
+
+        MockQRadarSource.return_value.collect_data.side_effect = collect_data
+        MockQRadarSource.return_value.input_type = "api_events"
+        sdc = SecurityDataCollector(self.mock_config_file)
+
+        with patch.object(sdc, "_split_time_windows", return_value=self._blocks(3)):
+            sdc.run()
+
+        output_dir = os.path.join(self.test_dir, "output", "qradar", "api_events", "dt=20240101", "hr=00")
+        qids = []
+        for name in sorted(os.listdir(output_dir)):
+            with gzip.open(os.path.join(output_dir, name), "rt", encoding="utf-8") as f:
+                qids.extend(json.loads(line)["qid"] for line in f)
+        self.assertEqual(sorted(qids), [-10, 0, 10, 20])
+        self.assertTrue(os.path.exists(f"{self.state_file}.qradar_local_file.dedup"))
+
+    @patch("sdc_tool.main.QRadarSource")
+    def test_manifests_are_pruned_at_most_once_per_interval(self, MockQRadarSource):
+        sdc = SecurityDataCollector(self.mock_config_file)
+        blocks = self._blocks(2)
+
+        with patch.object(sdc.sink, "prune_manifests", return_value=0) as prune:
+            sdc._commit_window(*blocks[0])
+            sdc._commit_window(*blocks[1])
+
+        # Manifests of windows more than manifest_retention_hours behind the watermark go
+        prune.assert_called_once_with(blocks[0][1] - 24 * 3600 * 1000)
+        self.assertIsNotNone(StateStore(self.state_file).get("qradar_local_file.manifests_pruned_at"))
+
+if __name__ == '__main__':
+    unittest.main()
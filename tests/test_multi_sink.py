@@ -0,0 +1,85 @@
+import os
+import shutil
+import threading
+import unittest
+
+from sdc_tool.multi_sink import MultiSink, MultiSinkError
+from sdc_tool.state_store import StateStore
+
+
+class FakeSink:
+    def __init__(self, fail=False, barrier=None):
+        self.fail = fail
+        self.barrier = barrier
+        self.windows = []
+        self.closed = False
+
+    def write_window(self, start_ms, end_ms, items, replaces=()):
+        if self.barrier is not None:
+            # Both sinks have to be inside write_window at the same time to pass
+            self.barrier.wait(timeout=5)
+        if self.fail:
+            raise ConnectionError("sink down")
+        self.windows.append((start_ms, end_ms))
+
+    def close(self):
+        self.closed = True
+
+
+class TestMultiSink(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = "/tmp/sdc_test_multi_sink"
+        self.store = StateStore(os.path.join(self.test_dir, "state.json"))
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def test_writes_to_all_sinks_concurrently(self):
+        barrier = threading.Barrier(2)
+        hdfs, local = FakeSink(barrier=barrier), FakeSink(barrier=barrier)
+        sink = MultiSink({"hdfs": hdfs, "local_file": local}, state_store=self.store, state_key="p.sinks")
+
+        sink.write_window(0, 10, [])
+
+        self.assertEqual(hdfs.windows, [(0, 10)])
+        self.assertEqual(local.windows, [(0, 10)])
+        self.assertEqual(sink.last_status, {"hdfs": "ok", "local_file": "ok"})
+        self.assertEqual(self.store.get("p.sinks"), {"hdfs": 10, "local_file": 10})
+
+    def test_required_failure_raises_and_retry_skips_committed_sinks(self):
+        hdfs, local = FakeSink(fail=True), FakeSink()
+        sink = MultiSink({"hdfs": hdfs, "local_file": local}, state_store=self.store, state_key="p.sinks")
+
+        with self.assertRaises(MultiSinkError) as cm:
+            sink.write_window(0, 10, [])
+        self.assertEqual(list(cm.exception.failures), ["hdfs"])
+        self.assertEqual(self.store.get("p.sinks"), {"local_file": 10})
+
+        # The retried window only goes to the sink that does not have it yet
+        hdfs.fail = False
+        sink.write_window(0, 10, [])
+        self.assertEqual(hdfs.windows, [(0, 10)])
+        self.assertEqual(local.windows, [(0, 10)])
+        self.assertEqual(sink.last_status, {"local_file": "skipped", "hdfs": "ok"})
+
+    def test_optional_sink_failure_is_tolerated(self):
+        hdfs, local = FakeSink(), FakeSink(fail=True)
+        sink = MultiSink({"hdfs": hdfs, "local_file": local}, optional=["local_file"])
+
+        sink.write_window(0, 10, [])
+
+        self.assertEqual(hdfs.windows, [(0, 10)])
+        self.assertTrue(sink.last_status["local_file"].startswith("failed"))
+
+    def test_unknown_optional_sink(self):
+        with self.assertRaises(ValueError):
+            MultiSink({"hdfs": FakeSink()}, optional=["s3"])
+
+    def test_close_closes_every_sink(self):
+        sinks = {"hdfs": FakeSink(), "local_file": FakeSink()}
+        MultiSink(sinks).close()
+        self.assertTrue(all(s.closed for s in sinks.values()))
+
+
+if __name__ == "__main__":
+    unittest.main()
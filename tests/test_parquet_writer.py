@@ -0,0 +1,64 @@
+import contextlib
+import io
+import json
+import unittest
+
+from sdc_tool.parquet_writer import RollingParquetWriter, pa, pq
+
+
+@unittest.skipUnless(pa is not None, "pyarrow is not installed")
+class TestRollingParquetWriter(unittest.TestCase):
+    def setUp(self):
+        self.outputs = []
+
+    @contextlib.contextmanager
+    def _open_file(self, index):
+        buffer = io.BytesIO()
+        yield buffer
+        self.outputs.append(buffer.getvalue())
+
+    def _table(self, output):
+        return pq.read_table(io.BytesIO(output))
+
+    def test_writes_row_groups_and_rolls_on_record_limit(self):
+        records = [json.dumps({"id": i, "qid": 1000 + i}).encode("utf-8") for i in range(7)]
+        files = RollingParquetWriter(self._open_file, max_records=5, row_group_size=2).write(iter(records))
+
+        self.assertEqual([count for count, _ in files], [5, 2])
+        self.assertEqual([size for _, size in files], [len(o) for o in self.outputs])
+        first = pq.ParquetFile(io.BytesIO(self.outputs[0]))
+        self.assertEqual([first.metadata.row_group(i).num_rows for i in range(first.num_row_groups)], [2, 2, 1])
+        ids = [row["id"] for output in self.outputs for row in self._table(output).to_pylist()]
+        self.assertEqual(ids, list(range(7)))
+
+    def test_schema_is_widened_for_new_fields(self):
+        records = [{"id": 1, "sourceip": "10.0.0.1"}, {"id": 2, "sourceip": "10.0.0.2"},
+                   {"id": 3, "username": "alice"}]
+        files = RollingParquetWriter(self._open_file, row_group_size=2).write(records)
+
+        # The row group bringing a new field starts a new file with the merged schema
+        self.assertEqual([count for count, _ in files], [2, 1])
+        self.assertEqual(self._table(self.outputs[0]).column_names, ["id", "sourceip"])
+        self.assertEqual(self._table(self.outputs[1]).to_pylist(),
+                         [{"id": 3, "sourceip": None, "username": "alice"}])
+
+    def test_conflicting_types_are_stored_as_strings(self):
+        records = [{"id": 1, "magnitude": 5}, {"id": 2, "magnitude": "high"}]
+        RollingParquetWriter(self._open_file, row_group_size=10).write(records)
+
+        self.assertEqual(self._table(self.outputs[0]).to_pylist(),
+                         [{"id": 1, "magnitude": "5"}, {"id": 2, "magnitude": "high"}])
+
+    def test_compression_is_configurable(self):
+        RollingParquetWriter(self._open_file, compression="zstd").write([{"id": 1}])
+
+        column = pq.ParquetFile(io.BytesIO(self.outputs[0])).metadata.row_group(0).column(0)
+        self.assertEqual(column.compression, "ZSTD")
+
+    def test_empty_input_creates_no_file(self):
+        self.assertEqual(RollingParquetWriter(self._open_file).write(iter([])), [])
+        self.assertEqual(self.outputs, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
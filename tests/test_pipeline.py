@@ -0,0 +1,89 @@
+import unittest
+import threading
+import time
+
+from sdc_tool.pipeline import CollectionPipeline
+
+class TestCollectionPipeline(unittest.TestCase):
+    def _blocks(self, count):
+        return [(i * 1000, (i + 1) * 1000) for i in range(count)]
+
+    def test_windows_are_written_and_committed_in_order(self):
+        written, committed = [], []
+
+        def collect(start_ms, end_ms):
+            # Later windows finish first to exercise re-ordering.
+            time.sleep(0.01 * (5 - start_ms // 1000))
+            return f"data_{start_ms}"
+
+        pipeline = CollectionPipeline(
+            collect_fn=collect,
+            write_fn=lambda s, e, data: written.append(data),
+            commit_fn=lambda s, e: committed.append(e),
+            max_parallel_windows=4,
+        )
+        self.assertEqual(pipeline.run(self._blocks(5)), 5)
+        self.assertEqual(written, [f"data_{i * 1000}" for i in range(5)])
+        self.assertEqual(committed, [(i + 1) * 1000 for i in range(5)])
+
+    def test_failure_stops_commits(self):
+        committed = []
+
+        def collect(start_ms, end_ms):
+            if start_ms == 2000:
+                raise RuntimeError("boom")
+            return "data"
+
+        pipeline = CollectionPipeline(collect, lambda s, e, d: None, lambda s, e: committed.append(e),
+                                      max_parallel_windows=3)
+        self.assertEqual(pipeline.run(self._blocks(6)), 2)
+        self.assertEqual(committed, [1000, 2000])
+
+    def test_sink_failure_stops_commits(self):
+        committed = []
+
+        def write(start_ms, end_ms, data):
+            if start_ms == 1000:
+                raise IOError("sink down")
+
+        pipeline = CollectionPipeline(lambda s, e: "data", write, lambda s, e: committed.append(e))
+        self.assertEqual(pipeline.run(self._blocks(4)), 1)
+        self.assertEqual(committed, [1000])
+
+    def test_bounded_queue_applies_backpressure(self):
+        lock = threading.Lock()
+        state = {"collected": 0, "written": 0, "max_ahead": 0}
+
+        def collect(start_ms, end_ms):
+            with lock:
+                state["collected"] += 1
+                state["max_ahead"] = max(state["max_ahead"], state["collected"] - state["written"])
+            return "data"
+
+        def write(start_ms, end_ms, data):
+            time.sleep(0.01)
+            with lock:
+                state["written"] += 1
+
+        pipeline = CollectionPipeline(collect, write, lambda s, e: None, max_parallel_windows=2, queue_size=1)
+        pipeline.run(self._blocks(10))
+        # One window being written, one queued, one held by the blocked dispatcher, one spare worker.
+        self.assertLessEqual(state["max_ahead"], 4)
+
+    def test_stage_timings(self):
+        pipeline = CollectionPipeline(lambda s, e: time.sleep(0.01), lambda s, e, d: None, lambda s, e: None)
+        pipeline.run(self._blocks(3))
+        stats = pipeline.stats()
+        self.assertEqual(stats["source"]["count"], 3)
+        self.assertEqual(stats["sink"]["count"], 3)
+        self.assertGreater(stats["source"]["busy_seconds"], 0)
+
+    def test_stop_event_prevents_new_windows(self):
+        stop_event = threading.Event()
+        stop_event.set()
+        pipeline = CollectionPipeline(lambda s, e: "data", lambda s, e, d: None, lambda s, e: None,
+                                      stop_event=stop_event)
+        self.assertEqual(pipeline.run(self._blocks(3)), 0)
+
+if __name__ == '__main__':
+    unittest.main()
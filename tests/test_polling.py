@@ -0,0 +1,41 @@
+import unittest
+from unittest.mock import patch
+
+from sdc_tool.polling import AdaptivePoller, PollTimeoutError
+
+class TestAdaptivePoller(unittest.TestCase):
+    def test_backs_off_exponentially_up_to_max(self):
+        schedule = AdaptivePoller(initial_interval_seconds=0.25, max_interval_seconds=2).schedule()
+        self.assertEqual([schedule.next_delay() for _ in range(6)], [0.25, 0.5, 1.0, 2.0, 2.0, 2.0])
+
+    def test_predicts_completion_from_progress(self):
+        schedule = AdaptivePoller(initial_interval_seconds=0.25, max_interval_seconds=5).schedule()
+        # 1.5s of execution for 75% -> about 0.5s left
+        self.assertAlmostEqual(schedule.next_delay(progress=75, execution_ms=1500), 0.5)
+        # Far from done: capped at the max interval
+        self.assertEqual(schedule.next_delay(progress=80, execution_ms=60000), 5)
+
+    @patch("sdc_tool.polling.time.monotonic")
+    def test_times_out_when_progress_stalls(self, MockMonotonic):
+        MockMonotonic.return_value = 100.0
+        schedule = AdaptivePoller(stall_timeout_seconds=30, max_wait_seconds=1000).schedule()
+        schedule.next_delay(progress=10)
+        MockMonotonic.return_value = 125.0
+        schedule.next_delay(progress=10)
+        MockMonotonic.return_value = 140.0
+        # Progress moved: the stall clock restarts
+        schedule.next_delay(progress=20)
+        MockMonotonic.return_value = 171.0
+        with self.assertRaises(PollTimeoutError):
+            schedule.next_delay(progress=20)
+
+    @patch("sdc_tool.polling.time.monotonic")
+    def test_times_out_after_max_wait(self, MockMonotonic):
+        MockMonotonic.return_value = 0.0
+        schedule = AdaptivePoller(stall_timeout_seconds=1000, max_wait_seconds=60).schedule()
+        MockMonotonic.return_value = 61.0
+        with self.assertRaises(PollTimeoutError):
+            schedule.next_delay(progress=99)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,9 +1,16 @@
+import asyncio
 import unittest
 from unittest.mock import MagicMock, patch
 from datetime import datetime, timedelta
 import os
+import gzip
+import json
+import requests
 
-from sdc_tool.qradar_source import QRadarSource
+from sdc_tool.base_source import WindowOverflowError
+from sdc_tool.polling import AdaptivePoller
+from sdc_tool.retry import RetryPolicy
+from sdc_tool.qradar_source import QRadarSource, QRadarAPIClient, QRadarAPIError, _iter_json_array_items
 from sdc_tool.config_parser import ConfigParser
 
 class TestQRadarSource(unittest.TestCase):
@@ -88,6 +95,210 @@ qradar.syslog.parser_type = leef
         with self.assertRaises(ValueError):
             QRadarSource(self.config_parser)
 
+class TestQRadarAPIClient(unittest.TestCase):
+    @patch("time.sleep")
+    def test_get_events_raises_overflow_before_download(self, MockSleep):
+        session = MagicMock()
+        session.post.return_value = MagicMock(status_code=201, json=lambda: {"search_id": "s1"})
+        session.get.return_value = MagicMock(status_code=200, json=lambda: {"status": "COMPLETED", "record_count": 250000})
+        client = QRadarAPIClient("https://qradar.example.com", "token", session=session)
+
+        with self.assertRaises(WindowOverflowError) as ctx:
+            client.get_events("SELECT * FROM events", "/tmp/unused.json.gz", "events", max_events=100000)
+
+        self.assertEqual(ctx.exception.record_count, 250000)
+        # Only the status poll was made, the results were never downloaded
+        session.get.assert_called_once()
+        # The oversized search is deleted instead of being left to expire on the console
+        session.delete.assert_called_once()
+        self.assertEqual(session.delete.call_args.args[0], "https://qradar.example.com/api/ariel/searches/s1")
+
+    def _results_response(self, events, db_name="events"):
+        body = json.dumps({db_name: events}).encode("utf-8")
+        # Feed the body in tiny chunks to exercise the streaming parser
+        return MagicMock(status_code=200, iter_content=lambda chunk_size: (body[i:i + 7] for i in range(0, len(body), 7)))
+
+    @patch("time.sleep")
+    def test_get_events_downloads_pages_as_ndjson(self, MockSleep):
+        events = [{"qid": i, "payload": f"événement {i}"} for i in range(5)]
+        session = MagicMock()
+        session.post.return_value = MagicMock(status_code=201, json=lambda: {"search_id": "s1"})
+        status = MagicMock(status_code=200, json=lambda: {"status": "COMPLETED", "record_count": 5})
+        pages = [self._results_response(events[0:2]), self._results_response(events[2:4]),
+                 self._results_response(events[4:5])]
+        session.get.side_effect = [status] + pages
+        client = QRadarAPIClient("https://qradar.example.com", "token", session=session, page_size=2,
+                                 max_concurrent_downloads=1)
+        output_file = "/tmp/sdc_test_qradar_events.json.gz"
+
+        try:
+            payload = client.get_events("SELECT * FROM events", output_file, "events")
+            self.assertEqual(len(payload), 5)
+            with gzip.open(output_file, "rt", encoding="utf-8") as f:
+                self.assertEqual([json.loads(line) for line in f], events)
+        finally:
+            if os.path.exists(output_file):
+                os.remove(output_file)
+
+        ranges = [call.kwargs["headers"]["Range"] for call in session.get.call_args_list[1:]]
+        self.assertEqual(ranges, ["items=0-1", "items=2-3", "items=4-5"])
+
+    @patch("time.sleep")
+    def test_get_events_fetches_slices_in_parallel(self, MockSleep):
+        events = [{"qid": i} for i in range(25)]
+        session = MagicMock()
+        session.post.return_value = MagicMock(status_code=201, json=lambda: {"search_id": "s2"})
+        status = MagicMock(status_code=200, json=lambda: {"status": "COMPLETED", "record_count": 25})
+
+        def get(url, headers=None, **kwargs):
+            if "Range" not in headers:
+                return status
+            first, last = map(int, headers["Range"].split("=")[1].split("-"))
+            return self._results_response(events[first:last + 1])
+
+        session.get.side_effect = get
+        client = QRadarAPIClient("https://qradar-parallel.example.com", "token", session=session, page_size=4,
+                                 max_concurrent_downloads=3)
+        output_file = "/tmp/sdc_test_qradar_parallel.json.gz"
+
+        try:
+            payload = client.get_events("SELECT * FROM events", output_file, "events")
+            self.assertEqual(len(payload), 25)
+            # Slices are reassembled in order as concatenated gzip members
+            with gzip.open(output_file, "rt", encoding="utf-8") as f:
+                self.assertEqual([json.loads(line) for line in f], events)
+            self.assertEqual([f for f in os.listdir("/tmp") if f.startswith("sdc_test_qradar_parallel.json.gz.part")], [])
+        finally:
+            if os.path.exists(output_file):
+                os.remove(output_file)
+
+        ranges = sorted(call.kwargs["headers"]["Range"] for call in session.get.call_args_list[1:])
+        self.assertEqual(len(ranges), 7)
+        self.assertIn("items=24-24", ranges)
+
+    @patch("time.sleep")
+    def test_wait_for_search_polls_fast_then_backs_off(self, MockSleep):
+        session = MagicMock()
+        statuses = [{"status": "EXECUTE", "progress": 0}, {"status": "EXECUTE", "progress": 0},
+                    {"status": "EXECUTE", "progress": 50, "query_execution_time": 400},
+                    {"status": "COMPLETED", "progress": 100, "record_count": 3}]
+        session.get.side_effect = [MagicMock(status_code=200, json=lambda s=s: s) for s in statuses]
+        client = QRadarAPIClient("https://qradar.example.com", "token", session=session)
+
+        self.assertEqual(client.wait_for_search("s1")["record_count"], 3)
+        self.assertEqual([c.args[0] for c in MockSleep.call_args_list], [0.25, 0.5, 0.4])
+
+    def test_get_events_async_waits_without_blocking(self):
+        events = [{"qid": 1}, {"qid": 2}]
+        session = MagicMock()
+        session.post.return_value = MagicMock(status_code=201, json=lambda: {"search_id": "s3"})
+        statuses = [{"status": "EXECUTE", "progress": 0}, {"status": "COMPLETED", "progress": 100, "record_count": 2}]
+        session.get.side_effect = ([MagicMock(status_code=200, json=lambda s=s: s) for s in statuses]
+                                   + [self._results_response(events)])
+        client = QRadarAPIClient("https://qradar-async.example.com", "token", session=session,
+                                 poller=AdaptivePoller(initial_interval_seconds=0.01))
+        output_file = "/tmp/sdc_test_qradar_async.json.gz"
+
+        try:
+            with patch("time.sleep") as MockSleep:
+                payload = asyncio.run(client.get_events_async("SELECT * FROM events", output_file, "events"))
+            self.assertEqual(len(payload), 2)
+            # The wait between status checks happened on the event loop, not in a thread
+            MockSleep.assert_not_called()
+        finally:
+            if os.path.exists(output_file):
+                os.remove(output_file)
+
+    @patch("time.sleep")
+    def test_wait_for_search_cancels_stalled_search(self, MockSleep):
+        session = MagicMock()
+        session.get.return_value = MagicMock(status_code=200, json=lambda: {"status": "EXECUTE", "progress": 10})
+        client = QRadarAPIClient("https://qradar.example.com", "token", session=session,
+                                 poller=AdaptivePoller(stall_timeout_seconds=0))
+
+        with self.assertRaises(QRadarAPIError):
+            client.wait_for_search("s1")
+        session.delete.assert_called_once()
+
+    @patch("time.sleep")
+    def test_create_search_retries_throttling_and_refused_connections(self, MockSleep):
+        session = MagicMock()
+        session.post.side_effect = [
+            MagicMock(status_code=429, headers={"Retry-After": "3"}),
+            requests.ConnectionError("connection refused"),
+            MagicMock(status_code=503, headers={}),
+            MagicMock(status_code=201, json=lambda: {"search_id": "s3"}),
+        ]
+        client = QRadarAPIClient("https://qradar.example.com", "token", session=session)
+
+        self.assertEqual(client.create_search("SELECT * FROM events"), "s3")
+        self.assertEqual(session.post.call_count, 4)
+        # Retry-After is honoured for the throttled attempt
+        self.assertEqual(MockSleep.call_args_list[0].args[0], 3)
+
+    @patch("time.sleep")
+    def test_create_search_is_not_retried_once_the_request_may_have_been_sent(self, MockSleep):
+        for failure in (requests.ReadTimeout("read timed out"), MagicMock(status_code=500, text="error", headers={}),
+                        MagicMock(status_code=504, text="gateway timeout", headers={})):
+            session = MagicMock()
+            session.post.side_effect = [failure, MagicMock(status_code=201, json=lambda: {"search_id": "s4"})]
+            client = QRadarAPIClient("https://qradar.example.com", "token", session=session)
+
+            with self.assertRaises((requests.ReadTimeout, QRadarAPIError)):
+                client.create_search("SELECT * FROM events")
+            self.assertEqual(session.post.call_count, 1)
+
+    @patch("time.sleep")
+    def test_create_search_retries_connect_failures(self, MockSleep):
+        session = MagicMock()
+        session.post.side_effect = [
+            requests.ConnectTimeout("connect timed out"),
+            requests.ConnectionError("connection refused"),
+            MagicMock(status_code=201, json=lambda: {"search_id": "s5"}),
+        ]
+        client = QRadarAPIClient("https://qradar.example.com", "token", session=session)
+
+        self.assertEqual(client.create_search("SELECT * FROM events"), "s5")
+        self.assertEqual(session.post.call_count, 3)
+
+    @patch("time.sleep")
+    def test_idempotent_request_retries_read_timeouts_and_server_errors(self, MockSleep):
+        session = MagicMock()
+        session.get.side_effect = [
+            requests.ReadTimeout("read timed out"),
+            MagicMock(status_code=502, headers={}),
+            MagicMock(status_code=200),
+        ]
+        client = QRadarAPIClient("https://qradar.example.com", "token", session=session)
+
+        self.assertEqual(client._request("get", "https://qradar.example.com/api/ariel/searches/s1").status_code, 200)
+        self.assertEqual(session.get.call_count, 3)
+
+    @patch("time.sleep")
+    def test_request_gives_up_after_max_retries(self, MockSleep):
+        session = MagicMock()
+        session.get.return_value = MagicMock(status_code=500, headers={})
+        client = QRadarAPIClient("https://qradar.example.com", "token", session=session,
+                                 retry_policy=RetryPolicy(max_retries=2))
+
+        resp = client._request("get", "https://qradar.example.com/api/ariel/searches/s1")
+        self.assertEqual(resp.status_code, 500)
+        self.assertEqual(session.get.call_count, 3)
+
+    def test_client_uses_pooled_session_by_default(self):
+        client = QRadarAPIClient("https://qradar.example.com", "token", pool_size=8)
+        self.assertIsInstance(client.http, requests.Session)
+        self.assertEqual(client.http.get_adapter("https://qradar.example.com")._pool_maxsize, 8)
+
+    def test_iter_json_array_items_handles_split_chunks(self):
+        body = b'{"flows": [ {"a": 1, "b": "x,]"}, {"a": [2, 3]} ,{"c": {"d": null}} ]}'
+        chunks = [body[i:i + 3] for i in range(0, len(body), 3)]
+        items = list(_iter_json_array_items(chunks, "flows"))
+        self.assertEqual(items, [{"a": 1, "b": "x,]"}, {"a": [2, 3]}, {"c": {"d": None}}])
+
+    def test_iter_json_array_items_empty_array(self):
+        self.assertEqual(list(_iter_json_array_items([b'{"events": []}'], "events")), [])
+
 if __name__ == '__main__':
     unittest.main()
 
@@ -0,0 +1,40 @@
+import unittest
+from unittest.mock import patch
+from datetime import datetime, timedelta, timezone
+import email.utils
+
+from sdc_tool.retry import RetryPolicy, parse_retry_after
+
+class TestRetryPolicy(unittest.TestCase):
+    def test_parse_retry_after_seconds(self):
+        self.assertEqual(parse_retry_after("7"), 7.0)
+        self.assertIsNone(parse_retry_after(None))
+        self.assertIsNone(parse_retry_after("soon"))
+
+    def test_parse_retry_after_http_date(self):
+        retry_at = datetime.now(timezone.utc) + timedelta(seconds=30)
+        delay = parse_retry_after(email.utils.format_datetime(retry_at, usegmt=True))
+        self.assertGreater(delay, 25)
+        self.assertLessEqual(delay, 30)
+
+    def test_delay_is_jittered_and_capped(self):
+        policy = RetryPolicy(backoff_base_seconds=1, backoff_max_seconds=10)
+        for attempt in range(8):
+            delay = policy.delay(attempt)
+            self.assertGreaterEqual(delay, 0)
+            self.assertLessEqual(delay, min(10, 2 ** attempt))
+
+    def test_retry_after_overrides_backoff(self):
+        policy = RetryPolicy(backoff_base_seconds=1, backoff_max_seconds=10)
+        self.assertEqual(policy.delay(0, retry_after=5), 5)
+        self.assertEqual(policy.delay(0, retry_after=120), 10)
+
+    @patch("time.sleep")
+    def test_sleep_returns_delay(self, MockSleep):
+        policy = RetryPolicy()
+        delay = policy.sleep(2, retry_after=3)
+        MockSleep.assert_called_once_with(3)
+        self.assertEqual(delay, 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import contextlib
+import gzip
+import io
+import json
+import os
+import unittest
+
+from sdc_tool.rolling_writer import RollingGzipWriter
+
+
+class TestRollingGzipWriter(unittest.TestCase):
+    def setUp(self):
+        self.outputs = []
+
+    @contextlib.contextmanager
+    def _open_file(self, index):
+        buffer = io.BytesIO()
+        yield buffer
+        self.outputs.append(buffer.getvalue())
+
+    def _records(self, output):
+        return [json.loads(line) for line in gzip.decompress(output).decode("utf-8").splitlines()]
+
+    def test_rolls_on_record_limit(self):
+        files = RollingGzipWriter(self._open_file, max_records=3).write({"id": i} for i in range(7))
+
+        self.assertEqual([count for count, _ in files], [3, 3, 1])
+        self.assertEqual([self._records(o) for o in self.outputs],
+                         [[{"id": 0}, {"id": 1}, {"id": 2}], [{"id": 3}, {"id": 4}, {"id": 5}], [{"id": 6}]])
+        self.assertEqual([size for _, size in files], [len(o) for o in self.outputs])
+
+    def test_rolls_on_compressed_size(self):
+        # Incompressible payloads so the compressor flushes to the file as it goes
+        records = ({"id": i, "blob": os.urandom(8192).hex()} for i in range(40))
+        files = RollingGzipWriter(self._open_file, max_bytes=64 * 1024).write(records)
+
+        self.assertGreater(len(files), 1)
+        self.assertEqual(sum(count for count, _ in files), 40)
+        for size in [size for _, size in files][:-1]:
+            self.assertGreaterEqual(size, 64 * 1024)
+            self.assertLess(size, 2 * 64 * 1024)
+
+    def test_consumes_records_lazily(self):
+        consumed = []
+
+        def records():
+            for i in range(4):
+                consumed.append(i)
+                yield f'{{"id": {i}}}'.encode("utf-8")
+
+        @contextlib.contextmanager
+        def open_file(index):
+            # Only the first record of the next file has been read when it is opened
+            self.assertEqual(len(consumed), index * 2 + 1)
+            yield io.BytesIO()
+
+        RollingGzipWriter(open_file, max_records=2).write(records())
+
+    def test_empty_input_creates_no_file(self):
+        self.assertEqual(RollingGzipWriter(self._open_file, max_records=3).write(iter([])), [])
+        self.assertEqual(self.outputs, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
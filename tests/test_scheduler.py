@@ -0,0 +1,58 @@
+import unittest
+from unittest.mock import MagicMock
+from datetime import datetime
+import os
+import tempfile
+import threading
+
+from sdc_tool.scheduler import DaemonScheduler, RunLock
+
+class TestDaemonScheduler(unittest.TestCase):
+    def test_next_tick_is_aligned_to_window_boundary(self):
+        scheduler = DaemonScheduler(MagicMock(), interval_minutes=10, delay_seconds=30)
+        self.assertEqual(scheduler.next_tick(datetime(2024, 1, 1, 10, 14, 0)), datetime(2024, 1, 1, 10, 20, 30))
+        # Inside the delay after a boundary, the tick for that boundary has not fired yet.
+        self.assertEqual(scheduler.next_tick(datetime(2024, 1, 1, 10, 20, 10)), datetime(2024, 1, 1, 10, 20, 30))
+        self.assertEqual(scheduler.next_tick(datetime(2024, 1, 1, 10, 20, 30)), datetime(2024, 1, 1, 10, 30, 30))
+
+    def test_run_forever_stops_after_current_run(self):
+        collector = MagicMock()
+        stop_event = threading.Event()
+        scheduler = DaemonScheduler(collector, interval_minutes=10, stop_event=stop_event)
+        collector.run.side_effect = lambda: scheduler.stop()
+
+        scheduler.run_forever()
+
+        collector.run.assert_called_once()
+        self.assertTrue(stop_event.is_set())
+
+    def test_run_forever_survives_failed_run(self):
+        collector = MagicMock()
+        scheduler = DaemonScheduler(collector, interval_minutes=10)
+        calls = []
+
+        def run():
+            calls.append(1)
+            if len(calls) == 1:
+                raise RuntimeError("source unavailable")
+            scheduler.stop()
+
+        collector.run.side_effect = run
+        scheduler.stop_event.wait = lambda timeout: False
+        scheduler.run_forever()
+        self.assertEqual(len(calls), 2)
+
+class TestRunLock(unittest.TestCase):
+    def test_lock_is_exclusive(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            lock_path = os.path.join(tmp_dir, "pipeline.lock")
+            first = RunLock(lock_path)
+            second = RunLock(lock_path)
+            self.assertTrue(first.acquire())
+            self.assertFalse(second.acquire())
+            first.release()
+            self.assertTrue(second.acquire())
+            second.release()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+import gzip
+import json
+import os
+import shutil
+import unittest
+from datetime import datetime
+
+from sdc_tool.compression import get_codec, zstandard
+from sdc_tool.payload import FilePayload
+from sdc_tool.retry import RetryPolicy
+from sdc_tool.spool import Spool, SpoolDrainer, SpoolFullError
+
+
+class RecordingSink:
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.written = []
+
+    def write_window(self, start_ms, end_ms, items, replaces=()):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("namenode unavailable")
+        for data, source_identifier, input_type, window_start in items:
+            self.written.append((list(data.iter_records()), window_start))
+
+
+class TestSpool(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = "/tmp/sdc_test_spool"
+        self.spool_dir = os.path.join(self.test_dir, "spool")
+        os.makedirs(self.test_dir, exist_ok=True)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def _payload(self, name, records):
+        path = os.path.join(self.test_dir, name)
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+        return FilePayload(path, len(records))
+
+    def test_put_moves_payload_and_load_restores_it(self):
+        spool = Spool(self.spool_dir)
+        payload = self._payload("window.json.gz", [{"id": 1}, {"id": 2}])
+        window_start = datetime(2024, 1, 1, 10, 0)
+
+        name = spool.put(1000, 2000, [(payload, "qradar", "api_events", window_start)], replaces=[1500])
+
+        self.assertFalse(os.path.exists(payload.path))
+        start_ms, end_ms, items, replaces = Spool(self.spool_dir).load(name)
+        self.assertEqual((start_ms, end_ms, replaces), (1000, 2000, [1500]))
+        loaded, source_identifier, input_type, loaded_start = items[0]
+        self.assertEqual((source_identifier, input_type, loaded_start), ("qradar", "api_events", window_start))
+        self.assertEqual(len(loaded), 2)
+        self.assertEqual([json.loads(line) for line in loaded.iter_records()], [{"id": 1}, {"id": 2}])
+
+    def test_records_are_spooled_as_gzip(self):
+        spool = Spool(self.spool_dir)
+        name = spool.put(0, 1, [([{"id": 7}], "cortex_xdr", "api_alerts", None)])
+
+        _, _, items, _ = spool.load(name)
+        self.assertEqual([json.loads(line) for line in items[0][0].iter_records()], [{"id": 7}])
+
+    @unittest.skipUnless(zstandard is not None, "zstandard is not installed")
+    def test_records_are_spooled_with_the_sink_codec(self):
+        spool = Spool(self.spool_dir, codec=get_codec("zstd"))
+        name = spool.put(0, 1, [([{"id": 7}, {"id": 8}], "cortex_xdr", "api_alerts", None)])
+
+        _, _, items, _ = spool.load(name)
+        payload = items[0][0]
+        self.assertEqual((payload.codec, len(payload)), ("zstd", 2))
+        self.assertTrue(payload.path.endswith(".json.zst"))
+        self.assertEqual([json.loads(line) for line in payload.iter_records()], [{"id": 7}, {"id": 8}])
+
+    def test_incomplete_entries_are_discarded_on_start(self):
+        os.makedirs(os.path.join(self.spool_dir, ".000000000000_0_1"))
+        spool = Spool(self.spool_dir)
+        self.assertEqual(spool.entries(), [])
+        self.assertEqual(os.listdir(self.spool_dir), [])
+
+    def test_reject_when_full(self):
+        spool = Spool(self.spool_dir, max_size_mb=1)
+        big = os.urandom(2 * 1024 * 1024)
+        with self.assertRaises(SpoolFullError):
+            spool.put(0, 1, [(gzip.compress(big), "qradar", "api_events", None)])
+        self.assertEqual(spool.entries(), [])
+
+    def test_drop_oldest_evicts_to_make_room(self):
+        spool = Spool(self.spool_dir, max_size_mb=1, eviction="drop_oldest")
+        blob = gzip.compress(os.urandom(600 * 1024))
+        first = spool.put(0, 1, [(blob, "qradar", "api_events", None)])
+        second = spool.put(1, 2, [(blob, "qradar", "api_events", None)])
+
+        self.assertEqual(spool.entries(), [second])
+        self.assertNotEqual(first, second)
+        self.assertLessEqual(spool.size_bytes, 1024 * 1024)
+
+    def test_drainer_replays_in_order_after_sink_failures(self):
+        spool = Spool(self.spool_dir)
+        for i in range(3):
+            spool.put(i, i + 1, [([{"id": i}], "qradar", "api_events", None)])
+        sink = RecordingSink(failures=1)
+        drainer = SpoolDrainer(spool, sink, retry_policy=RetryPolicy(backoff_base_seconds=0.01, backoff_max_seconds=0.01))
+
+        with self.assertRaises(ConnectionError):
+            drainer.drain_once()
+        # Nothing is lost or skipped while the sink is down
+        self.assertEqual(len(spool.entries()), 3)
+
+        self.assertEqual(drainer.drain_once(), 3)
+        self.assertEqual([json.loads(records[0])["id"] for records, _ in sink.written], [0, 1, 2])
+        self.assertEqual(spool.entries(), [])
+        self.assertEqual(spool.size_bytes, 0)
+
+    def test_background_drainer_retries_until_sink_recovers(self):
+        spool = Spool(self.spool_dir)
+        sink = RecordingSink(failures=2)
+        drainer = SpoolDrainer(spool, sink, poll_seconds=0.05,
+                               retry_policy=RetryPolicy(backoff_base_seconds=0.01, backoff_max_seconds=0.01))
+        drainer.start()
+        try:
+            spool.put(0, 1, [([{"id": 1}], "qradar", "api_events", None)])
+            for _ in range(200):
+                if sink.written:
+                    break
+                spool.wait(0.01)
+        finally:
+            drainer.stop(timeout=5)
+        self.assertEqual(len(sink.written), 1)
+        self.assertEqual(spool.entries(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+import unittest
+import os
+import json
+import shutil
+import threading
+import time
+from unittest.mock import patch
+
+from sdc_tool.state_store import StateStore
+
+class TestStateStore(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = "/tmp/sdc_test_state_store"
+        self.state_file = os.path.join(self.test_dir, "state.json")
+
+    def tearDown(self):
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+
+    def test_get_and_set(self):
+        store = StateStore(self.state_file)
+        self.assertIsNone(store.get("qradar_hdfs"))
+        store.set("qradar_hdfs", "2024-01-01T00:10:00")
+        self.assertEqual(store.get("qradar_hdfs"), "2024-01-01T00:10:00")
+
+    def test_for_path_returns_shared_instance(self):
+        self.assertIs(StateStore.for_path(self.state_file), StateStore.for_path(self.state_file))
+
+    def test_concurrent_pipelines_keep_their_keys(self):
+        # Two separate instances stand in for two processes sharing the file.
+        stores = [StateStore(self.state_file), StateStore(self.state_file)]
+
+        def save(index):
+            for i in range(20):
+                stores[index % 2].set(f"pipeline_{index}", i)
+
+        threads = [threading.Thread(target=save, args=(i,)) for i in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(StateStore(self.state_file).to_dict(), {f"pipeline_{i}": 19 for i in range(6)})
+
+    def test_corrupt_state_file_is_overwritten(self):
+        os.makedirs(self.test_dir, exist_ok=True)
+        with open(self.state_file, "w") as f:
+            f.write("{not json")
+        store = StateStore(self.state_file)
+        self.assertIsNone(store.get("qradar_hdfs"))
+        store.set("qradar_hdfs", "2024-01-01T00:10:00")
+        self.assertEqual(store.get("qradar_hdfs"), "2024-01-01T00:10:00")
+        self.assertTrue(os.path.exists(f"{self.state_file}.corrupt"))
+
+    def test_legacy_json_state_is_imported(self):
+        os.makedirs(self.test_dir, exist_ok=True)
+        with open(self.state_file, "w") as f:
+            json.dump({"qradar_hdfs": "2024-01-01T00:10:00", "qradar_hdfs.density": {"0": [1.5, 3]}}, f)
+
+        store = StateStore(self.state_file)
+
+        self.assertEqual(store.get("qradar_hdfs"), "2024-01-01T00:10:00")
+        self.assertEqual(store.get("qradar_hdfs.density"), {"0": [1.5, 3]})
+        self.assertTrue(os.path.exists(f"{self.state_file}.json.bak"))
+        # Imported once: a second instance reads the database, not the backup
+        self.assertEqual(StateStore(self.state_file).to_dict(), store.to_dict())
+
+    def test_import_killed_before_the_database_replaces_the_json_file(self):
+        os.makedirs(self.test_dir, exist_ok=True)
+        with open(self.state_file, "w") as f:
+            json.dump({"qradar_hdfs": "2024-01-01T00:10:00"}, f)
+
+        # The process dies after building the database, before renaming it over the JSON file
+        with patch("sdc_tool.state_store.os.replace", side_effect=KeyboardInterrupt("killed")):
+            with self.assertRaises(KeyboardInterrupt):
+                StateStore(self.state_file).get("qradar_hdfs")
+
+        self.assertEqual(StateStore(self.state_file).get("qradar_hdfs"), "2024-01-01T00:10:00")
+        self.assertFalse(os.path.exists(f"{self.state_file}.importing"))
+
+    def test_update_is_saved_atomically_and_survives_reopen(self):
+        store = StateStore(self.state_file)
+        store.update({"qradar_hdfs": "2024-01-01T00:10:00", "qradar_hdfs.density": {"1": [2.0, 4]}})
+        store.close()
+
+        reopened = StateStore(self.state_file)
+        self.assertEqual(reopened.to_dict(), {"qradar_hdfs": "2024-01-01T00:10:00",
+                                              "qradar_hdfs.density": {"1": [2.0, 4]}})
+
+    def test_concurrent_updates_are_group_committed(self):
+        store = StateStore(self.state_file)
+        store.set("warmup", 1)
+        batches = []
+        write_batch = store._write_batch
+
+        def slow_write_batch(batch):
+            batches.append(len(batch))
+            time.sleep(0.05)
+            write_batch(batch)
+
+        threads = [threading.Thread(target=store.set, args=(f"pipeline_{i}", i)) for i in range(8)]
+        with patch.object(store, "_write_batch", side_effect=slow_write_batch):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(sum(batches), 8)
+        self.assertLess(len(batches), 8)
+        self.assertEqual(store.get("pipeline_7"), 7)
+
+    def test_removed_state_file_is_recreated(self):
+        store = StateStore(self.state_file)
+        store.set("qradar_hdfs", "2024-01-01T00:10:00")
+        shutil.rmtree(self.test_dir)
+
+        self.assertIsNone(store.get("qradar_hdfs"))
+        store.set("qradar_hdfs", "2024-01-01T00:20:00")
+        self.assertEqual(StateStore(self.state_file).get("qradar_hdfs"), "2024-01-01T00:20:00")
+
+if __name__ == '__main__':
+    unittest.main()
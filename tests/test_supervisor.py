@@ -0,0 +1,64 @@
+import unittest
+from unittest.mock import patch
+import os
+import shutil
+
+from sdc_tool.supervisor import PipelineSupervisor
+
+class TestPipelineSupervisor(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = "/tmp/sdc_test_supervisor"
+        self.config_dir = os.path.join(self.test_dir, "pipelines")
+        os.makedirs(self.config_dir, exist_ok=True)
+        self.create_mock_config("events.ini", "qradar_events")
+        self.create_mock_config("flows.ini", "qradar_flows")
+
+    def tearDown(self):
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+
+    def create_mock_config(self, file_name, pipeline_name):
+        config_content = f"""
+[Pipeline]
+pipeline = qradar > hdfs
+name = {pipeline_name}
+
+[General]
+state_file_path = {self.test_dir}/state.json
+collection_window_minutes = 10
+
+[QRadar]
+qradar.initial_collection_timestamp = 2024-01-01 00:00:00
+qradar.input_type = api_events
+qradar.api.host = https://qradar.example.com
+qradar.api.token = mock_token
+
+[Hadoop]
+hadoop.namenode_url = http://mock-hadoop-namenode:50070
+hadoop.kerberos_enabled = False
+"""
+        with open(os.path.join(self.config_dir, file_name), "w") as f:
+            f.write(config_content)
+
+    def test_pipelines_share_connection_pool_and_state_store(self):
+        supervisor = PipelineSupervisor(self.config_dir)
+        self.assertEqual([c.pipeline_key for c in supervisor.collectors], ["qradar_events", "qradar_flows"])
+        first, second = supervisor.collectors
+        self.assertIs(first.source.api_client.http, second.source.api_client.http)
+        self.assertIs(first.sink.session, second.sink.session)
+        self.assertIs(first.state_store, second.state_store)
+
+    def test_duplicate_pipeline_names_are_rejected(self):
+        self.create_mock_config("events_copy.ini", "qradar_events")
+        with self.assertRaises(ValueError):
+            PipelineSupervisor(self.config_dir)
+
+    def test_run_once_runs_every_pipeline(self):
+        supervisor = PipelineSupervisor(self.config_dir)
+        with patch("sdc_tool.main.SecurityDataCollector.run", autospec=True) as mock_run:
+            supervisor.run_once()
+        self.assertEqual(sorted(call.args[0].pipeline_key for call in mock_run.call_args_list),
+                         ["qradar_events", "qradar_flows"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import unittest
+from datetime import datetime
+
+from sdc_tool.base_source import WindowOverflowError
+from sdc_tool.window_planner import AdaptiveWindowPlanner
+
+MINUTE_MS = 60 * 1000
+
+class TestAdaptiveWindowPlanner(unittest.TestCase):
+    def setUp(self):
+        self.start_ms = int(datetime(2024, 1, 1, 2, 0, 0).timestamp() * 1000)
+
+    def _blocks(self, count, minutes=10):
+        step = minutes * MINUTE_MS
+        return [(self.start_ms + i * step, self.start_ms + (i + 1) * step) for i in range(count)]
+
+    def test_collect_bisects_on_overflow(self):
+        planner = AdaptiveWindowPlanner(max_events=100)
+        calls = []
+
+        def collect(start_ms, end_ms):
+            calls.append((start_ms, end_ms))
+            if end_ms - start_ms > 3 * MINUTE_MS:
+                raise WindowOverflowError(150, 100)
+            return ["event"] * 10
+
+        start_ms, end_ms = self._blocks(1)[0]
+        parts = planner.collect(collect, start_ms, end_ms)
+
+        self.assertEqual(len(parts), 4)
+        self.assertEqual(parts[0][0], start_ms)
+        self.assertEqual(parts[-1][1], end_ms)
+        for (_, previous_end, _), (next_start, _, _) in zip(parts, parts[1:]):
+            self.assertEqual(previous_end, next_start)
+
+    def test_collect_gives_up_below_min_window(self):
+        planner = AdaptiveWindowPlanner(max_events=100, min_window_seconds=300)
+
+        def collect(start_ms, end_ms):
+            raise WindowOverflowError(150, 100)
+
+        start_ms, end_ms = self._blocks(1)[0]
+        with self.assertRaises(WindowOverflowError):
+            planner.collect(collect, start_ms, end_ms)
+
+    def test_plan_is_unchanged_when_not_adaptive(self):
+        planner = AdaptiveWindowPlanner(max_events=100, history={"2": 0.001})
+        blocks = self._blocks(6)
+        self.assertEqual(planner.plan(blocks), blocks)
+
+    def test_plan_merges_quiet_blocks(self):
+        # 0.01 events/s -> 6 events per 10 minute block, target is 50
+        planner = AdaptiveWindowPlanner(max_events=100, adaptive=True, max_merge_windows=4, history={"2": 0.01})
+        blocks = self._blocks(6)
+        self.assertEqual(planner.plan(blocks), [(blocks[0][0], blocks[3][1]), (blocks[4][0], blocks[5][1])])
+        # A crashed run may have published the merged blocks as windows of their own
+        self.assertEqual(planner.replaced_starts(blocks[0][0]), [blocks[1][0], blocks[2][0], blocks[3][0]])
+        self.assertEqual(planner.replaced_starts(blocks[4][0]), [blocks[5][0]])
+        self.assertEqual(planner.replaced_starts(blocks[1][0]), [])
+
+    def test_plan_splits_busy_blocks(self):
+        # 0.5 events/s -> 300 events per 10 minute block, target is 50
+        planner = AdaptiveWindowPlanner(max_events=100, adaptive=True, history={"2": 0.5})
+        start_ms, end_ms = self._blocks(1)[0]
+        planned = planner.plan([(start_ms, end_ms)])
+        self.assertEqual(len(planned), 6)
+        self.assertEqual(planned[0][0], start_ms)
+        self.assertEqual(planned[-1][1], end_ms)
+
+    def test_plan_keeps_blocks_without_history(self):
+        planner = AdaptiveWindowPlanner(max_events=100, adaptive=True)
+        blocks = self._blocks(3)
+        self.assertEqual(planner.plan(blocks), blocks)
+
+    def test_record_learns_density(self):
+        planner = AdaptiveWindowPlanner(max_events=100, smoothing=0.5)
+        start_ms, end_ms = self._blocks(1)[0]
+        planner.record(start_ms, end_ms, 600)
+        self.assertAlmostEqual(planner.snapshot()["2"], 1.0)
+        planner.record(start_ms, end_ms, 0)
+        self.assertAlmostEqual(planner.snapshot()["2"], 0.5)
+        self.assertAlmostEqual(planner.predict(start_ms, end_ms), 300)
+
+if __name__ == '__main__':
+    unittest.main()
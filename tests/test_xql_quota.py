@@ -0,0 +1,78 @@
+import threading
+import unittest
+
+from sdc_tool.xql_quota import QuotaExhaustedError, QuotaScheduler, query_cost_units
+
+
+class TestQuotaScheduler(unittest.TestCase):
+    def test_query_cost_units(self):
+        self.assertEqual(query_cost_units({"query_cost": {"tenant_a": 0.25, "tenant_b": 0.5}}), 0.75)
+        self.assertEqual(query_cost_units({"query_cost": 0.1}), 0.1)
+        self.assertIsNone(query_cost_units({"status": "SUCCESS"}))
+        self.assertIsNone(query_cost_units(None))
+
+    def test_unknown_budget_does_not_limit(self):
+        scheduler = QuotaScheduler(live_reserve_units=1.0, max_concurrency=3)
+        reserved = [scheduler.try_acquire(600) for _ in range(3)]
+        self.assertEqual(reserved, [0.0, 0.0, 0.0])
+        self.assertIsNone(scheduler.try_acquire(600))
+
+    def test_learns_cost_and_remaining_quota_from_replies(self):
+        scheduler = QuotaScheduler()
+        reserved = scheduler.acquire(600)
+        scheduler.release(reserved, 600, {"query_cost": {"tenant": 0.6}, "remaining_quota": 9.4})
+
+        self.assertEqual(scheduler.remaining_units, 9.4)
+        self.assertAlmostEqual(scheduler.predict(1200), 1.2)
+        self.assertEqual(scheduler.stats()["in_flight"], 0)
+
+    def test_backfill_cannot_use_live_reserve(self):
+        scheduler = QuotaScheduler(live_reserve_units=2.0)
+        scheduler.release(scheduler.acquire(600), 600, {"query_cost": 1.0, "remaining_quota": 2.5})
+
+        with self.assertRaises(QuotaExhaustedError):
+            scheduler.acquire(600, live=False)
+        # Live windows may still use the reserve
+        self.assertEqual(scheduler.acquire(600, live=True), 1.0)
+
+    def test_concurrency_shrinks_with_budget(self):
+        scheduler = QuotaScheduler(live_reserve_units=1.0, max_concurrency=8)
+        scheduler.release(scheduler.acquire(60), 60, {"query_cost": 1.0, "remaining_quota": 100.0})
+        self.assertEqual(scheduler.concurrency(), 8)
+
+        scheduler.release(scheduler.acquire(60), 60, {"query_cost": 1.0, "remaining_quota": 4.0})
+        # 3 units above the reserve at about 1 unit per query
+        self.assertEqual(scheduler.concurrency(), 3)
+        self.assertEqual(scheduler.concurrency(live=True), 4)
+
+    def test_waiting_query_starts_when_slot_is_released(self):
+        scheduler = QuotaScheduler(max_concurrency=1)
+        reserved = scheduler.acquire(60)
+        started = threading.Event()
+
+        def second_query():
+            scheduler.acquire(60)
+            started.set()
+
+        thread = threading.Thread(target=second_query)
+        thread.start()
+        self.assertFalse(started.wait(0.1))
+        scheduler.release(reserved, 60, None)
+        self.assertTrue(started.wait(2))
+        thread.join()
+
+    def test_slot_shares_the_concurrency_limit(self):
+        scheduler = QuotaScheduler(max_concurrency=2)
+        scheduler.acquire(60)
+        with scheduler.slot():
+            self.assertEqual(scheduler.stats()["in_flight"], 2)
+            self.assertIsNone(scheduler.try_acquire(60))
+        self.assertEqual(scheduler.stats()["in_flight"], 1)
+
+    def test_for_tenant_shares_scheduler(self):
+        self.assertIs(QuotaScheduler.for_tenant("tenant-x.example.com"),
+                      QuotaScheduler.for_tenant("tenant-x.example.com"))
+
+
+if __name__ == "__main__":
+    unittest.main()